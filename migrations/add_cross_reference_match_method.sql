@@ -0,0 +1,73 @@
+-- Add match_method to cross_reference_matches (file_num / name / fuzzy)
+-- Run this on the Form D database (ltdalxkhbbhmkimmogyq.supabase.co)
+-- Created: 2026-10-17
+-- Requires: create_cross_reference_generations.sql
+--
+-- compute_cross_reference.py now records which tier produced each match and,
+-- with --fuzzy, writes fuzzy name matches with match_score < 1.0. Readers that
+-- want exact matches only keep filtering on match_score = 1 (server.js already
+-- does) or use match_method <> 'fuzzy'.
+--
+-- Run this BEFORE the next refresh: the matcher writes the new column. Existing
+-- rows get NULL and are filled in by that refresh.
+
+BEGIN;
+
+ALTER TABLE cross_reference_match_rows ADD COLUMN IF NOT EXISTS match_method TEXT
+    CHECK (match_method IN ('file_num', 'name', 'fuzzy'));
+
+CREATE INDEX IF NOT EXISTS idx_xref_rows_gen_method ON cross_reference_match_rows(generation, match_method);
+
+-- SELECT m.* in a view is expanded when the view is created - recreate it to pick up the column
+CREATE OR REPLACE VIEW cross_reference_matches AS
+    SELECT m.*
+    FROM cross_reference_match_rows m
+    JOIN cross_reference_publish p ON p.id = 1 AND m.generation = p.active_generation;
+
+-- The generation copy lists its columns explicitly - add match_method
+CREATE OR REPLACE FUNCTION begin_cross_reference_generation()
+RETURNS BIGINT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_active BIGINT;
+    v_previous BIGINT;
+    v_new BIGINT;
+BEGIN
+    SELECT active_generation, previous_generation INTO v_active, v_previous
+    FROM cross_reference_publish WHERE id = 1 FOR UPDATE;
+
+    DELETE FROM cross_reference_match_rows
+    WHERE generation <> v_active AND generation IS DISTINCT FROM v_previous;
+    UPDATE cross_reference_generations SET status = 'retired'
+    WHERE generation <> v_active AND generation IS DISTINCT FROM v_previous AND status <> 'retired';
+
+    SELECT COALESCE(MAX(generation), 0) + 1 INTO v_new FROM cross_reference_generations;
+    INSERT INTO cross_reference_generations (generation, status) VALUES (v_new, 'building');
+
+    INSERT INTO cross_reference_match_rows (
+        generation, formd_accession, formd_entity_name, formd_filing_date, formd_offering_amount,
+        adv_fund_id, adv_fund_name, adv_filing_date, adv_gav,
+        adviser_entity_crd, adviser_entity_legal_name, match_score, match_method, issues,
+        overdue_adv_flag, latest_adv_year, computed_at
+    )
+    SELECT
+        v_new, formd_accession, formd_entity_name, formd_filing_date, formd_offering_amount,
+        adv_fund_id, adv_fund_name, adv_filing_date, adv_gav,
+        adviser_entity_crd, adviser_entity_legal_name, match_score, match_method, issues,
+        overdue_adv_flag, latest_adv_year, computed_at
+    FROM cross_reference_match_rows
+    WHERE generation = v_active;
+
+    RETURN v_new;
+END;
+$$;
+
+COMMENT ON COLUMN cross_reference_match_rows.match_method IS 'Matching tier: file_num, name (exact normalized) or fuzzy (match_score = trigram similarity)';
+
+COMMIT;
+
+-- Let PostgREST pick up the new column
+NOTIFY pgrst, 'reload schema';
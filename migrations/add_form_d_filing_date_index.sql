@@ -0,0 +1,20 @@
+-- Index for the newest-filing probe of check_cross_reference_freshness.py
+-- Run this on the Form D database (ltdalxkhbbhmkimmogyq.supabase.co)
+-- Created: 2026-10-17
+--
+-- The freshness check asks PostgREST for
+--     form_d_filings?select=filing_date&order=filing_date.desc.nullslast&limit=1
+-- i.e. ORDER BY filing_date DESC NULLS LAST LIMIT 1. Without an index on
+-- filing_date that sorts the whole table on every probe. A plain (ASC) index
+-- scanned backwards yields DESC NULLS FIRST, so the index is declared with the
+-- probe's exact ordering.
+--
+-- CONCURRENTLY: the scrapers keep inserting while it builds. It cannot run
+-- inside a transaction block - run the statement on its own.
+--
+-- Check that the probe uses it (expect an Index Scan, no Sort):
+--     EXPLAIN SELECT filing_date FROM form_d_filings
+--     ORDER BY filing_date DESC NULLS LAST LIMIT 1;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_form_d_filings_filing_date_desc
+    ON form_d_filings (filing_date DESC NULLS LAST);
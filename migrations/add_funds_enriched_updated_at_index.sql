@@ -0,0 +1,17 @@
+-- Index for the newest-update probe of check_cross_reference_freshness.py
+-- Run this on the ADV database (ezuqwwffjgfzymqxsctq.supabase.co)
+-- Created: 2026-10-17
+--
+-- The freshness check orders funds_enriched by updated_at DESC NULLS LAST
+-- LIMIT 1, and compute_cross_reference.py --incremental filters on
+-- updated_at > last watermark. Both are index lookups with this index and
+-- full scans without it.
+--
+-- CONCURRENTLY: cannot run inside a transaction block - run it on its own.
+--
+-- Check:
+--     EXPLAIN SELECT updated_at FROM funds_enriched
+--     ORDER BY updated_at DESC NULLS LAST LIMIT 1;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_funds_enriched_updated_at_desc
+    ON funds_enriched (updated_at DESC NULLS LAST);
@@ -0,0 +1,142 @@
+-- Copy the active generation in chunks instead of inside begin_cross_reference_generation()
+-- Run this on the Form D database (ltdalxkhbbhmkimmogyq.supabase.co)
+-- Created: 2026-10-17
+-- Requires: create_cross_reference_generations.sql, add_cross_reference_match_method.sql
+--
+-- begin_cross_reference_generation() copied the whole active generation (and
+-- deleted the retired ones) in one RPC call. PostgREST runs it as the calling
+-- role, under that role's statement_timeout - SECURITY DEFINER does not
+-- change that - so as cross_reference_match_rows grows the copy times out and
+-- every refresh fails at its first step. A SET statement_timeout clause on the
+-- function does not help either: the timer of the statement that calls the
+-- function is already running when the clause is applied.
+--
+-- Chunked instead:
+--   begin_cross_reference_generation()        only reserves the new 'building'
+--                                             generation and retires the old ones
+--   purge_cross_reference_generations(n)      deletes up to n rows of retired
+--                                             generations; returns how many
+--   copy_cross_reference_generation(g, id, n) copies the next n rows (id > id) of
+--                                             the generation g was begun from;
+--                                             returns the last id copied, NULL
+--                                             when the copy is complete
+-- compute_cross_reference.py calls purge until it returns 0, then copy until
+-- it returns NULL - one short statement per request. p_limit NULL = no limit
+-- (the direct Postgres path does both in its own transaction).
+--
+-- Run this BEFORE the next refresh: the matcher calls the new functions. The
+-- writer functions are executable by service_role only, so the refresh needs
+-- the Form D service key (FORMD_KEY = FORMD_SERVICE_KEY).
+
+BEGIN;
+
+-- The generation a building generation is a copy of (begin's active generation)
+ALTER TABLE cross_reference_generations ADD COLUMN IF NOT EXISTS copied_from BIGINT;
+
+CREATE OR REPLACE FUNCTION begin_cross_reference_generation()
+RETURNS BIGINT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_active BIGINT;
+    v_previous BIGINT;
+    v_new BIGINT;
+BEGIN
+    SELECT active_generation, previous_generation INTO v_active, v_previous
+    FROM cross_reference_publish WHERE id = 1 FOR UPDATE;
+
+    -- Abandoned 'building' runs and old generations: their rows go in purge_cross_reference_generations()
+    UPDATE cross_reference_generations SET status = 'retired'
+    WHERE generation <> v_active AND generation IS DISTINCT FROM v_previous AND status <> 'retired';
+
+    SELECT COALESCE(MAX(generation), 0) + 1 INTO v_new FROM cross_reference_generations;
+    INSERT INTO cross_reference_generations (generation, status, copied_from) VALUES (v_new, 'building', v_active);
+
+    RETURN v_new;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION purge_cross_reference_generations(p_limit INTEGER DEFAULT 5000)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_deleted INTEGER;
+BEGIN
+    DELETE FROM cross_reference_match_rows
+    WHERE id IN (
+        SELECT r.id
+        FROM cross_reference_match_rows r
+        JOIN cross_reference_generations g ON g.generation = r.generation AND g.status = 'retired'
+        LIMIT p_limit
+    );
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    RETURN v_deleted;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION copy_cross_reference_generation(
+    p_generation BIGINT, p_after_id BIGINT DEFAULT 0, p_limit INTEGER DEFAULT 5000)
+RETURNS BIGINT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_source BIGINT;
+    v_last BIGINT;
+BEGIN
+    SELECT copied_from INTO v_source FROM cross_reference_generations
+    WHERE generation = p_generation AND status = 'building';
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'generation % is not building', p_generation;
+    END IF;
+
+    -- Keyset chunk over idx_xref_rows_gen_id; the INSERT runs even though only the max id is selected
+    WITH chunk AS (
+        SELECT * FROM cross_reference_match_rows
+        WHERE generation = v_source AND id > p_after_id
+        ORDER BY id
+        LIMIT p_limit
+    ), copied AS (
+        INSERT INTO cross_reference_match_rows (
+            generation, formd_accession, formd_entity_name, formd_filing_date, formd_offering_amount,
+            adv_fund_id, adv_fund_name, adv_filing_date, adv_gav,
+            adviser_entity_crd, adviser_entity_legal_name, match_score, match_method, issues,
+            overdue_adv_flag, latest_adv_year, computed_at
+        )
+        SELECT
+            p_generation, formd_accession, formd_entity_name, formd_filing_date, formd_offering_amount,
+            adv_fund_id, adv_fund_name, adv_filing_date, adv_gav,
+            adviser_entity_crd, adviser_entity_legal_name, match_score, match_method, issues,
+            overdue_adv_flag, latest_adv_year, computed_at
+        FROM chunk
+    )
+    SELECT MAX(id) INTO v_last FROM chunk;
+
+    RETURN v_last;
+END;
+$$;
+
+-- Service role only, like the other writer RPCs (see create_cross_reference_generations.sql).
+-- begin/publish/rollback are repeated for databases that ran an earlier version of
+-- that migration, which granted them to anon.
+REVOKE EXECUTE ON FUNCTION begin_cross_reference_generation() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION publish_cross_reference_generation(BIGINT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION rollback_cross_reference_generation() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION purge_cross_reference_generations(INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION copy_cross_reference_generation(BIGINT, BIGINT, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION begin_cross_reference_generation() TO service_role;
+GRANT EXECUTE ON FUNCTION publish_cross_reference_generation(BIGINT) TO service_role;
+GRANT EXECUTE ON FUNCTION rollback_cross_reference_generation() TO service_role;
+GRANT EXECUTE ON FUNCTION purge_cross_reference_generations(INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION copy_cross_reference_generation(BIGINT, BIGINT, INTEGER) TO service_role;
+
+COMMIT;
+
+-- Let PostgREST pick up the new functions
+NOTIFY pgrst, 'reload schema';
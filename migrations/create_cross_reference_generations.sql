@@ -0,0 +1,195 @@
+-- Generation-based publish for cross_reference_matches
+-- Run this on the Form D database (ltdalxkhbbhmkimmogyq.supabase.co)
+-- Created: 2026-10-17
+--
+-- Before: compute_cross_reference.py deleted and re-inserted rows in place, so
+-- readers saw an empty or partial table while the weekly refresh was running.
+--
+-- After:
+--   cross_reference_match_rows   physical table, every row tagged with a generation
+--   cross_reference_publish      single-row pointer to the active + previous generation
+--   cross_reference_matches      VIEW of the active generation (same name and columns
+--                                readers already use - server.js, detect_compliance_issues.js,
+--                                discrepancy_detector.js need no changes)
+--
+-- The matcher calls begin_cross_reference_generation() (server-side copy of the
+-- active generation), applies its diff to the new generation, then calls
+-- publish_cross_reference_generation() which flips the pointer in one UPDATE.
+-- The previous generation is kept so rollback_cross_reference_generation() is instant.
+--
+-- chunk_cross_reference_generation_copy.sql later moves the copy out of
+-- begin_cross_reference_generation() into chunked RPCs (statement_timeout).
+
+BEGIN;
+
+-- 1. Existing rows become generation 1
+ALTER TABLE cross_reference_matches RENAME TO cross_reference_match_rows;
+ALTER TABLE cross_reference_match_rows ADD COLUMN generation BIGINT NOT NULL DEFAULT 1;
+-- No default from here on: a write that forgets the generation should fail loudly
+ALTER TABLE cross_reference_match_rows ALTER COLUMN generation DROP DEFAULT;
+
+CREATE TABLE IF NOT EXISTS cross_reference_generations (
+    generation BIGINT PRIMARY KEY,
+    status TEXT NOT NULL CHECK (status IN ('building', 'active', 'previous', 'retired')),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    published_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE TABLE IF NOT EXISTS cross_reference_publish (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    active_generation BIGINT NOT NULL,
+    previous_generation BIGINT,
+    published_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO cross_reference_generations (generation, status, published_at) VALUES (1, 'active', NOW());
+INSERT INTO cross_reference_publish (id, active_generation) VALUES (1, 1);
+
+-- 2. Indexes - every reader query goes through the generation filter
+CREATE INDEX IF NOT EXISTS idx_xref_rows_gen_id ON cross_reference_match_rows(generation, id);
+CREATE INDEX IF NOT EXISTS idx_xref_rows_gen_fund_name ON cross_reference_match_rows(generation, adv_fund_name);
+CREATE INDEX IF NOT EXISTS idx_xref_rows_gen_fund_id ON cross_reference_match_rows(generation, adv_fund_id);
+CREATE INDEX IF NOT EXISTS idx_xref_rows_gen_accession ON cross_reference_match_rows(generation, formd_accession);
+CREATE INDEX IF NOT EXISTS idx_xref_rows_gen_crd ON cross_reference_match_rows(generation, adviser_entity_crd);
+CREATE INDEX IF NOT EXISTS idx_xref_rows_gen_computed_at ON cross_reference_match_rows(generation, computed_at DESC);
+
+-- 3. Reader view under the old table name
+CREATE VIEW cross_reference_matches AS
+    SELECT m.*
+    FROM cross_reference_match_rows m
+    JOIN cross_reference_publish p ON p.id = 1 AND m.generation = p.active_generation;
+
+GRANT SELECT ON cross_reference_matches TO anon, authenticated, service_role;
+
+-- 4. RLS for the new tables (same access pattern as compliance_issues)
+ALTER TABLE cross_reference_generations ENABLE ROW LEVEL SECURITY;
+ALTER TABLE cross_reference_publish ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow anon read access" ON cross_reference_generations
+    FOR SELECT TO anon USING (true);
+CREATE POLICY "Allow anon read access" ON cross_reference_publish
+    FOR SELECT TO anon USING (true);
+CREATE POLICY "Allow service role full access" ON cross_reference_generations
+    FOR ALL TO service_role USING (true) WITH CHECK (true);
+CREATE POLICY "Allow service role full access" ON cross_reference_publish
+    FOR ALL TO service_role USING (true) WITH CHECK (true);
+
+-- 5. Writer functions
+
+-- Start a new generation as a copy of the active one. Also drops generations
+-- that are neither active nor previous (abandoned 'building' runs, old retired ones).
+CREATE OR REPLACE FUNCTION begin_cross_reference_generation()
+RETURNS BIGINT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_active BIGINT;
+    v_previous BIGINT;
+    v_new BIGINT;
+BEGIN
+    SELECT active_generation, previous_generation INTO v_active, v_previous
+    FROM cross_reference_publish WHERE id = 1 FOR UPDATE;
+
+    DELETE FROM cross_reference_match_rows
+    WHERE generation <> v_active AND generation IS DISTINCT FROM v_previous;
+    UPDATE cross_reference_generations SET status = 'retired'
+    WHERE generation <> v_active AND generation IS DISTINCT FROM v_previous AND status <> 'retired';
+
+    SELECT COALESCE(MAX(generation), 0) + 1 INTO v_new FROM cross_reference_generations;
+    INSERT INTO cross_reference_generations (generation, status) VALUES (v_new, 'building');
+
+    INSERT INTO cross_reference_match_rows (
+        generation, formd_accession, formd_entity_name, formd_filing_date, formd_offering_amount,
+        adv_fund_id, adv_fund_name, adv_filing_date, adv_gav,
+        adviser_entity_crd, adviser_entity_legal_name, match_score, issues,
+        overdue_adv_flag, latest_adv_year, computed_at
+    )
+    SELECT
+        v_new, formd_accession, formd_entity_name, formd_filing_date, formd_offering_amount,
+        adv_fund_id, adv_fund_name, adv_filing_date, adv_gav,
+        adviser_entity_crd, adviser_entity_legal_name, match_score, issues,
+        overdue_adv_flag, latest_adv_year, computed_at
+    FROM cross_reference_match_rows
+    WHERE generation = v_active;
+
+    RETURN v_new;
+END;
+$$;
+
+-- Make a finished generation the one readers see. Single-row UPDATE = atomic flip.
+CREATE OR REPLACE FUNCTION publish_cross_reference_generation(p_generation BIGINT)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_active BIGINT;
+BEGIN
+    PERFORM 1 FROM cross_reference_generations
+    WHERE generation = p_generation AND status = 'building';
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'generation % is not building', p_generation;
+    END IF;
+
+    SELECT active_generation INTO v_active FROM cross_reference_publish WHERE id = 1 FOR UPDATE;
+
+    UPDATE cross_reference_publish
+    SET active_generation = p_generation, previous_generation = v_active, published_at = NOW()
+    WHERE id = 1;
+
+    UPDATE cross_reference_generations SET status = 'previous' WHERE generation = v_active;
+    UPDATE cross_reference_generations SET status = 'active', published_at = NOW()
+    WHERE generation = p_generation;
+END;
+$$;
+
+-- Swap back to the previous generation (e.g. after a bad refresh).
+CREATE OR REPLACE FUNCTION rollback_cross_reference_generation()
+RETURNS BIGINT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_active BIGINT;
+    v_previous BIGINT;
+BEGIN
+    SELECT active_generation, previous_generation INTO v_active, v_previous
+    FROM cross_reference_publish WHERE id = 1 FOR UPDATE;
+    IF v_previous IS NULL THEN
+        RAISE EXCEPTION 'no previous generation to roll back to';
+    END IF;
+
+    UPDATE cross_reference_publish
+    SET active_generation = v_previous, previous_generation = v_active, published_at = NOW()
+    WHERE id = 1;
+
+    UPDATE cross_reference_generations SET status = 'previous' WHERE generation = v_active;
+    UPDATE cross_reference_generations SET status = 'active' WHERE generation = v_previous;
+
+    RETURN v_previous;
+END;
+$$;
+
+-- Writer RPCs run as the owner (SECURITY DEFINER): only the matcher's service
+-- role may call them. Functions are executable by PUBLIC by default, and
+-- Supabase also grants new public-schema functions to anon and authenticated
+-- directly - revoke both. Readers keep SELECT on the view.
+REVOKE EXECUTE ON FUNCTION begin_cross_reference_generation() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION publish_cross_reference_generation(BIGINT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION rollback_cross_reference_generation() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION begin_cross_reference_generation() TO service_role;
+GRANT EXECUTE ON FUNCTION publish_cross_reference_generation(BIGINT) TO service_role;
+GRANT EXECUTE ON FUNCTION rollback_cross_reference_generation() TO service_role;
+
+COMMENT ON TABLE cross_reference_match_rows IS 'All generations of pre-computed ADV/Form D matches. Read through the cross_reference_matches view.';
+COMMENT ON VIEW cross_reference_matches IS 'Active generation of cross_reference_match_rows (see cross_reference_publish)';
+COMMENT ON TABLE cross_reference_publish IS 'Single-row pointer to the active and previous cross-reference generation';
+
+COMMIT;
+
+-- Let PostgREST pick up the view and functions
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Concurrent, failure-isolating batch writes for the match tables.
+
+MatchWriter hands rows to a BatchWriter one at a time; the BatchWriter cuts
+them into batches by payload size and keeps a bounded number of batches in
+flight on a thread pool:
+
+    writer = BatchWriter(send, workers=4, metrics=METRICS)
+    for row in rows:
+        writer.add('insert', row)
+    writer.add('delete', row_id)
+    writer.close()                  # waits for every batch
+    writer.written, writer.rejected, writer.failed
+
+send(op, rows) does one request and raises on failure. What happens then
+depends on the error:
+
+    transient      no error code (network, timeout), HTTP 408 / 429 / 5xx or a
+                   connection / deadlock / resource SQLSTATE: retried with
+                   exponential backoff; when the retries run out the batch has
+                   failed as a whole
+    row-level      a data or constraint error (SQLSTATE class 22 / 23) or a
+                   body too large (413): the batch is split in half and each
+                   half written on its own, down to the single rows that are
+                   rejected - one bad row no longer costs the rows batched
+                   with it
+    anything else  (e.g. an unknown column) no row would get through - the
+                   batch has failed as a whole
+
+Batches are cut when their JSON payload reaches max_bytes (or max_rows rows),
+so wide rows make smaller batches instead of oversized requests. Deletes send
+ids in the query string, so their batches are bounded by id count instead.
+add() blocks while 2 x workers batches are pending, so memory stays bounded
+when the producer is faster than the writes.
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_BYTES = 512 * 1024
+DEFAULT_MAX_ROWS = 5000
+DELETE_BATCH_SIZE = 500  # ids per DELETE ... ?id=in.(...) - keeps the URL short
+RETRIES = 4
+BACKOFF_SECONDS = 0.5
+
+# SQLSTATE classes worth retrying: connection exception, transaction rollback
+# (deadlock, serialization), insufficient resources, operator intervention
+# (statement timeout), system error
+TRANSIENT_SQLSTATE_CLASSES = ('08', '40', '53', '57', '58')
+# SQLSTATE classes caused by the rows themselves: data exception, integrity constraint violation
+ROW_SQLSTATE_CLASSES = ('22', '23')
+
+
+def error_code(error):
+    """The PostgREST error code of an exception: a SQLSTATE, a PGRST code or an HTTP status; '' if none."""
+    return str(getattr(error, 'code', None) or '')
+
+
+def is_transient(error):
+    code = error_code(error)
+    if not code:
+        return True
+    if code.isdigit() and len(code) == 3:
+        return code in ('408', '429') or code.startswith('5')
+    return len(code) == 5 and code[:2] in TRANSIENT_SQLSTATE_CLASSES
+
+
+def is_row_error(error):
+    code = error_code(error)
+    return code == '413' or (len(code) == 5 and code[:2] in ROW_SQLSTATE_CLASSES)
+
+
+def row_bytes(row):
+    """Size of a row in the JSON body (plus its separator)."""
+    return len(json.dumps(row, default=str, separators=(',', ':'))) + 1
+
+
+class BatchWriter:
+    """Size-cut batches, written concurrently with retry and bisection. See the module docstring."""
+
+    def __init__(self, send, workers=4, max_bytes=DEFAULT_MAX_BYTES, max_rows=DEFAULT_MAX_ROWS,
+                 retries=RETRIES, backoff=BACKOFF_SECONDS, metrics=None):
+        self.send = send
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics
+        self.written = {}        # op -> rows written
+        self.rejected = []       # (op, row, error) - single rows the server refused
+        self.failed = 0          # rows in batches that failed as a whole
+        self.errors = []         # the errors of those batches
+        self.batches = 0
+        self._buffers = {}       # op -> [rows, bytes]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(2 * workers)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-writer')
+        self._futures = set()
+
+    def add(self, op, row):
+        buffer = self._buffers.setdefault(op, [[], 0])
+        buffer[0].append(row)
+        if op == 'delete':
+            if len(buffer[0]) >= DELETE_BATCH_SIZE:
+                self._flush(op)
+            return
+        buffer[1] += row_bytes(row)
+        if buffer[1] >= self.max_bytes or len(buffer[0]) >= self.max_rows:
+            self._flush(op)
+
+    def flush(self):
+        for op in list(self._buffers):
+            self._flush(op)
+
+    def _flush(self, op):
+        rows, size = self._buffers.pop(op, ([], 0))
+        if not rows:
+            return
+        self._slots.acquire()
+        self.batches += 1
+        future = self._pool.submit(self._write, op, rows, size)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+        self._slots.release()
+        if future.cancelled():  # abort() dropped it before it started
+            return
+        error = future.exception()
+        if error is not None:  # a bug in _write itself - surface it in close()
+            with self._lock:
+                self.errors.append(error)
+
+    def _count(self, name, n=1):
+        if self.metrics is not None:
+            self.metrics.count(name, n)
+
+    def _attempt(self, op, rows, size):
+        """Send one batch, retrying transient errors. None on success, else the last error."""
+        for attempt in range(self.retries + 1):
+            self._count('http_requests')
+            self._count('http_bytes', size)
+            try:
+                self.send(op, rows)
+                return None
+            except Exception as e:
+                if not is_transient(e) or attempt == self.retries:
+                    return e
+                self._count('http_retries')
+                time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    def _write(self, op, rows, size):
+        error = self._attempt(op, rows, size)
+        if error is None:
+            self._count('rows_written', len(rows))
+            with self._lock:
+                self.written[op] = self.written.get(op, 0) + len(rows)
+        elif is_row_error(error) and len(rows) > 1:
+            # Bisect: the halves that are fine get written, the bad rows end up alone
+            middle = len(rows) // 2
+            for half in (rows[:middle], rows[middle:]):
+                self._write(op, half, size * len(half) // len(rows))
+        elif is_row_error(error):
+            with self._lock:
+                self.rejected.append((op, rows[0], error))
+        else:
+            with self._lock:
+                self.failed += len(rows)
+                self.errors.append(error)
+
+    def close(self):
+        """Flush and wait for every batch; the counts are final afterwards."""
+        self.flush()
+        self._pool.shutdown(wait=True)
+
+    def abort(self):
+        """Stop without writing what is still buffered; batches already sent are waited for."""
+        self._buffers.clear()
+        self._pool.shutdown(wait=True, cancel_futures=True)
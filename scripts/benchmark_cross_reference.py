@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Synthetic-data benchmark for the cross-reference pipeline.
+
+Generates form_d_filings / funds_enriched / advisers_enriched rows shaped like
+the real tables, serves them from an in-process fake Supabase client
+(cross_reference_fake.py) and times each stage of compute_cross_reference.py:
+
+    fetch       keyset-page both source tables through the client
+    normalize   normalize_name_for_match() over Form D entity and ADV fund names
+    split       split_file_numbers() over funds_enriched.form_d_file_number
+    index       fetch form_d_filings + index_formd_filings() into a FormDIndex
+    match       fetch funds_enriched + match every fund (iter_matched_pages)
+    store       store_matches() into an empty match table (all inserts)
+    restore     store_matches() again with the same rows (diff only, no writes)
+
+Rows are derived from a hash of their index, so every scale is reproducible
+and the source tables are never held in memory - the peak RSS of a stage is
+the pipeline's own (the match workers of --match-workers are not included).
+
+The data has what makes the real tables slow or tricky:
+- amendments: several filings per entity (file number and name collisions)
+- unrelated entities sharing one name under different file numbers
+- entity suffix variants (', L.P.', ' LP', ' L.L.C.', ...) and case
+  differences between the Form D and the ADV spelling of a name
+- multi-value form_d_file_number ('021-000123; 021-000456', comma and pipe
+  separated too)
+- ADV funds with no Form D counterpart
+
+Usage:
+    python scripts/benchmark_cross_reference.py                     # 50k Form D rows
+    python scripts/benchmark_cross_reference.py --scale 500k --match-workers 2
+    python scripts/benchmark_cross_reference.py --scale 5m --stages normalize,split,index,match
+    python scripts/benchmark_cross_reference.py --json report.json --baseline main.json
+
+With --baseline the exit status only depends on what a given scale and seed
+reproduce - the items, requests and rows of each stage, the estimated bytes
+(within a few percent: the estimate depends on which row ends a page) - and
+on peak RSS. Timings are compared too, but only reported: on shared CI
+runners they vary more than any margin worth gating on.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+import compute_cross_reference as xref
+import cross_reference_fake as fake
+import cross_reference_sources as sources
+import formd_index
+import run_metrics
+
+# Form D filings per scale; funds_enriched gets half as many rows, advisers one per 50
+SCALES = {'50k': 50_000, '500k': 500_000, '5m': 5_000_000}
+
+STAGES = ('fetch', 'normalize', 'split', 'index', 'match', 'store', 'restore')
+
+WORDS = ('Tiger', 'Global', 'Capital', 'Partners', 'Ventures', 'Growth', 'Opportunity', 'Credit',
+         'Real Estate', 'Master', 'Offshore', 'Oak', 'River', 'Summit', 'Harbor', 'Blue', 'North',
+         'Atlas', 'Meridian', 'Cedar', 'Falcon', 'Granite', 'Horizon', 'Liberty', 'Pioneer', 'Sequoia',
+         'Beacon', 'Crescent', 'Evergreen', 'Keystone', 'Redwood', 'Silver', 'Apex', 'Bridge', 'Lake',
+         'Stone', 'Hill', 'Park', 'Point', 'Bay', "O'Neil", 'Co-Invest', 'Strategic', 'Income',
+         'Special Situations', 'Secondary', 'Infrastructure', 'Energy', 'Health', 'Technology')
+SERIES = ('II', 'III', 'IV', 'V', '2019', '2021', '2023', 'A', 'B', 'Series 1')
+SUFFIXES = ('', ', L.P.', ' LP', ' L.P.', ' LLC', ', LLC', ' L.L.C.', ' Inc.', ' Ltd', ' Limited',
+            ' Fund, L.P.', ' Fund LP', ' LP LLC', ' Co')
+FUND_TYPES = ('Venture Capital Fund', 'Private Equity Fund', 'Hedge Fund', 'Other Investment Fund',
+              'Real Estate Fund', 'Securitized Asset Fund')
+FILE_NUMBER_SEPARATORS = ('; ', ';', ', ', '|')
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(value, salt):
+    """splitmix64: 64 pseudo-random bits per (row index, salt), cheap and stateless."""
+    z = (value * 0x9E3779B97F4A7C15 + salt * 0xD1B54A32D192ED03 + 0x632BE59BD9B4E019) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+
+class SyntheticData:
+    """
+    Deterministic source tables for one scale.
+
+        data = SyntheticData(50_000)
+        data.filing(0), data.fund(0), data.adviser(0)    # row dicts, like PostgREST returns
+        xref.SOURCE = data.source()
+    """
+
+    def __init__(self, filings, seed=0):
+        self.seed = seed
+        self.filing_count = filings
+        self.entity_count = max(1, filings // 3)  # ~3 filings per entity: original + amendments
+        self.fund_count = filings // 2
+        self.adviser_count = max(100, filings // 50)
+
+    def counts(self):
+        return {'form_d_filings': self.filing_count, 'funds_enriched': self.fund_count,
+                'advisers_enriched': self.adviser_count}
+
+    def entity_name(self, k):
+        """Suffix-less name of Form D entity k; 1 in 20 reuse another entity's name."""
+        bits = _mix(k, self.seed)
+        if k and bits % 20 == 0:
+            return self.entity_name(k // 2)
+        words = [WORDS[(bits >> shift) % len(WORDS)] for shift in range(8, 8 + 6 * (2 + (bits >> 4) % 3), 6)]
+        if (bits >> 40) % 4 == 0:
+            words.append(SERIES[(bits >> 44) % len(SERIES)])
+        return ' '.join(words) + ' Fund'
+
+    def entity_file_number(self, k):
+        """One SEC file number per entity; 1 in 10 entities only filed before file numbers were captured."""
+        if _mix(k, self.seed + 1) % 10 == 0:
+            return None
+        return f'021-{k + 1:06d}'
+
+    def filing(self, i):
+        bits = _mix(i, self.seed + 2)
+        k = bits % self.entity_count
+        name = self.entity_name(k) + SUFFIXES[(bits >> 24) % len(SUFFIXES)]
+        year = 2011 + (bits >> 32) % 15
+        amount = ((bits >> 40) % 5000 + 1) * 100_000
+        return {
+            'id': i + 1,
+            'accessionnumber': f'{(bits >> 8) % 10**10:010d}-{year % 100:02d}-{i % 10**6:06d}',
+            'entityname': name.upper() if (bits >> 30) % 4 == 0 else name,
+            'filing_date': f'{year}-{1 + (bits >> 36) % 12:02d}-{1 + (bits >> 48) % 28:02d}',
+            'totalofferingamount': amount,
+            'totalamountsold': amount * ((bits >> 52) % 11) // 10,
+            'sale_date': None if (bits >> 56) % 3 == 0 else f'{year}-01-15',
+            'investmentfundtype': FUND_TYPES[(bits >> 58) % len(FUND_TYPES)],
+            'file_num': self.entity_file_number(k),
+        }
+
+    def fund(self, j):
+        bits = _mix(j, self.seed + 3)
+        linked = bits % 100 < 85
+        k = (bits >> 8) % self.entity_count
+        if linked:
+            name = self.entity_name(k) + SUFFIXES[(bits >> 32) % len(SUFFIXES)]
+            own = self.entity_file_number(k)
+        else:
+            name = f'Unlisted Holdings {j} Fund' + SUFFIXES[(bits >> 32) % len(SUFFIXES)]
+            own = f'021-9{j % 10**6:06d}'
+        mode = (bits >> 40) % 20
+        if mode < 10 or not own:
+            file_number = own if mode < 10 else None
+        elif mode < 13:
+            other = f'021-{(bits >> 16) % self.entity_count + 1:06d}'
+            pair = (own, other) if (bits >> 45) % 2 else (other, own)
+            file_number = FILE_NUMBER_SEPARATORS[(bits >> 46) % len(FILE_NUMBER_SEPARATORS)].join(pair)
+        else:
+            file_number = None
+        row = {
+            'reference_id': j + 1,
+            'fund_id': f'805-{j + 1:010d}',
+            'fund_name': name.lower() if (bits >> 48) % 3 == 0 else name,
+            'form_d_file_number': file_number,
+            'fund_type': FUND_TYPES[(bits >> 50) % len(FUND_TYPES)] if (bits >> 53) % 8 else None,
+            'adviser_entity_crd': 1 + (bits >> 20) % (self.adviser_count + self.adviser_count // 10),
+            'latest_gross_asset_value': float((bits >> 24) % 10**9),
+            'updated_at': f'2026-{1 + (bits >> 54) % 9:02d}-{1 + (bits >> 58) % 28:02d}T00:00:00',
+        }
+        gav_bits = _mix(j, self.seed + 4)
+        for bit, year in enumerate(xref.GAV_YEARS):
+            row[f'gav_{year}'] = float(gav_bits >> (bit * 4) & 0xFFF) if gav_bits >> (bit * 4) & 1 else None
+        return row
+
+    def adviser(self, i):
+        bits = _mix(i, self.seed + 5)
+        return {
+            'crd': i + 1,
+            'adviser_name': f'{WORDS[bits % len(WORDS)]} {WORDS[(bits >> 8) % len(WORDS)]} Management LLC',
+            'primary_website': f'https://adviser{i + 1}.example.com' if bits % 3 else None,
+            'type': 'RIA' if (bits >> 16) % 4 else 'ERA',
+            'total_aum': (bits >> 20) % 10**11,
+            'aum_2025': (bits >> 24) % 10**11,
+        }
+
+    def source(self):
+        """FakeSource serving these tables; the Form D client has the match generations."""
+        adv_client = fake.FakeClient({
+            'funds_enriched': fake.SyntheticTable(self.fund_count, self.fund, 'reference_id'),
+            'advisers_enriched': fake.SyntheticTable(self.adviser_count, self.adviser, 'crd'),
+        })
+        formd_client = fake.FakeFormDClient({
+            'form_d_filings': fake.SyntheticTable(self.filing_count, self.filing, 'id'),
+        })
+        return sources.FakeSource(adv_client, formd_client)
+
+
+# ============================================================================
+# MEASURING
+# ============================================================================
+
+def measure(stage, fn, trace=False):
+    """
+    Run fn() (returns the number of items it processed, plus optional details)
+    and return the stage's report entry. 'counters' are the run_metrics
+    counters (requests, bytes, rows) the stage added to xref.METRICS.
+    """
+    counters_start = dict(xref.METRICS.counters)
+    run_metrics.reset_peak_rss()
+    rss_start = run_metrics.rss_mb('VmRSS')
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = fn()
+    seconds = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    items, details = result if isinstance(result, tuple) else (result, None)
+    entry = {
+        'stage': stage,
+        'items': items,
+        'seconds': round(seconds, 3),
+        'cpu_seconds': round(cpu, 3),
+        'per_second': round(items / seconds, 1) if seconds else None,
+        'rss_start_mb': round(rss_start, 1),
+        'peak_rss_mb': round(run_metrics.rss_mb('VmHWM'), 1),
+        'counters': {name: xref.METRICS.counters.get(name, 0) - counters_start.get(name, 0)
+                     for name in run_metrics.COUNTERS},
+    }
+    if trace:
+        entry['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    if details:
+        entry['details'] = details
+    return entry
+
+
+# ============================================================================
+# STAGES
+# ============================================================================
+
+class Benchmark:
+    """The stages over one SyntheticData; results of index / match are reused by later stages."""
+
+    def __init__(self, data, fuzzy_threshold=None):
+        self.data = data
+        self.fuzzy_threshold = fuzzy_threshold
+        self.computed_at = datetime.utcnow().isoformat()
+        self.formd = None
+        self.adviser_map = None
+        self.matches = None
+        self.keep_matches = False
+        self.reset_source()
+
+    def reset_source(self):
+        xref.SOURCE = self.data.source()
+        xref.FUZZY_THRESHOLD = self.fuzzy_threshold
+        xref.NAME_MEMO = None
+
+    def fetch(self):
+        rows = 0
+        for table, columns, key in (('form_d_filings', xref.FORMD_COLUMNS, 'id'),
+                                    ('funds_enriched', xref.ADV_FUND_COLUMNS, 'reference_id')):
+            client = xref.formd_client() if table == 'form_d_filings' else xref.adv_client()
+            for _, _, page in xref.iter_keyset_pages_parallel(client, table, columns, id_column=key):
+                rows += len(page)
+        return rows
+
+    def normalize(self, names):
+        normalize = xref.normalize_name_for_match
+        for name in names:
+            normalize(name)
+        return len(names)
+
+    def split(self, file_numbers):
+        split = xref.split_file_numbers
+        values = 0
+        for file_number in file_numbers:
+            values += len(split(file_number))
+        return len(file_numbers), {'file_numbers': values}
+
+    def index(self):
+        formd = formd_index.FormDIndex()
+        for _, _, page in xref.iter_keyset_pages_parallel(xref.formd_client(), 'form_d_filings', xref.FORMD_COLUMNS):
+            xref.index_formd_filings(page, formd)
+        advisers = xref.fetch_all_keyset_parallel(xref.adv_client(), 'advisers_enriched', xref.ADVISER_COLUMNS,
+                                                  id_column='crd')
+        self.formd = formd
+        self.adviser_map = {adv['crd']: adv for adv in advisers if adv.get('crd')}
+        return len(formd), {'file_numbers': len(formd.by_file_num), 'names': len(formd.by_name),
+                            'file_number_collisions': formd.by_file_num.collisions(),
+                            'name_collisions': formd.by_name.collisions()}
+
+    def match(self):
+        fuzzy_index = xref.build_fuzzy_index(self.formd)
+        pages = ([xref.AdvFund(row) for row in page] for _, _, page in
+                 xref.iter_keyset_pages_parallel(xref.adv_client(), 'funds_enriched', xref.ADV_FUND_COLUMNS,
+                                                 id_column='reference_id'))
+        funds = 0
+        counts = {}
+        matches = [] if self.keep_matches else None
+        for page, pairs, page_counts in xref.iter_matched_pages(pages, self.formd, self.adviser_map,
+                                                                fuzzy_index, self.computed_at):
+            funds += len(page)
+            for key, value in page_counts.items():
+                counts[key] = counts.get(key, 0) + value
+            if matches is not None:
+                matches.extend(match for _, match in pairs)
+        self.matches = matches
+        return funds, counts
+
+    def store(self):
+        requests = xref.formd_client().requests
+        xref.store_matches(self.matches)
+        return len(self.matches), {'requests': xref.formd_client().requests - requests}
+
+    def restore(self):
+        requests = xref.formd_client().requests
+        xref.store_matches(self.matches)
+        return len(self.matches), {'requests': xref.formd_client().requests - requests}
+
+
+def run_benchmark(data, stages, fuzzy_threshold=None, trace=False):
+    """
+    Run the selected stages in pipeline order; returns the report entries.
+    Stages a selected one depends on (index before match, ...) run untimed.
+    """
+    bench = Benchmark(data, fuzzy_threshold)
+    bench.keep_matches = 'store' in stages or 'restore' in stages
+    prerequisites = {'match': 'index', 'store': 'match', 'restore': 'store'}
+    done = set()
+
+    def prepare(stage):
+        needed = prerequisites.get(stage)
+        if needed and needed not in done:
+            prepare(needed)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                getattr(bench, needed)()
+            done.add(needed)
+
+    entries = []
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        prepare(stage)
+        done.add(stage)
+        if stage == 'normalize':
+            # Inputs are built before the clock starts and dropped afterwards
+            names = [data.filing(i)['entityname'] for i in range(data.filing_count)]
+            names += [data.fund(j)['fund_name'] for j in range(data.fund_count)]
+            entries.append(measure(stage, lambda: bench.normalize(names), trace))
+            del names
+        elif stage == 'split':
+            file_numbers = [data.fund(j)['form_d_file_number'] for j in range(data.fund_count)]
+            entries.append(measure(stage, lambda: bench.split(file_numbers), trace))
+            del file_numbers
+        else:
+            entries.append(measure(stage, getattr(bench, stage), trace))
+        print_entry(entries[-1])
+    return entries
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def print_entry(entry):
+    line = (f"  {entry['stage']:10} {entry['items']:>10,} items  {entry['seconds']:>8.2f}s  "
+            f"{entry['per_second'] or 0:>12,.0f}/s  peak RSS {entry['peak_rss_mb']:>8.1f} MB")
+    if 'peak_traced_mb' in entry:
+        line += f"  (traced {entry['peak_traced_mb']:.1f} MB)"
+    print(line)
+    if entry.get('details'):
+        print(f"  {'':10} {entry['details']}")
+
+
+# Report settings that must match the baseline's for the counters to compare
+COMPARABLE = ('rows', 'seed', 'fuzzy_threshold', 'fetch_workers', 'write_workers', 'match_workers')
+
+
+def compare(report, baseline, max_regression):
+    """
+    (regressions, timings) vs the baseline. Regressions - the ones to fail on -
+    are changed items or row counters, request / byte counters or peak RSS grown
+    by more than max_regression (a fraction). Timings lists the stages that got
+    slower by more than max_regression, for the report only.
+    """
+    if any(report.get(key) != baseline.get(key) for key in COMPARABLE):
+        return [], []  # different data or settings - not comparable
+    previous = {entry['stage']: entry for entry in baseline.get('stages', [])}
+    regressions = []
+    timings = []
+    for entry in report['stages']:
+        stage = entry['stage']
+        old = previous.get(stage)
+        if not old:
+            continue
+        if old.get('items') != entry['items']:
+            regressions.append(f"{stage}: {entry['items']:,} items, baseline {old['items']:,}")
+        counters = entry.get('counters', {})
+        for name, value in old.get('counters', {}).items():
+            new = counters.get(name, 0)
+            if name.startswith('rows_') and new != value:
+                regressions.append(f"{stage}: {name} {new:,}, baseline {value:,}")
+            elif not name.startswith('rows_') and new > value * (1 + max_regression):
+                regressions.append(f"{stage}: {name} {new:,}, baseline {value:,}")
+        if old.get('peak_rss_mb') and entry['peak_rss_mb'] > old['peak_rss_mb'] * (1 + max_regression):
+            regressions.append(f"{stage}: peak RSS {entry['peak_rss_mb']:.1f} MB, "
+                               f"baseline {old['peak_rss_mb']:.1f} MB")
+        if old.get('per_second') and (entry['per_second'] or 0) < old['per_second'] * (1 - max_regression):
+            timings.append(f"{stage}: {entry['per_second'] or 0:,.0f}/s, baseline {old['per_second']:,.0f}/s")
+    return regressions, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cross-reference pipeline on synthetic data')
+    parser.add_argument('--scale', default='50k',
+                        help=f'Form D rows: {", ".join(SCALES)} or a number (default 50k)')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f'Comma-separated stages to run (default all: {",".join(STAGES)})')
+    parser.add_argument('--seed', type=int, default=0, help='Data seed (default 0)')
+    parser.add_argument('--fetch-workers', type=int, default=xref.FETCH_WORKERS,
+                        help=f'Concurrent page fetches per table (default {xref.FETCH_WORKERS})')
+    parser.add_argument('--write-workers', type=int, default=xref.WRITE_WORKERS,
+                        help=f'Write batches in flight in the store stage (default {xref.WRITE_WORKERS})')
+    parser.add_argument('--match-workers', type=int, default=1, help='Match processes (default 1)')
+    parser.add_argument('--fuzzy', action='store_true', help='Include the fuzzy name tier in the match stage')
+    parser.add_argument('--fuzzy-threshold', type=float, default=0.9, help='Fuzzy threshold (default 0.9)')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='Also report the traced Python heap peak per stage (much slower)')
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--baseline', help='Compare with this earlier --json report; exit 1 on a regression '
+                                           'of the counters or peak RSS (timings are only reported)')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='Allowed growth of requests / bytes / peak RSS vs the baseline, and the slowdown '
+                             'worth reporting, as a fraction (default 0.25)')
+    args = parser.parse_args()
+
+    scale = args.scale.lower()
+    try:
+        filings = SCALES[scale] if scale in SCALES else int(scale)
+    except ValueError:
+        parser.error(f"--scale must be one of {', '.join(SCALES)} or a number")
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = sorted(set(stages) - set(STAGES))
+    if unknown:
+        parser.error(f"unknown stages {unknown} - choose from {', '.join(STAGES)}")
+
+    xref.FETCH_WORKERS = args.fetch_workers
+    xref.WRITE_WORKERS = args.write_workers
+    xref.MATCH_WORKERS = args.match_workers
+    data = SyntheticData(filings, args.seed)
+    print(f"Cross-reference benchmark: {data.counts()} (seed {args.seed}, "
+          f"{args.fetch_workers} fetch / {args.match_workers} match workers"
+          f"{', fuzzy ' + str(args.fuzzy_threshold) if args.fuzzy else ''})")
+
+    entries = run_benchmark(data, stages, args.fuzzy_threshold if args.fuzzy else None, args.tracemalloc)
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'scale': filings,
+        'seed': args.seed,
+        'rows': data.counts(),
+        'fetch_workers': args.fetch_workers,
+        'write_workers': args.write_workers,
+        'match_workers': args.match_workers,
+        'fuzzy_threshold': args.fuzzy_threshold if args.fuzzy else None,
+        'stages': entries,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline} - nothing to compare")
+            return 0
+        with open(args.baseline) as f:
+            regressions, timings = compare(report, json.load(f), args.max_regression)
+        if timings:
+            print(f"Slower than {args.baseline} (more than {args.max_regression:.0%}, not gated):")
+            for line in timings:
+                print(f"  - {line}")
+        if regressions:
+            print(f"REGRESSION vs {args.baseline} (more than {args.max_regression:.0%}):")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"No regression vs {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
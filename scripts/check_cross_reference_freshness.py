@@ -1,8 +1,33 @@
 #!/usr/bin/env python3
 """
-Staleness tripwire for cross_reference_matches.
+Staleness tripwire and health probe for the cross-reference pipeline.
+
+Probes every table the pipeline depends on, concurrently:
+
+    form_d_filings            Form D database, newest filing_date
+    funds_enriched            ADV database, newest updated_at
+    advisers_enriched         ADV database (no timestamp column - count and latency only)
+    cross_reference_matches   Form D database, last publish
+
+and reports for each its staleness, estimated row count (PostgREST
+`Prefer: count=estimated`, i.e. the planner's estimate - no COUNT(*) scan)
+and query latency. One request per table does all three: the newest row
+ordered by the freshness column, with the count in Content-Range. That
+ORDER BY ... DESC NULLS LAST LIMIT 1 is an index lookup only with a matching
+index - see migrations/add_form_d_filing_date_index.sql and
+migrations/add_funds_enriched_updated_at_index.sql; without them the probe
+sorts the whole table and can hit the statement timeout.
+
+Exits non-zero if the last publish of cross_reference_matches is older than
+--max-days, or a table given with --max-age TABLE=DAYS is older than that.
+Only those tables gate the exit code: a source table that cannot be probed
+is reported as a warning, so a slow or unreachable source database does not
+fire the tripwire while the matches themselves are fresh.
+The publish time comes from cross_reference_publish.published_at
+(generation pointer, see migrations/create_cross_reference_generations.sql);
+databases without that table fall back to max(computed_at). computed_at alone
+is not enough once the refresh only rewrites changed rows.
 
-Exits non-zero if the most recent computed_at is older than the threshold.
 Designed to run on a daily cron from GitHub Actions; if it fires, we know
 the weekly refresh-cross-reference workflow has been disabled or is failing.
 
@@ -11,26 +36,42 @@ periods of inactivity. On 2026-05-11, the refresh-cross-reference workflow
 was found disabled with the table 30 days stale (last refresh 2026-04-12).
 This tripwire catches that condition earlier.
 
+--serve PORT keeps running instead: the tables are probed every --interval
+seconds and the cached results are served as Prometheus gauges on
+http://127.0.0.1:PORT/metrics (JSON on /), so monitoring can poll as often
+as it likes without adding a single request to Supabase.
+
+Requests go over persistent HTTP/1.1 connections: each probe thread keeps one
+keep-alive connection per database host and reuses it for every probe after
+the first (a connection the server closed while idle is reopened once).
+
 Usage:
-    python scripts/check_cross_reference_freshness.py [--max-days N]
+    python scripts/check_cross_reference_freshness.py [--max-days N] [--max-age TABLE=DAYS ...]
+    python scripts/check_cross_reference_freshness.py --serve 9464 [--interval 300]
 
 Env vars (or fallbacks):
     FORMD_URL  - Form D Supabase URL
     FORMD_KEY  - Form D anon or service key
+    ADV_URL    - ADV Supabase URL
+    ADV_KEY    - ADV anon or service key
 
 Exit codes:
-    0   table is fresh
-    1   table is stale (older than threshold)
-    2   table is empty or unreachable
+    0   all checked tables fresh (source tables may have warnings)
+    1   a checked table is stale (older than its threshold)
+    2   a checked table is empty or unreachable
     3   bad arguments / config
 """
 
 import argparse
+import http.client
+import http.server
+import json
 import os
 import sys
+import threading
+import time
 import urllib.parse
-import urllib.request
-import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 
@@ -40,6 +81,23 @@ DEFAULT_FORMD_KEY = (
     'eGtoYmJobWtpbW1vZ3lxIiwicm9sZSI6ImFub24iLCJpYXQiOjE3NTk1OTg3NTMsImV4cCI6MjA3'
     'NTE3NDc1M30.TS9uNMRqPKcthHCSMKAcFfhFEP-7Q6XbDHQNujBDOtc'
 )
+DEFAULT_ADV_URL = 'https://ezuqwwffjgfzymqxsctq.supabase.co'
+DEFAULT_ADV_KEY = (
+    'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZSIsInJlZiI6ImV6dXF3'
+    'd2ZmamdmenltcXhzY3RxIiwicm9sZSI6ImFub24iLCJpYXQiOjE3NjMzMjY0NDAsImV4cCI6MjA3'
+    'ODkwMjQ0MH0.RGMhIb7yMXmOQpysiPgazxJzflGKNCdzRZ8XBgPDCAE'
+)
+
+# table -> (database, freshness column or None)
+TABLES = {
+    'form_d_filings': ('formd', 'filing_date'),
+    'funds_enriched': ('adv', 'updated_at'),
+    'advisers_enriched': ('adv', None),
+    'cross_reference_matches': ('formd', 'computed_at'),
+}
+MATCH_TABLE = 'cross_reference_matches'
+
+REQUEST_TIMEOUT = 30
 
 
 def parse_iso(ts):
@@ -59,53 +117,323 @@ def parse_iso(ts):
         return None
 
 
-def main():
-    parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument('--max-days', type=int, default=14, help='Max allowed days since last refresh (default 14)')
-    parser.add_argument('--quiet', action='store_true', help='Suppress success output')
-    args = parser.parse_args()
+class KeepAlive:
+    """
+    PostgREST GETs over persistent connections: one per host per thread, kept
+    between requests (http.client connections are not thread-safe, and HTTP/1.1
+    has one request in flight per connection anyway).
+    """
 
-    base = os.environ.get('FORMD_URL') or DEFAULT_FORMD_URL
-    key = os.environ.get('FORMD_KEY') or DEFAULT_FORMD_KEY
+    def __init__(self, timeout=REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self._local = threading.local()
 
-    url = f"{base}/rest/v1/cross_reference_matches?select=computed_at&order=computed_at.desc&limit=1"
-    req = urllib.request.Request(url, headers={
-        'apikey': key,
-        'Authorization': f'Bearer {key}',
-    })
+    def _connection(self, scheme, host, fresh=False):
+        connections = self._local.__dict__.setdefault('connections', {})
+        conn = connections.get((scheme, host))
+        if conn is None or fresh:
+            if conn is not None:
+                conn.close()
+            connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = connections[(scheme, host)] = connection_class(host, timeout=self.timeout)
+        return conn
 
-    try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            data = json.load(resp)
-    except Exception as e:
-        print(f"[CHECK] FAIL: cannot query cross_reference_matches: {e}", file=sys.stderr)
-        return 2
+    def get(self, url, headers):
+        """(status, headers, parsed JSON body) of a GET; raises on network errors and HTTP >= 400."""
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        for attempt in (1, 2):
+            conn = self._connection(parts.scheme, parts.netloc, fresh=attempt > 1)
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # The server may have closed the idle keep-alive connection - reopen once
+                conn.close()
+                if attempt > 1:
+                    raise
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status}: {body[:200].decode('utf-8', 'replace')}")
+        return response.status, response.headers, json.loads(body or b'null')
 
-    if not isinstance(data, list) or not data:
-        print(f"[CHECK] FAIL: cross_reference_matches is empty (no rows)", file=sys.stderr)
-        return 2
 
-    latest_raw = data[0].get('computed_at')
-    latest = parse_iso(latest_raw)
-    if latest is None:
-        print(f"[CHECK] FAIL: cannot parse computed_at: {latest_raw!r}", file=sys.stderr)
-        return 2
+def estimated_count(content_range):
+    """Total from a Content-Range header ('0-0/12345' or '*/12345'); None when unknown."""
+    if not content_range or '/' not in content_range:
+        return None
+    total = content_range.rsplit('/', 1)[1]
+    return int(total) if total.isdigit() else None
+
+
+class Prober:
+    """Probes all TABLES concurrently; the threads (and their connections) are reused across probes."""
+
+    def __init__(self, databases, thresholds, timeout=REQUEST_TIMEOUT):
+        self.databases = databases      # database -> (base URL, key)
+        self.thresholds = thresholds    # table -> max age in days
+        self.http = KeepAlive(timeout)
+        self._pool = ThreadPoolExecutor(max_workers=len(TABLES), thread_name_prefix='probe')
+
+    def _get(self, database, path, count=False):
+        base, key = self.databases[database]
+        headers = {'apikey': key, 'Authorization': f'Bearer {key}'}
+        if count:
+            headers['Prefer'] = 'count=estimated'
+        _, response_headers, data = self.http.get(f"{base}/rest/v1/{path}", headers)
+        return response_headers, data
 
-    now = datetime.now(timezone.utc)
-    delta_days = (now - latest).total_seconds() / 86400.0
+    def probe_table(self, table):
+        database, column = TABLES[table]
+        result = {'table': table, 'database': database, 'ok': False, 'error': None, 'column': None,
+                  'latest': None, 'age_days': None, 'rows_estimated': None, 'latency_seconds': None,
+                  'max_days': self.thresholds.get(table), 'stale': None}
+        start = time.perf_counter()
+        try:
+            if column:
+                path = f"{table}?select={column}&order={column}.desc.nullslast&limit=1"
+            else:
+                path = f"{table}?limit=1"
+            response_headers, data = self._get(database, path, count=True)
+            result['rows_estimated'] = estimated_count(response_headers.get('Content-Range'))
+            if not isinstance(data, list) or not data:
+                result['error'] = f"{table} is empty (no rows)"
+                result['latency_seconds'] = time.perf_counter() - start
+                return result
+            if column:
+                result['column'] = f'{table}.{column}'
+                result['latest'] = data[0].get(column)
+            if table == MATCH_TABLE:
+                published = self._published_at()
+                if published:
+                    result['column'], result['latest'] = 'cross_reference_publish.published_at', published
+        except Exception as e:
+            result['error'] = f"cannot query {table}: {e}"
+            result['latency_seconds'] = time.perf_counter() - start
+            return result
+        result['latency_seconds'] = time.perf_counter() - start
 
-    if delta_days > args.max_days:
-        print(f"[CHECK] STALE: cross_reference_matches.computed_at = {latest_raw}")
-        print(f"[CHECK]        age = {delta_days:.1f} days (threshold = {args.max_days} days)")
-        print(f"[CHECK]        ACTION: enable the workflow:")
-        print(f"[CHECK]          gh workflow enable refresh-cross-reference.yml")
-        print(f"[CHECK]          gh workflow run refresh-cross-reference.yml")
+        if result['column']:
+            latest = parse_iso(result['latest'])
+            if latest is None:
+                result['error'] = f"cannot parse {result['column']}: {result['latest']!r}"
+                return result
+            result['age_days'] = (datetime.now(timezone.utc) - latest).total_seconds() / 86400.0
+            if result['max_days'] is not None:
+                result['stale'] = result['age_days'] > result['max_days']
+        result['ok'] = True
+        return result
+
+    def _published_at(self):
+        try:
+            _, data = self._get('formd', 'cross_reference_publish?select=published_at&id=eq.1')
+        except Exception:
+            return None  # table not migrated yet
+        return data[0].get('published_at') if data else None
+
+    def probe(self):
+        """Probe every table at once; returns {'probed_at', 'seconds', 'tables': [result, ...]}."""
+        start = time.perf_counter()
+        results = list(self._pool.map(self.probe_table, TABLES))
+        return {
+            'probed_at': time.time(),
+            'seconds': time.perf_counter() - start,
+            'tables': results,
+        }
+
+
+def exit_code(report):
+    # Only the tables with a threshold (the matches, plus any --max-age) are checked
+    tables = [result for result in report['tables'] if result['max_days'] is not None]
+    if any(not result['ok'] for result in tables):
+        return 2
+    if any(result['stale'] for result in tables):
         return 1
+    return 0
+
 
-    if not args.quiet:
-        print(f"[CHECK] OK: cross_reference_matches.computed_at = {latest_raw} ({delta_days:.1f} days ago, threshold {args.max_days})")
+def print_report(report, quiet=False):
+    for result in report['tables']:
+        latency = f"{result['latency_seconds'] * 1000:.0f} ms" if result['latency_seconds'] is not None else '-'
+        rows = f"~{result['rows_estimated']:,} rows" if result['rows_estimated'] is not None else 'rows unknown'
+        if not result['ok']:
+            level = 'FAIL' if result['max_days'] is not None else 'WARN'
+            print(f"[CHECK] {level}: {result['error']} ({latency})", file=sys.stderr)
+            continue
+        if result['stale']:
+            print(f"[CHECK] STALE: {result['column']} = {result['latest']}")
+            print(f"[CHECK]        age = {result['age_days']:.1f} days (threshold = {result['max_days']} days)")
+            if result['table'] == MATCH_TABLE:
+                print(f"[CHECK]        ACTION: enable the workflow:")
+                print(f"[CHECK]          gh workflow enable refresh-cross-reference.yml")
+                print(f"[CHECK]          gh workflow run refresh-cross-reference.yml")
+            continue
+        if quiet:
+            continue
+        if result['column']:
+            threshold = f", threshold {result['max_days']}" if result['max_days'] is not None else ''
+            age = f"{result['column']} = {result['latest']} ({result['age_days']:.1f} days ago{threshold})"
+        else:
+            age = f"{result['table']} (no timestamp column)"
+        print(f"[CHECK] OK: {age}, {rows}, {latency}")
+
+
+def prometheus(report, probes):
+    """Cached probe results as Prometheus text format gauges."""
+    lines = []
+
+    def gauge(name, help_text, samples):
+        metric = f'cross_reference_{name}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} gauge')
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f'{metric}{{{label_text}}} {value}' if label_text else f'{metric} {value}')
+
+    tables = report['tables']
+    gauge('table_up', 'Whether the last probe of the table succeeded',
+          [({'table': r['table'], 'database': r['database']}, int(r['ok'])) for r in tables])
+    gauge('table_age_seconds', 'Age of the newest row (matches: of the last publish)',
+          [({'table': r['table'], 'column': r['column']}, round(r['age_days'] * 86400))
+           for r in tables if r['age_days'] is not None])
+    gauge('table_stale', 'Whether the table is older than its threshold',
+          [({'table': r['table']}, int(r['stale'])) for r in tables if r['stale'] is not None])
+    gauge('table_max_age_seconds', 'Staleness threshold of the table',
+          [({'table': r['table']}, r['max_days'] * 86400) for r in tables if r['max_days'] is not None])
+    gauge('table_rows_estimated', 'Planner estimate of the row count (Prefer: count=estimated)',
+          [({'table': r['table']}, r['rows_estimated']) for r in tables])
+    gauge('table_probe_seconds', 'Latency of the probe queries of the table',
+          [({'table': r['table']}, round(r['latency_seconds'], 4)) for r in tables])
+    gauge('probe_timestamp_seconds', 'When the cached probe finished (Unix time)', [({}, round(report['probed_at']))])
+    gauge('probe_duration_seconds', 'Wall time of the cached probe', [({}, round(report['seconds'], 4))])
+    gauge('probes', 'Probes run since the server started', [({}, probes)])
+    return '\n'.join(lines) + '\n'
+
+
+class ProbeCache:
+    """The latest probe, refreshed every `interval` seconds on a background thread."""
+
+    def __init__(self, prober, interval):
+        self.prober = prober
+        self.interval = interval
+        self.report = None
+        self.probes = 0
+        self._lock = threading.Lock()
+
+    def run_forever(self):
+        while True:
+            started = time.monotonic()
+            try:
+                report = self.prober.probe()
+            except Exception as e:  # keep serving the last good probe
+                print(f"[PROBE] failed: {e}", file=sys.stderr)
+            else:
+                with self._lock:
+                    self.report = report
+                    self.probes += 1
+                failed = [r['table'] for r in report['tables'] if not r['ok']]
+                print(f"[PROBE] {len(report['tables'])} tables in {report['seconds'] * 1000:.0f} ms"
+                      + (f", failing: {', '.join(failed)}" if failed else ''), flush=True)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def snapshot(self):
+        with self._lock:
+            return self.report, self.probes
+
+
+def serve(cache, bind, port):
+    """Serve the cached probe: /metrics (Prometheus text) and / (JSON). Never probes on request."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            report, probes = cache.snapshot()
+            path = self.path.split('?', 1)[0]
+            if path not in ('/', '/metrics'):
+                self._send(404, 'text/plain', 'not found\n')
+            elif report is None:
+                self._send(503, 'text/plain', 'no probe has finished yet\n')
+            elif path == '/metrics':
+                self._send(200, 'text/plain; version=0.0.4', prometheus(report, probes))
+            else:
+                self._send(200, 'application/json', json.dumps(dict(report, exit_code=exit_code(report)), indent=2))
+
+        def _send(self, status, content_type, body):
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # scraped every few seconds - not worth a log line each
+
+    server = http.server.ThreadingHTTPServer((bind, port), Handler)
+    threading.Thread(target=cache.run_forever, daemon=True).start()
+    print(f"[PROBE] serving http://{bind}:{server.server_address[1]}/metrics, probing every {cache.interval}s",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
     return 0
 
 
+def parse_max_age(value):
+    """argparse type for --max-age: TABLE=DAYS."""
+    table, _, days = value.partition('=')
+    if table not in TABLES:
+        raise argparse.ArgumentTypeError(f"unknown table {table!r} - expected one of {', '.join(TABLES)}")
+    try:
+        return table, float(days)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected TABLE=DAYS, got {value!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-days', type=int, default=14,
+                        help='Max allowed days since the last cross_reference_matches publish (default 14)')
+    parser.add_argument('--max-age', type=parse_max_age, action='append', default=[], metavar='TABLE=DAYS',
+                        help='Also fail when TABLE is older than DAYS (repeatable; source tables are '
+                             'only reported by default)')
+    parser.add_argument('--quiet', action='store_true', help='Suppress success output')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                        help=f'Per-request timeout in seconds (default {REQUEST_TIMEOUT})')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='Keep running: probe every --interval seconds and serve the cached results on '
+                             'http://BIND:PORT/metrics')
+    parser.add_argument('--bind', default='127.0.0.1', help='Address for --serve (default 127.0.0.1)')
+    parser.add_argument('--interval', type=float, default=300,
+                        help='Seconds between probes with --serve (default 300)')
+    try:
+        args = parser.parse_args()
+    except SystemExit as e:
+        return 3 if e.code else 0
+    if args.interval <= 0 or args.timeout <= 0:
+        print("[CHECK] --interval and --timeout must be positive", file=sys.stderr)
+        return 3
+
+    databases = {
+        'formd': (os.environ.get('FORMD_URL') or DEFAULT_FORMD_URL, os.environ.get('FORMD_KEY') or DEFAULT_FORMD_KEY),
+        'adv': (os.environ.get('ADV_URL') or DEFAULT_ADV_URL, os.environ.get('ADV_KEY') or DEFAULT_ADV_KEY),
+    }
+    thresholds = {MATCH_TABLE: args.max_days}
+    thresholds.update(args.max_age)
+    prober = Prober(databases, thresholds, args.timeout)
+
+    if args.serve is not None:
+        return serve(ProbeCache(prober, args.interval), args.bind, args.serve)
+
+    report = prober.probe()
+    print_report(report, args.quiet)
+    return exit_code(report)
+
+
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+In-process stand-in for the Supabase clients of compute_cross_reference.py.
+
+FakeClient answers the PostgREST calls the cross-reference scripts make
+(table().select().gt()...execute(), insert / upsert / delete) from memory,
+so the pipeline can be benchmarked and exercised without a network.
+FakeFormDClient adds the generation tables and RPCs from
+migrations/create_cross_reference_generations.sql.
+
+Tables come in two kinds:
+
+    SyntheticTable   read-only rows with keys 1..n, built on demand by a row
+                     function - a 5M-row source table costs no memory
+    MemoryTable      rows held in a dict by key, for the tables the job writes
+
+A third kind, cross_reference_snapshot.SnapshotTable, serves the tables of a
+snapshot file through SQL.
+
+Only what the scripts use is implemented: gt / gte / lt / lte / eq / in_ /
+ilike filters, order(), limit(), range() and select(count='exact'). NULLs
+never pass a filter, like in SQL.
+"""
+
+import bisect
+import functools
+import itertools
+import math
+import operator
+import re
+import threading
+
+
+@functools.lru_cache(maxsize=256)
+def _like_pattern(pattern):
+    """SQL LIKE pattern ('%' any run, '_' one character) as a case-insensitive regex."""
+    parts = (('.*' if char == '%' else '.' if char == '_' else re.escape(char)) for char in pattern)
+    return re.compile(''.join(parts) + r'\Z', re.IGNORECASE | re.DOTALL)
+
+
+_FILTERS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'eq': operator.eq,
+    'in_': lambda value, values: value in values,
+    'ilike': lambda value, pattern: _like_pattern(pattern).match(str(value)) is not None,
+}
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _passes(row, filters):
+    for op, column, value in filters:
+        field = row.get(column)
+        if field is None or not _FILTERS[op](field, value):
+            return False
+    return True
+
+
+def _project(row, columns):
+    return dict(row) if columns is None else {column: row.get(column) for column in columns}
+
+
+class SyntheticTable:
+    """
+    Read-only table of `count` rows; row i (0-based) is make_row(i) and has
+    key i + 1 in key_column. Filters on the key become index bounds, so keyset
+    pages and range() probes cost only the rows they return.
+    """
+
+    def __init__(self, count, make_row, key_column='id'):
+        self.count = count
+        self.make_row = make_row
+        self.key_column = key_column
+
+    def __len__(self):
+        return self.count
+
+    def _bounds(self, filters):
+        """(lo, hi) index range allowed by the key filters, plus the remaining filters."""
+        lo, hi = 0, self.count
+        rest = []
+        for op, column, value in filters:
+            if column != self.key_column or op == 'in_':
+                rest.append((op, column, value))
+            elif op == 'gt':
+                lo = max(lo, math.floor(value))
+            elif op == 'gte':
+                lo = max(lo, math.ceil(value) - 1)
+            elif op == 'lt':
+                hi = min(hi, math.ceil(value) - 1)
+            elif op == 'lte':
+                hi = min(hi, math.floor(value))
+            else:  # eq
+                lo, hi = max(lo, value - 1), min(hi, value)
+        return lo, max(lo, hi), rest
+
+    def select(self, filters, columns=None, order=None, desc=False, offset=0, limit=None, count=False):
+        if order not in (None, self.key_column):
+            raise NotImplementedError(f"SyntheticTable only orders by {self.key_column}")
+        lo, hi, rest = self._bounds(filters)
+        indexes = range(hi - 1, lo - 1, -1) if desc else range(lo, hi)
+        if rest:
+            rows = (row for row in map(self.make_row, indexes) if _passes(row, rest))
+            total = sum(1 for _ in rows) if count else None
+            rows = (row for row in map(self.make_row, indexes) if _passes(row, rest))
+            stop = None if limit is None else offset + limit
+            data = [_project(row, columns) for row in itertools.islice(rows, offset, stop)]
+            return data, total
+        picked = indexes[offset:] if limit is None else indexes[offset:offset + limit]
+        return [_project(self.make_row(i), columns) for i in picked], (len(indexes) if count else None)
+
+
+class MemoryTable:
+    """Writable table: key -> row dict. Inserts without a key get the next serial id."""
+
+    def __init__(self, rows=(), key_column='id'):
+        self.key_column = key_column
+        self.rows = {}
+        self.next_id = 1
+        self._sorted_keys = None
+        for row in rows:
+            self._put(dict(row))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _put(self, row):
+        key = row.get(self.key_column)
+        if key is None:
+            key = row[self.key_column] = self.next_id
+        if isinstance(key, int):
+            self.next_id = max(self.next_id, key + 1)
+        self.rows[key] = row
+        self._sorted_keys = None
+        return row
+
+    def _keys(self, filters):
+        """Sorted keys, the (lo, hi) slice the key filters allow (bisected), and the remaining filters."""
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self.rows)
+        keys = self._sorted_keys
+        lo, hi = 0, len(keys)
+        rest = []
+        for op, column, value in filters:
+            if column != self.key_column or op in ('eq', 'in_'):
+                rest.append((op, column, value))
+            elif op == 'gt':
+                lo = max(lo, bisect.bisect_right(keys, value))
+            elif op == 'gte':
+                lo = max(lo, bisect.bisect_left(keys, value))
+            elif op == 'lt':
+                hi = min(hi, bisect.bisect_left(keys, value))
+            else:  # lte
+                hi = min(hi, bisect.bisect_right(keys, value))
+        return keys, lo, max(lo, hi), rest
+
+    def select(self, filters, columns=None, order=None, desc=False, offset=0, limit=None, count=False):
+        keys, lo, hi, rest = self._keys(filters)
+        positions = range(hi - 1, lo - 1, -1) if desc else range(lo, hi)
+        rows = (row for row in (self.rows[keys[i]] for i in positions) if _passes(row, rest))
+        if count or order not in (None, self.key_column):
+            rows = list(rows)
+            if order not in (None, self.key_column):
+                rows.sort(key=lambda row: row.get(order), reverse=desc)
+        # Keyset pages stop reading once they have `limit` rows
+        stop = None if limit is None else offset + limit
+        data = [_project(row, columns) for row in itertools.islice(rows, offset, stop)]
+        return data, (len(rows) if count else None)
+
+    def insert(self, rows):
+        return [dict(self._put(dict(row))) for row in rows]
+
+    def upsert(self, rows, on_conflict=None):
+        if on_conflict not in (None, self.key_column):
+            raise NotImplementedError(f"MemoryTable only upserts on {self.key_column}")
+        written = []
+        for row in rows:
+            existing = self.rows.get(row.get(self.key_column))
+            if existing is not None:
+                existing.update(row)
+                written.append(dict(existing))
+            else:
+                written.append(dict(self._put(dict(row))))
+        return written
+
+    def delete(self, filters):
+        keys, lo, hi, rest = self._keys(filters)
+        deleted = [self.rows.pop(key) for key in keys[lo:hi] if _passes(self.rows[key], rest)]
+        if deleted:
+            self._sorted_keys = None
+        return deleted
+
+
+class FakeQuery:
+    """The subset of the postgrest-py request builder the scripts use."""
+
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+        self.op = 'select'
+        self.filters = []
+        self.columns = None
+        self.count = None
+        self.order_column = None
+        self.desc = False
+        self.offset = 0
+        self.limit_rows = None
+        self.payload = None
+        self.on_conflict = None
+        self.returning = None
+
+    def select(self, columns='*', count=None):
+        if columns.strip() != '*':
+            self.columns = [column.strip() for column in columns.split(',')]
+        self.count = count
+        return self
+
+    def _filter(self, op, column, value):
+        self.filters.append((op, column, set(value) if op == 'in_' else value))
+        return self
+
+    def gt(self, column, value):
+        return self._filter('gt', column, value)
+
+    def gte(self, column, value):
+        return self._filter('gte', column, value)
+
+    def lt(self, column, value):
+        return self._filter('lt', column, value)
+
+    def lte(self, column, value):
+        return self._filter('lte', column, value)
+
+    def eq(self, column, value):
+        return self._filter('eq', column, value)
+
+    def in_(self, column, values):
+        return self._filter('in_', column, values)
+
+    def ilike(self, column, pattern):
+        return self._filter('ilike', column, pattern)
+
+    def order(self, column, desc=False):
+        self.order_column = column
+        self.desc = desc
+        return self
+
+    def limit(self, count):
+        self.limit_rows = count
+        return self
+
+    def range(self, start, end):
+        self.offset = start
+        self.limit_rows = end - start + 1
+        return self
+
+    def insert(self, rows, returning=None):
+        self.op = 'insert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.returning = returning
+        return self
+
+    def upsert(self, rows, on_conflict=None, returning=None):
+        self.op = 'upsert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.on_conflict = on_conflict
+        self.returning = returning
+        return self
+
+    def delete(self, returning=None):
+        self.op = 'delete'
+        self.returning = returning
+        return self
+
+    def execute(self):
+        return self._client.execute(self)
+
+
+class FakeRpc:
+    def __init__(self, function, params):
+        self._function = function
+        self._params = params
+
+    def execute(self):
+        return FakeResponse(self._function(**self._params))
+
+
+class FakeClient:
+    """
+    Supabase client stand-in over named tables.
+
+        client = FakeClient({'form_d_filings': SyntheticTable(50000, make_filing)})
+        client.table('form_d_filings').select('id').gt('id', 0).limit(10).execute().data
+
+    views: name -> (table name, extra filters), e.g. a view that shows one
+    generation of a table. requests / rows_served count what was asked for.
+    """
+
+    def __init__(self, tables=None, views=None):
+        self.tables = dict(tables or {})
+        self.views = dict(views or {})
+        self.functions = {}
+        self.requests = 0
+        self.rows_served = 0
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        with self._lock:
+            self.requests += 1
+        return FakeRpc(self.functions[name], params or {})
+
+    def execute(self, query):
+        with self._lock:
+            self.requests += 1
+            name, filters = query.name, list(query.filters)
+            if name in self.views:
+                name, extra = self.views[name]
+                filters += extra()
+            table = self.tables[name]
+            if query.op == 'select':
+                data, count = table.select(filters, query.columns, query.order_column, query.desc,
+                                           query.offset, query.limit_rows, query.count == 'exact')
+                self.rows_served += len(data)
+                return FakeResponse(data, count)
+            if query.op == 'insert':
+                data = table.insert(query.payload)
+            elif query.op == 'upsert':
+                data = table.upsert(query.payload, query.on_conflict)
+            else:
+                data = table.delete(filters)
+            # Prefer: return=minimal - the write happens, no rows come back
+            return FakeResponse([] if query.returning == 'minimal' else data)
+
+
+class FakeFormDClient(FakeClient):
+    """
+    FakeClient with the match generations of the Form D database: the
+    cross_reference_match_rows table, the cross_reference_matches view (rows
+    of the active generation) and the begin / purge / copy / publish / rollback RPCs,
+    behaving like their SQL definitions.
+    """
+
+    def __init__(self, tables=None):
+        super().__init__(tables)
+        self.tables.setdefault('cross_reference_match_rows', MemoryTable())
+        self.views['cross_reference_matches'] = (
+            'cross_reference_match_rows', lambda: [('eq', 'generation', self.active)])
+        self.active = 1
+        self.previous = None
+        self.generations = {1: 'active'}
+        self.functions.update({
+            'begin_cross_reference_generation': self._begin,
+            'publish_cross_reference_generation': self._publish,
+            'rollback_cross_reference_generation': self._rollback,
+            'purge_cross_reference_generations': self._purge,
+            'copy_cross_reference_generation': self._copy,
+        })
+        self.copied_from = {}
+
+    def _begin(self):
+        with self._lock:
+            keep = {self.active, self.previous}
+            for generation in list(self.generations):
+                if generation not in keep:
+                    self.generations[generation] = 'retired'
+            generation = max(self.generations) + 1
+            self.generations[generation] = 'building'
+            self.copied_from[generation] = self.active
+            return generation
+
+    def _purge(self, p_limit=5000):
+        with self._lock:
+            rows = self.tables['cross_reference_match_rows']
+            stale = [key for key, row in rows.rows.items()
+                     if self.generations.get(row.get('generation')) == 'retired'][:p_limit]
+            for key in stale:
+                del rows.rows[key]
+            rows._sorted_keys = None
+            return len(stale)
+
+    def _copy(self, p_generation, p_after_id=0, p_limit=5000):
+        with self._lock:
+            if self.generations.get(p_generation) != 'building':
+                raise ValueError(f"generation {p_generation} is not building")
+            rows = self.tables['cross_reference_match_rows']
+            source = self.copied_from[p_generation]
+            chunk = sorted((row for row in rows.rows.values()
+                            if row.get('generation') == source and row['id'] > p_after_id),
+                           key=lambda row: row['id'])[:p_limit]
+            copies = [dict(row, generation=p_generation) for row in chunk]
+            for row in copies:
+                del row['id']
+            rows.insert(copies)
+            return chunk[-1]['id'] if chunk else None
+
+    def _publish(self, p_generation):
+        with self._lock:
+            if self.generations.get(p_generation) != 'building':
+                raise ValueError(f"generation {p_generation} is not being built")
+            self.generations[self.active] = 'previous'
+            self.previous, self.active = self.active, p_generation
+            self.generations[p_generation] = 'active'
+
+    def _rollback(self):
+        with self._lock:
+            if self.previous is None:
+                raise ValueError("no previous generation to roll back to")
+            self.generations[self.active] = 'previous'
+            self.active, self.previous = self.previous, self.active
+            self.generations[self.active] = 'active'
+            return self.active
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Local lookups over the cross-reference data: which advisers, ADV funds, Form D
+filings and matches mention a name, and why a fund did or didn't match.
+
+One-off scripts like debug_founders.py used to answer this with `ilike
+'%...%'` queries against both Supabase projects - an unindexed scan on the
+server and a round-trip per question. This reads the tables
+compute_cross_reference.py saved to its snapshot (cross_reference_snapshot.py)
+once, indexes every name and answers from memory:
+
+    founders fund           substring, case-insensitive (what ilike '%...%' did)
+    prefix:founders         names starting with it
+    norm:Founders Fund LP   names equal to it after normalize_name_for_match -
+                            the key the matcher's name tier compares
+    explain:805-1234567     the matcher's decision for a fund (fund_id,
+                            reference_id or a name substring): file number and
+                            name lookups, the closest Form D names, the match
+                            it makes now and the one in the published set
+                            (the first explain builds the matcher's Form D
+                            index, a few seconds; later ones are instant)
+
+Per kind (adviser, fund, formd, match) a NameIndex keeps every distinct
+upper-cased name once, with:
+
+    postings    trigram -> name ids, built in one go with NumPy: every
+                trigram of every name is packed into an int64 (three 21-bit
+                code points), a stable argsort groups them and each gram's
+                name ids are one slice of a single array. A substring query
+                intersects the slices of its trigrams, rarest first, and
+                confirms the few candidates with `in` (queries under 3
+                characters scan the names)
+    ordered     the names sorted, for prefix queries by bisect
+    normalized  normalized name -> record ids
+
+Usage:
+    python scripts/cross_reference_lookup.py "founders fund"
+    python scripts/cross_reference_lookup.py --kind formd "prefix:founders"
+    python scripts/cross_reference_lookup.py "explain:805-1234567"
+    python scripts/cross_reference_lookup.py            # interactive: index once, query many
+"""
+
+import argparse
+import bisect
+import os
+import sys
+import time
+
+import numpy as np
+
+import compute_cross_reference as xref
+import cross_reference_snapshot as snapshot
+import formd_index
+import fuzzy_name_index
+import name_normalizer
+
+DEFAULT_LIMIT = 20
+
+# Closest Form D names shown by explain: candidates down to this similarity
+NEAR_THRESHOLD = 0.5
+NEAR_COUNT = 3
+
+# Stop intersecting posting lists once this few candidates are left - checking
+# them with `in` is cheaper than another intersection
+VERIFY_BELOW = 64
+
+
+def gram_codes(codepoints):
+    """int64 code of every trigram in an int64 array of code points (0 where a gram crosses a separator)."""
+    first, second, third = codepoints[:-2], codepoints[1:-1], codepoints[2:]
+    codes = first << 42 | second << 21 | third
+    codes[(first == 0) | (second == 0) | (third == 0)] = 0
+    return codes
+
+
+def _codepoints(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+
+
+class NameIndex:
+    """
+    Substring / prefix / normalized-name index over the names of one table.
+
+        index = NameIndex()
+        index.add('Founders Fund LLC', record_id=7, normalized='FOUNDERS FUND')
+        index.finish()
+        index.substring('FUND')     # -> [7]
+
+    A record can have several names (a match row has the fund, entity and
+    adviser name); results are record ids in insertion order, each once.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.records = []
+        self.normalized = {}
+        self.ordered = []
+        self.grams = np.zeros(0, dtype=np.int64)     # distinct trigram codes, sorted
+        self.starts = np.zeros(1, dtype=np.int64)    # grams[k]'s name ids: name_ids[starts[k]:starts[k + 1]]
+        self.name_ids = np.zeros(0, dtype=np.int32)
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, record_id, normalized=None):
+        if not name:
+            return
+        name = str(name).upper().replace('\0', '')
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = self._ids[name] = len(self.names)
+            self.names.append(name)
+            self.records.append([])
+        self.records[name_id].append(record_id)
+        if normalized:
+            self.normalized.setdefault(normalized, []).append(record_id)
+
+    def finish(self):
+        """Build the trigram postings and sort the names; call once after the last add()."""
+        self.ordered = sorted(self.names)
+        if not self.names:
+            return
+        # All names in one array of code points, NUL-separated
+        codepoints = _codepoints('\0'.join(self.names))
+        lengths = np.fromiter(map(len, self.names), dtype=np.int64, count=len(self.names))
+        owners = np.repeat(np.arange(len(self.names), dtype=np.int32), lengths + 1)[:len(codepoints) - 2]
+        codes = gram_codes(codepoints)
+        valid = codes != 0
+        codes, owners = codes[valid], owners[valid]
+        # Stable: within a gram the owners stay ascending, so each slice is sorted
+        order = np.argsort(codes, kind='stable')
+        codes, owners = codes[order], owners[order]
+        # Drop a gram repeated within one name
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (owners[1:] != owners[:-1])
+        codes, owners = codes[keep], owners[keep]
+        first = np.flatnonzero(np.append(True, codes[1:] != codes[:-1]))
+        self.grams = codes[first]
+        self.starts = np.append(first, len(codes))
+        self.name_ids = owners
+
+    def _posting(self, code):
+        k = np.searchsorted(self.grams, code)
+        if k == len(self.grams) or self.grams[k] != code:
+            return self.name_ids[:0]
+        return self.name_ids[self.starts[k]:self.starts[k + 1]]
+
+    def _records(self, name_ids):
+        records = self.records
+        return sorted({record_id for name_id in name_ids for record_id in records[name_id]})
+
+    def substring(self, text):
+        text = text.upper()
+        if len(text) < 3:
+            return self._records(i for i, name in enumerate(self.names) if text in name)
+        postings = sorted((self._posting(code) for code in set(gram_codes(_codepoints(text)).tolist())), key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if len(candidates) < VERIFY_BELOW:
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        names = self.names
+        return self._records(i for i in candidates.tolist() if text in names[i])
+
+    def prefix(self, text):
+        text = text.upper()
+        ordered = self.ordered
+        ids = []
+        for position in range(bisect.bisect_left(ordered, text), len(ordered)):
+            if not ordered[position].startswith(text):
+                break
+            ids.append(self._ids[ordered[position]])
+        return self._records(ids)
+
+    def by_normalized(self, normalized):
+        return sorted(set(self.normalized.get(normalized, ())))
+
+
+def _money(value):
+    return f'${value:,.0f}' if isinstance(value, (int, float)) else '?'
+
+
+def _short(value, width):
+    text = '' if value is None else str(value)
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+
+def format_adviser(row):
+    return f"CRD {row.get('crd')}: {row.get('adviser_name')}"
+
+
+def format_fund(row):
+    return (f"{row.get('fund_id')} (ref {row.get('reference_id')}): {_short(row.get('fund_name'), 60)} | "
+            f"file: {row.get('form_d_file_number') or '-'} | CRD {row.get('adviser_entity_crd')}")
+
+
+def format_filing(row):
+    return (f"{_short(row.get('entityname'), 60)} | file: {row.get('file_num') or '-'} | "
+            f"{row.get('filing_date')} | {_money(row.get('totalofferingamount'))} | {row.get('accessionnumber')}")
+
+
+def format_match(row):
+    return (f"ADV: {_short(row.get('adv_fund_name'), 50)} ({row.get('adv_fund_id')})\n"
+            f"    -> Form D: {_short(row.get('formd_entity_name'), 50) or 'None'} ({row.get('formd_accession')})\n"
+            f"    -> Adviser: CRD {row.get('adviser_entity_crd')} - "
+            f"{_short(row.get('adviser_entity_legal_name') or '?', 40)}\n"
+            f"    -> {row.get('match_method')} {row.get('match_score')}"
+            f"{' | ' + row['issues'] if row.get('issues') else ''}")
+
+
+# kind -> (snapshot table, name columns, formatter)
+KINDS = {
+    'adviser': ('advisers_enriched', ('adviser_name',), format_adviser),
+    'fund': ('funds_enriched', ('fund_name',), format_fund),
+    'formd': ('form_d_filings', ('entityname',), format_filing),
+    'match': (xref.MATCH_VIEW, ('adv_fund_name', 'formd_entity_name', 'adviser_entity_legal_name'), format_match),
+}
+
+
+class Lookup:
+    """The snapshot tables, their NameIndexes and the matcher's Form D index."""
+
+    def __init__(self, tables):
+        self.rows = {}
+        self.indexes = {}
+        for kind, (table, columns, _) in KINDS.items():
+            rows = tables.get(table)
+            if rows is None:
+                continue
+            index = NameIndex()
+            for column in columns:
+                names = [row.get(column) for row in rows]
+                normalized = xref.normalize_names_for_match(names)
+                for record_id, (name, norm) in enumerate(zip(names, normalized)):
+                    index.add(name, record_id, norm)
+            index.finish()
+            self.rows[kind] = rows
+            self.indexes[kind] = index
+
+        self._formd = None
+        self.adviser_map = {row['crd']: row for row in self.rows.get('adviser', []) if row.get('crd')}
+        self.published = {}
+        for row in self.rows.get('match', []):
+            self.published.setdefault(row.get('adv_fund_id'), []).append(row)
+        self._near_index = None
+        self._fuzzy_indexes = {}
+
+    @property
+    def formd(self):
+        """The matcher's own Form D index over the snapshot's filings (built on first use)."""
+        if self._formd is None:
+            self._formd = formd_index.FormDIndex()
+            xref.index_formd_filings(self.rows.get('formd', []), self._formd)
+        return self._formd
+
+    @classmethod
+    def from_snapshot(cls, path):
+        tables = {}
+        info = snapshot.snapshot_info(path)
+        for table, _, _ in KINDS.values():
+            if table in info:
+                # Read-only lookups: the matcher re-checks the checksum whenever it loads the snapshot
+                tables[table] = snapshot.load_table(path, table, verify=False)
+            else:
+                print(f"  Snapshot has no {table} table - skipping it")
+        return cls(tables)
+
+    def search(self, kind, mode, text):
+        """Record ids of one kind for a 'substring', 'prefix' or 'normalized' query."""
+        index = self.indexes[kind]
+        if mode == 'prefix':
+            return index.prefix(text)
+        if mode == 'normalized':
+            return index.by_normalized(xref.normalize_name_for_match(text))
+        return index.substring(text)
+
+    def find_funds(self, text):
+        """Funds by fund_id, reference_id or (failing both) name substring."""
+        funds = self.rows.get('fund', [])
+        exact = [row for row in funds if text in (str(row.get('fund_id')), str(row.get('reference_id')))]
+        if exact:
+            return exact
+        return [funds[record_id] for record_id in self.search('fund', 'substring', text)]
+
+    def near_names(self, normalized):
+        """The Form D names most similar to normalized: [(score, name, same_series)], best first."""
+        if self._near_index is None:
+            self._near_index = fuzzy_name_index.FuzzyNameIndex(self.formd.by_name.keys(), NEAR_THRESHOLD)
+        index = self._near_index
+        grams = fuzzy_name_index.trigrams(normalized)
+        series = fuzzy_name_index.series_tokens(normalized)
+        scored = []
+        for name_id in index.candidates(grams):
+            other = index.grams[name_id]
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            if score >= NEAR_THRESHOLD:
+                scored.append((-score, index.names[name_id], index.series[name_id] == series))
+        scored.sort()
+        return [(round(-score, 4), name, same) for score, name, same in scored[:NEAR_COUNT]]
+
+    def fuzzy_index(self, threshold):
+        """The matcher's FuzzyNameIndex for a --fuzzy threshold (built on first use)."""
+        if threshold not in self._fuzzy_indexes:
+            self._fuzzy_indexes[threshold] = fuzzy_name_index.FuzzyNameIndex(self.formd.by_name.keys(), threshold)
+        return self._fuzzy_indexes[threshold]
+
+    def _published_line(self, fund, filing):
+        published = self.published.get(fund.get('fund_id'), [])
+        if not published:
+            return "  published: no match for this fund_id" + (
+                " - the snapshot's match set predates this match" if filing is not None else "")
+        accessions = {row.get('formd_accession') for row in published}
+        if filing is not None and filing.get('accessionnumber') in accessions:
+            return f"  published: the same filing ({len(published)} match row(s) for this fund_id)"
+        return (f"  published: {', '.join(sorted(map(str, accessions)))} "
+                f"({len(published)} match row(s) for this fund_id)")
+
+    def explain(self, fund, fuzzy_threshold=None):
+        """Lines describing how the matcher treats one funds_enriched row."""
+        formd = self.formd
+        lines = [f"Fund {format_fund(fund)}"]
+
+        file_numbers = xref.split_file_numbers(fund.get('form_d_file_number'))
+        if not file_numbers:
+            lines.append("  file number: none on the fund")
+        for fn in file_numbers:
+            filing = formd.latest_by_file_num(fn)
+            if filing is None:
+                lines.append(f"  file number {fn}: no Form D filing has it")
+            else:
+                lines.append(f"  file number {fn}: {formd.by_file_num.count(fn)} filing(s), "
+                             f"latest {format_filing(filing)}")
+
+        normalized = xref.normalize_name_for_match(fund.get('fund_name'))
+        if not normalized or len(normalized) < 3:
+            lines.append(f"  name: normalizes to {normalized!r} - too short for the name tier")
+        else:
+            filing = formd.latest_by_name(normalized)
+            if filing is None:
+                lines.append(f"  name: {normalized!r} - no Form D entity normalizes to it")
+            else:
+                lines.append(f"  name: {normalized!r} - {formd.by_name.count(normalized)} filing(s), "
+                             f"latest {format_filing(filing)}")
+            threshold = fuzzy_threshold or fuzzy_name_index.DEFAULT_THRESHOLD
+            for score, name, same_series in self.near_names(normalized):
+                if name == normalized:
+                    continue
+                if not same_series:
+                    why = 'series differ'
+                elif score < threshold:
+                    why = f'below fuzzy threshold {threshold}'
+                else:
+                    why = f'within fuzzy threshold {threshold}'
+                    if not fuzzy_threshold:
+                        why += ' (--fuzzy is off)'
+                lines.append(f"  near: {name!r} similarity {score} - {why}")
+
+        fuzzy_index = self.fuzzy_index(fuzzy_threshold) if fuzzy_threshold else None
+        if not fund.get('fund_name'):
+            lines.append("  matcher: skipped - the fund has no name")
+            filing = None
+        else:
+            filing, method, score = xref.match_fund(fund, formd, fuzzy_index)
+            if filing is None:
+                lines.append("  matcher: no match")
+            else:
+                lines.append(f"  matcher: {method} ({score}) -> {format_filing(filing)}")
+
+        if 'match' in self.rows:
+            lines.append(self._published_line(fund, filing))
+
+        crd = fund.get('adviser_entity_crd')
+        adviser = self.adviser_map.get(crd)
+        lines.append(f"  adviser: {format_adviser(adviser)}" if adviser else
+                     f"  adviser: CRD {crd} is not in advisers_enriched - adviser_entity_legal_name stays empty")
+        return lines
+
+
+MODES = {'prefix:': 'prefix', 'norm:': 'normalized', 'explain:': 'explain'}
+
+
+def parse_query(query):
+    """'prefix:abc' -> ('prefix', 'abc'); a query without a mode is a substring query."""
+    for marker, mode in MODES.items():
+        if query.lower().startswith(marker):
+            return mode, query[len(marker):].strip()
+    return 'substring', query.strip()
+
+
+def answer(lookup, query, kinds, limit, fuzzy_threshold=None):
+    mode, text = parse_query(query)
+    if not text:
+        return
+    start = time.perf_counter()
+    if mode == 'explain':
+        funds = lookup.find_funds(text)
+        lines = []
+        for fund in funds[:limit]:
+            lines.extend(lookup.explain(fund, fuzzy_threshold))
+            lines.append('')
+        print(f"\n=== explain {text!r}: {len(funds)} fund(s) ({(time.perf_counter() - start) * 1000:.1f} ms) ===")
+        for line in lines:
+            print(line)
+        return
+
+    for kind in kinds:
+        if kind not in lookup.indexes:
+            continue
+        found = lookup.search(kind, mode, text)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"\n=== {kind}: {len(found)} with {mode} {text!r} ({elapsed:.1f} ms) ===")
+        formatter = KINDS[kind][2]
+        for record_id in found[:limit]:
+            print(f"  {formatter(lookup.rows[kind][record_id])}")
+        if len(found) > limit:
+            print(f"  ... {len(found) - limit} more (--limit)")
+        start = time.perf_counter()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Look up advisers, funds, Form D filings and matches '
+                                                 'in the local cross-reference snapshot')
+    parser.add_argument('queries', nargs='*',
+                        help="Queries: TEXT (substring), prefix:TEXT, norm:TEXT or explain:FUND. "
+                             "None = read queries from stdin, one per line")
+    parser.add_argument('--kind', action='append', choices=list(KINDS),
+                        help='Only search these kinds (repeatable; default all)')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help=f'Rows shown per kind (default {DEFAULT_LIMIT})')
+    parser.add_argument('--path', default=snapshot.DEFAULT_SNAPSHOT_PATH,
+                        help=f'Snapshot file (default {snapshot.DEFAULT_SNAPSHOT_PATH})')
+    parser.add_argument('--fuzzy', nargs='?', type=float, const=fuzzy_name_index.DEFAULT_THRESHOLD, default=None,
+                        metavar='THRESHOLD', help='Explain matches as a --fuzzy run of the matcher would make them')
+    parser.add_argument('--state-dir', default=xref.STATE_DIR,
+                        help='Reuse the name memo of the matcher runs in this directory')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"No snapshot at {args.path} - run compute_cross_reference.py (it saves one) or pass --path")
+        return 1
+
+    # Names the matcher has normalized before come from its memo instead of being normalized again
+    xref.NAME_MEMO = name_normalizer.NameMemo.load(os.path.join(args.state_dir, xref.NAME_MEMO_FILE))
+    start = time.perf_counter()
+    try:
+        lookup = Lookup.from_snapshot(args.path)
+    except snapshot.SnapshotError as e:
+        print(f"Snapshot error: {e}")
+        return 1
+    print(f"Indexed {', '.join(f'{len(index)} {kind} names' for kind, index in lookup.indexes.items())} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    kinds = args.kind or list(KINDS)
+    if args.queries:
+        for query in args.queries:
+            answer(lookup, query, kinds, args.limit, args.fuzzy)
+        return 0
+
+    interactive = sys.stdin.isatty()
+    while True:
+        if interactive:
+            print('\nlookup> ', end='', flush=True)
+        line = sys.stdin.readline()
+        if not line:
+            break
+        answer(lookup, line, kinds, args.limit, args.fuzzy)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
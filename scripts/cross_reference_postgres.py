@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Direct Postgres access for the cross-reference job (--source postgres).
+
+PostgREST moves the source tables 100 rows per request as JSON, and the match
+rows go back 500 per request. With a database connection string instead:
+
+    iter_copy_pages   COPY (SELECT ... ORDER BY key) TO STDOUT (FORMAT BINARY):
+                      one streamed round-trip per table, rows decoded by
+                      psycopg and handed out in pages like keyset paging does
+    MatchLoader       COPY FROM STDIN of every match row into a temp staging
+                      table while matching runs, then one transaction that
+                      begins the generation, diffs and merges it set-based
+                      (unchanged / updated / inserted / deleted, same rules as
+                      MatchWriter) and publishes it
+    PostgresClient    the remaining PostgREST-style calls (filtered selects,
+                      counts, RPCs) as plain SQL
+
+Rows come back shaped like PostgREST returns them: dates and timestamps as ISO
+strings, numerics as int / float.
+
+psycopg 3 is optional (pip install 'psycopg[binary]'); it is imported when the
+first connection is opened.
+"""
+
+import datetime
+import decimal
+import threading
+import uuid
+
+import cross_reference_fake as fake
+
+PAGE_SIZE = 5000
+
+_OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=', 'eq': '=', 'ilike': 'ILIKE'}
+
+
+def _psycopg():
+    try:
+        import psycopg
+    except ImportError:
+        raise RuntimeError("the postgres data source needs psycopg 3: pip install 'psycopg[binary]'")
+    return psycopg
+
+
+def connect(dsn, autocommit=True):
+    return _psycopg().connect(dsn, autocommit=autocommit)
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _columns(select):
+    """'a, b,c' -> ['a', 'b', 'c']; '*' -> None."""
+    if select.strip() == '*':
+        return None
+    return [column.strip() for column in select.split(',') if column.strip()]
+
+
+def _jsonable(value):
+    """A psycopg value as PostgREST would have returned it."""
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _where(filters, start_after=None, id_column=None):
+    """WHERE clause and parameters for (operator, column, value) filters."""
+    clauses, params = [], []
+    # A falsy start_after means "from the start" - 0 also stands for that on text keys
+    if start_after:
+        clauses.append(f'{_quote(id_column)} > %s')
+        params.append(start_after)
+    for op, column, value in filters or []:
+        if op == 'in_':
+            clauses.append(f'{_quote(column)} = ANY(%s)')
+            params.append(list(value))
+        else:
+            clauses.append(f'{_quote(column)} {_OPERATORS[op]} %s')
+            params.append(value)
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def iter_copy_pages(conn, table, select='*', id_column='id', start_after=None, filters=None, page_size=PAGE_SIZE):
+    """Yield a table (rows past start_after, filtered) as pages of dicts, in key order, over one COPY."""
+    columns = _columns(select)
+    if columns is not None and id_column not in columns:
+        columns.insert(0, id_column)
+    column_sql = '*' if columns is None else ', '.join(_quote(column) for column in columns)
+    where_sql, params = _where(filters, start_after, id_column)
+    query = f'SELECT {column_sql} FROM {_quote(table)}{where_sql} ORDER BY {_quote(id_column)}'
+
+    with conn.cursor() as cur:
+        # Column names and types for the binary decoder
+        cur.execute(f'SELECT {column_sql} FROM {_quote(table)} LIMIT 0')
+        names = [column.name for column in cur.description]
+        types = [column.type_code for column in cur.description]
+        page = []
+        with cur.copy(f'COPY ({query}) TO STDOUT (FORMAT BINARY)', params) as copy:
+            copy.set_types(types)
+            for values in copy.rows():
+                page.append({name: _jsonable(value) for name, value in zip(names, values)})
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+
+class _Rpc:
+    def __init__(self, client, name, params):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        args = ', '.join(f'{_quote(key)} => %s' for key in self._params)
+        with self._client.connection().cursor() as cur:
+            cur.execute(f'SELECT {_quote(self._name)}({args})', list(self._params.values()))
+            return fake.FakeResponse(_jsonable(cur.fetchone()[0]))
+
+
+class PostgresClient:
+    """
+    PostgREST-style reads and RPCs as SQL (builder from cross_reference_fake).
+
+    One autocommit connection per thread, opened on first use and kept.
+    Writes go through MatchLoader, not through here.
+    """
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = self._local.conn = connect(self.dsn)
+        return conn
+
+    def table(self, name):
+        return fake.FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return _Rpc(self, name, params or {})
+
+    def execute(self, query):
+        if query.op != 'select':
+            raise NotImplementedError("PostgresClient only reads - matches are written with MatchLoader")
+        table = _quote(query.name)
+        where_sql, params = _where(query.filters)
+        with self.connection().cursor() as cur:
+            count = None
+            if query.count == 'exact':
+                cur.execute(f'SELECT COUNT(*) FROM {table}{where_sql}', params)
+                count = cur.fetchone()[0]
+            column_sql = '*' if query.columns is None else ', '.join(_quote(c) for c in query.columns)
+            sql = f'SELECT {column_sql} FROM {table}{where_sql}'
+            if query.order_column:
+                sql += f" ORDER BY {_quote(query.order_column)}{' DESC' if query.desc else ''}"
+            if query.limit_rows is not None:
+                sql += f' LIMIT {int(query.limit_rows)}'
+            if query.offset:
+                sql += f' OFFSET {int(query.offset)}'
+            cur.execute(sql, params)
+            names = [column.name for column in cur.description]
+            data = [{name: _jsonable(value) for name, value in zip(names, row)} for row in cur.fetchall()]
+        return fake.FakeResponse(data, count)
+
+
+class MatchLoader:
+    """
+    Stream match rows into Postgres with COPY and merge them as a new generation.
+
+        loader = MatchLoader(dsn, MATCH_COLUMNS, signature_columns)
+        for match in matches:
+            loader.add(match)
+        counts = loader.merge()     # begin generation + set-based diff, not yet visible
+        loader.publish()            # or loader.close() to throw it away (dry run,
+                                    # or generation None: nothing changed)
+
+    Everything happens in one transaction, so a failure at any point leaves
+    the database as it was. The generation lock (begin_cross_reference_generation)
+    is only taken in merge(), after the rows are loaded.
+
+    Diff rules (as MatchWriter): a new row identical to an old one of the
+    generation in every signature column leaves it alone; otherwise it updates
+    a leftover old row with the same (adv_fund_id, formd_accession) or is
+    inserted; leftover old rows are deleted. fund_ids limits the old rows
+    considered to those adv_fund_ids (incremental mode).
+    """
+
+    STAGING = 'xref_match_staging'
+    TABLE = 'cross_reference_match_rows'
+    KEY_COLUMNS = ('adv_fund_id', 'formd_accession')
+
+    def __init__(self, dsn, columns, signature_columns, fund_ids=None):
+        self.columns = list(columns)
+        self.signature_columns = list(signature_columns)
+        self.fund_ids = None if fund_ids is None else sorted(str(fid) for fid in fund_ids if fid is not None)
+        self.generation = None
+        self.current_count = 0
+        self.counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        self._conn = connect(dsn, autocommit=False)
+        self._cur = self._conn.cursor()
+        column_sql = ', '.join(_quote(c) for c in self.columns)
+        self._cur.execute(f'CREATE TEMP TABLE {self.STAGING} ON COMMIT DROP AS '
+                          f'SELECT {column_sql} FROM {self.TABLE} WITH NO DATA')
+        self._cur.execute(f'ALTER TABLE {self.STAGING} ADD COLUMN sid BIGSERIAL')
+        self._copy_context = self._cur.copy(f'COPY {self.STAGING} ({column_sql}) FROM STDIN')
+        self._copy = self._copy_context.__enter__()
+        self.loaded = 0
+
+    def add(self, match):
+        self._copy.write_row([match.get(column) for column in self.columns])
+        self.loaded += 1
+
+    def _end_copy(self, error=None):
+        if self._copy_context is not None:
+            context, self._copy_context = self._copy_context, None
+            if error is None:
+                context.__exit__(None, None, None)
+            else:
+                context.__exit__(type(error), error, error.__traceback__)
+
+    def _old_rows(self, generation):
+        """WHERE clause and parameters for the old rows of a generation the diff considers."""
+        old_filter = 'generation = %(generation)s'
+        if self.fund_ids is not None:
+            old_filter += ' AND adv_fund_id = ANY(%(fund_ids)s)'
+        return old_filter, {'generation': generation, 'fund_ids': self.fund_ids}
+
+    def _pair_unchanged(self, old_filter):
+        """Identical rows, paired one to one (the n-th copy of a row with the n-th old copy)."""
+        # jsonb arrays compare NULL-safely and by value (1.0 = 1), and hash - so the pairing is a hash join
+        signature = f"jsonb_build_array({', '.join(_quote(c) for c in self.signature_columns)})"
+        return f'''
+            WITH new AS (
+                SELECT sid, {signature} AS sig, row_number() OVER (PARTITION BY {signature} ORDER BY sid) AS n
+                FROM {self.STAGING}
+            ), old AS (
+                SELECT id, {signature} AS sig, row_number() OVER (PARTITION BY {signature} ORDER BY id) AS n
+                FROM {self.TABLE} WHERE {old_filter}
+            )
+            SELECT new.sid, old.id FROM new JOIN old USING (sig, n)
+        '''
+
+    def _same_as_active(self):
+        """Whether the staged rows are exactly the active generation's - then there is nothing to publish."""
+        cur = self._cur
+        cur.execute('SELECT active_generation FROM cross_reference_publish WHERE id = 1')
+        old_filter, params = self._old_rows(cur.fetchone()[0])
+        cur.execute(f'SELECT COUNT(*) FROM {self.TABLE} WHERE {old_filter}', params)
+        current_count = cur.fetchone()[0]
+        if current_count != self.loaded:
+            return False
+        cur.execute(f'SELECT COUNT(*) FROM ({self._pair_unchanged(old_filter)}) pairs', params)
+        if cur.fetchone()[0] != current_count:
+            return False
+        self.current_count = self.counts['unchanged'] = current_count
+        return True
+
+    def merge(self):
+        """
+        Begin the generation and apply the diff inside it; returns the counts.
+
+        When nothing changed no generation is begun (generation stays None).
+        """
+        self._end_copy()
+        cur = self._cur
+        cur.execute(f'ANALYZE {self.STAGING}')
+        if self._same_as_active():
+            return self.counts
+        cur.execute('SELECT begin_cross_reference_generation()')
+        self.generation = cur.fetchone()[0]
+        # One connection, no API statement_timeout: purge and copy unchunked, inside this transaction
+        cur.execute('SELECT purge_cross_reference_generations(NULL)')
+        cur.execute('SELECT copy_cross_reference_generation(%s, 0, NULL)', (self.generation,))
+
+        old_filter, params = self._old_rows(self.generation)
+        key = f"jsonb_build_array({', '.join(_quote(c) for c in self.KEY_COLUMNS)})"
+
+        cur.execute(f'SELECT COUNT(*) FROM {self.TABLE} WHERE {old_filter}', params)
+        self.current_count = cur.fetchone()[0]
+
+        # 1. Identical rows
+        cur.execute(f'CREATE TEMP TABLE xref_unchanged ON COMMIT DROP AS {self._pair_unchanged(old_filter)}', params)
+        self.counts['unchanged'] = cur.rowcount
+
+        # 2. Changed rows take over a leftover old row with the same key
+        cur.execute(f'''
+            CREATE TEMP TABLE xref_updated ON COMMIT DROP AS
+            WITH new AS (
+                SELECT sid, {key} AS k, row_number() OVER (PARTITION BY {key} ORDER BY sid) AS n
+                FROM {self.STAGING} s
+                WHERE NOT EXISTS (SELECT 1 FROM xref_unchanged u WHERE u.sid = s.sid)
+            ), old AS (
+                SELECT id, {key} AS k, row_number() OVER (PARTITION BY {key} ORDER BY id) AS n
+                FROM {self.TABLE} r
+                WHERE {old_filter} AND NOT EXISTS (SELECT 1 FROM xref_unchanged u WHERE u.id = r.id)
+            )
+            SELECT new.sid, old.id FROM new JOIN old USING (k, n)
+        ''', params)
+
+        assignments = ', '.join(f'{_quote(c)} = s.{_quote(c)}' for c in self.columns)
+        cur.execute(f'''
+            UPDATE {self.TABLE} r SET {assignments}
+            FROM xref_updated u JOIN {self.STAGING} s ON s.sid = u.sid
+            WHERE r.id = u.id
+        ''')
+        self.counts['updated'] = cur.rowcount
+
+        cur.execute(f'''
+            DELETE FROM {self.TABLE} r
+            WHERE {old_filter}
+              AND NOT EXISTS (SELECT 1 FROM xref_unchanged u WHERE u.id = r.id)
+              AND NOT EXISTS (SELECT 1 FROM xref_updated u WHERE u.id = r.id)
+        ''', params)
+        self.counts['deleted'] = cur.rowcount
+
+        column_sql = ', '.join(_quote(c) for c in self.columns)
+        cur.execute(f'''
+            INSERT INTO {self.TABLE} (generation, {column_sql})
+            SELECT %(generation)s, {column_sql} FROM {self.STAGING} s
+            WHERE NOT EXISTS (SELECT 1 FROM xref_unchanged u WHERE u.sid = s.sid)
+              AND NOT EXISTS (SELECT 1 FROM xref_updated u WHERE u.sid = s.sid)
+        ''', params)
+        self.counts['inserted'] = cur.rowcount
+        return self.counts
+
+    def publish(self):
+        """Publish the merged generation and commit."""
+        self._cur.execute('SELECT publish_cross_reference_generation(%s)', (self.generation,))
+        self._conn.commit()
+        self.close()
+
+    def close(self, error=None):
+        """Roll back whatever was not published and close the connection."""
+        if self._conn.closed:
+            return
+        try:
+            self._end_copy(error or RuntimeError('aborted'))
+        except Exception:
+            pass  # the COPY is being thrown away anyway
+        finally:
+            self._conn.rollback()
+            self._conn.close()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Warm-index match service: Form D filings in, cross_reference_matches rows out,
+as soon as the filing is scraped instead of at the next weekly
+compute_cross_reference.py run.
+
+The service loads the matcher's state once (the incremental state in
+--state-dir, or a full fetch when there is none) and keeps in memory:
+
+    formd       the FormDIndex of every known filing, as the matcher has it
+    funds       FundIndex: file number (each value of a multi-valued
+                form_d_file_number, split_file_numbers) and normalized fund
+                name -> the ADV funds that carry it
+    advisers    crd -> advisers_enriched row, for the adviser join
+
+match(filing) finds the funds whose file number or normalized name the filing
+carries, runs the matcher's own match_fund() for them against the index with
+the filing laid on top (nothing is added to the index), and returns the match
+rows of the funds whose match is now that filing - the rows the next weekly
+run would publish for it. A filing for an already-matched key only wins if it
+is the latest by (filing_date, id), like in the batch job. match_many() does
+a batch in one pass.
+
+Every --refresh-interval seconds the index catches up with the databases:
+filings and funds past the state's watermarks, the funds_enriched keys (funds
+deleted there are dropped) and a refetch of the advisers.
+The fetches run outside the lock; matches only wait for the in-memory update.
+The service never writes the state or the match tables - the batch job stays
+the owner of both. Exact tiers only (file number, name): the fuzzy tier
+compares a fund against every name and has no per-filing answer.
+
+Usage:
+    # JSON lines: a filing per line on stdin, its match rows as JSON on stdout
+    python scripts/cross_reference_service.py < filings.jsonl
+
+    # HTTP: POST /match with a filing or a list of filings, GET /health
+    python scripts/cross_reference_service.py --serve 8766
+"""
+
+import argparse
+import http.server
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+
+import compute_cross_reference as xref
+import formd_index
+import match_enrichment
+
+DEFAULT_REFRESH_INTERVAL = 300
+
+
+class FundIndex:
+    """ADV funds by Form D file number and by normalized name (the keys match_fund() looks up)."""
+
+    def __init__(self):
+        self.by_file_num = {}
+        self.by_name = {}
+
+    def __len__(self):
+        return len(self.by_file_num) + len(self.by_name)
+
+    @staticmethod
+    def keys_of(fund):
+        file_nums = xref.split_file_numbers(fund.get('form_d_file_number'))
+        normalized = xref.normalize_name_for_match(fund.get('fund_name'))
+        return file_nums, normalized if normalized and len(normalized) >= 3 else None
+
+    def add(self, key, fund):
+        file_nums, normalized = self.keys_of(fund)
+        for fn in file_nums:
+            self.by_file_num.setdefault(fn, set()).add(key)
+        if normalized:
+            self.by_name.setdefault(normalized, set()).add(key)
+
+    def remove(self, key, fund):
+        file_nums, normalized = self.keys_of(fund)
+        for index, values in ((self.by_file_num, file_nums), (self.by_name, [normalized] if normalized else [])):
+            for value in values:
+                keys = index.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[value]
+
+    def candidates(self, file_num, normalized):
+        """Keys of the funds a filing with this file number / normalized name can match."""
+        found = set(self.by_file_num.get(file_num, ())) if file_num else set()
+        if normalized:
+            found.update(self.by_name.get(normalized, ()))
+        return found
+
+
+def _newer(current, new):
+    if new is None:
+        return current
+    if current is None:
+        return new
+    return new if formd_index.sort_key(new) > formd_index.sort_key(current) else current
+
+
+class Overlay:
+    """A FormDIndex with a batch of filings laid on top, for match_fund(); the base is not changed."""
+
+    def __init__(self, base, batch):
+        self.base = base
+        self.batch = batch
+
+    def latest_by_file_num(self, file_num):
+        return _newer(self.base.latest_by_file_num(file_num), self.batch.latest_by_file_num(file_num))
+
+    def latest_by_name(self, normalized_name):
+        return _newer(self.base.latest_by_name(normalized_name), self.batch.latest_by_name(normalized_name))
+
+
+class MatchService:
+    """
+    The warm index and the match API.
+
+        service = MatchService.load(state_dir)
+        service.match(filing)           # -> [match_row, ...] (usually 0 or 1)
+        service.match_many(filings)     # one pass for a batch
+        service.refresh()               # catch up with the databases
+    """
+
+    def __init__(self, state):
+        self.formd = state['formd_index']
+        self.watermarks = state['watermarks']
+        # Fresh states have int keys, saved ones str (JSON) - use str throughout
+        self.adv_funds = {str(key): fund for key, fund in state['adv_funds'].items()}
+        self.adviser_map = {str(crd): adviser for crd, adviser in state['adviser_map'].items()}
+        self.funds = FundIndex()
+        for key, fund in self.adv_funds.items():
+            self.funds.add(key, fund)
+        self.loaded_at = datetime.utcnow().isoformat()
+        self.refreshed_at = None
+        self.refreshes = 0
+        self.matched = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, state_dir, max_age_days):
+        """From the incremental state in state_dir, or - when there is none - a full fetch."""
+        state = xref.load_state(state_dir, max_age_days)
+        if state is None:
+            print("  Building the index from a full fetch")
+            state = {}
+            for _ in xref.iter_matches(state=state):
+                pass
+        # The service answers per filing - the state's match set is not needed
+        state.pop('matches', None)
+        return cls(state)
+
+    def match(self, filing):
+        """Match rows for one Form D filing (a form_d_filings row)."""
+        return self.match_many([filing])
+
+    def match_many(self, filings):
+        """Match rows for a batch of filings; a fund whose match is any of them appears once."""
+        batch = formd_index.FormDIndex()
+        keys = set()
+        for filing, normalized in zip(filings, xref.normalize_names_for_match([f.get('entityname') for f in filings])):
+            file_num = xref.normalize_file_number(filing.get('file_num'))
+            batch.add(filing, file_num, normalized)
+            keys |= self.funds.candidates(file_num, normalized)
+        # The index may have the filing already (a refresh got there first) - same accession, same filing
+        new = {id(filing) for filing in batch.filings}
+        accessions = {filing.accessionnumber for filing in batch.filings if filing.accessionnumber}
+        with self._lock:
+            overlay = Overlay(self.formd, batch)
+            matched = []
+            for key in sorted(keys):
+                fund = self.adv_funds.get(key)
+                if fund is None:
+                    continue
+                filing, method, score = xref.match_fund(fund, overlay)
+                if filing is not None and (id(filing) in new or filing.accessionnumber in accessions):
+                    matched.append((fund, filing, method, score))
+            rows = match_enrichment.build_match_rows(matched, self.adviser_map, datetime.utcnow().isoformat(),
+                                                     adviser_key=str)
+            self.matched += len(rows)
+        return rows
+
+    def refresh(self):
+        """Fetch the rows past the watermarks and fold them into the index. Returns what changed."""
+        watermarks = dict(self.watermarks)
+        new_filings = xref.fetch_source_table('formd', 'form_d_filings', xref.FORMD_COLUMNS,
+                                              start_after=watermarks['form_d_filings'])
+        changed_funds = xref.fetch_changed_funds(watermarks)
+        # Deletes leave no trace past the watermarks - only the keys still there tell
+        fund_keys = {str(row['reference_id']) for row in xref.fetch_source_table(
+            'adv', 'funds_enriched', 'reference_id', id_column='reference_id', parallel=True)}
+        advisers = xref.fetch_source_table('adv', 'advisers_enriched', xref.ADVISER_COLUMNS, id_column='crd',
+                                           parallel=True)
+        if new_filings:
+            watermarks['form_d_filings'] = max([watermarks['form_d_filings']] + [f['id'] for f in new_filings])
+
+        with self._lock:
+            xref.index_formd_filings(new_filings, self.formd)
+            for key, row in changed_funds.items():
+                old = self.adv_funds.get(key)
+                if old is not None:
+                    self.funds.remove(key, old)
+                fund = xref.project_adv_fund(row)
+                self.adv_funds[key] = fund
+                self.funds.add(key, fund)
+            deleted = [key for key in self.adv_funds if key not in fund_keys]
+            for key in deleted:
+                self.funds.remove(key, self.adv_funds.pop(key))
+            self.adviser_map = {str(adv['crd']): adv for adv in advisers if adv.get('crd')}
+            self.watermarks = watermarks
+            self.refreshed_at = datetime.utcnow().isoformat()
+            self.refreshes += 1
+        return {'filings': len(new_filings), 'funds': len(changed_funds), 'deleted_funds': len(deleted),
+                'advisers': len(advisers)}
+
+    def refresh_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            started = time.monotonic()
+            try:
+                changed = self.refresh()
+            except Exception as e:  # keep serving the index we have
+                print(f"[SERVICE] refresh failed: {e}", file=sys.stderr, flush=True)
+            else:
+                print(f"[SERVICE] refreshed in {time.monotonic() - started:.1f}s: {changed['filings']} new filings, "
+                      f"{changed['funds']} new or updated funds, {changed['deleted_funds']} deleted funds",
+                      file=sys.stderr, flush=True)
+
+    def health(self):
+        with self._lock:
+            return {
+                'filings': len(self.formd),
+                'funds': len(self.adv_funds),
+                'advisers': len(self.adviser_map),
+                'watermarks': dict(self.watermarks),
+                'loaded_at': self.loaded_at,
+                'refreshed_at': self.refreshed_at,
+                'refreshes': self.refreshes,
+                'matched': self.matched,
+            }
+
+
+def make_server(service, bind, port):
+    """The HTTP server of serve(), not started yet (port 0 = any free port)."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive: the scraper reuses one connection
+        disable_nagle_algorithm = True  # else each small response waits on the client's delayed ACK (~40 ms)
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/health':
+                self._send(404, {'error': 'not found'})
+            else:
+                self._send(200, service.health())
+
+        def do_POST(self):
+            if self.path.split('?', 1)[0] != '/match':
+                self._send(404, {'error': 'not found'})
+                return
+            try:
+                filings = parse_filings(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+            except ValueError as e:
+                self._send(400, {'error': f'bad request: {e}'})
+                return
+            try:
+                matches = service.match_many(filings)
+            except Exception as e:
+                self._send(500, {'error': f'match failed: {e!r}'})
+                return
+            self._send(200, {'matches': matches})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # one request per scraped filing - not worth a log line each
+
+    return http.server.ThreadingHTTPServer((bind, port), Handler)
+
+
+def serve(service, bind, port):
+    """POST /match (a filing or a list of filings) -> {"matches": [...]}; GET /health."""
+    server = make_server(service, bind, port)
+    print(f"[SERVICE] serving http://{bind}:{server.server_address[1]}/match", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def parse_filings(text):
+    """A request body -> list of filing dicts; ValueError unless it is a filing object or a list of them."""
+    body = json.loads(text)
+    filings = body if isinstance(body, list) else [body]
+    if not all(isinstance(filing, dict) for filing in filings):
+        raise ValueError('expected a filing object or a list of them')
+    return filings
+
+
+def match_stream(service, lines, out):
+    """
+    JSON lines: a filing (or a list of filings) per input line, a JSON list of
+    match rows per output line. A line that fails gets an {"error": ...} line
+    instead - the stream keeps going.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            filings = parse_filings(line)
+        except ValueError as e:
+            result = {'error': f'bad request: {e}'}
+        else:
+            try:
+                result = service.match_many(filings)
+            except Exception as e:
+                result = {'error': f'match failed: {e!r}'}
+        out.write(json.dumps(result, default=str) + '\n')
+        out.flush()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--state-dir', default=xref.STATE_DIR, help=f'Matcher state to load (default {xref.STATE_DIR})')
+    parser.add_argument('--max-state-age-days', type=int, default=28,
+                        help='Ignore an older state and build the index from a full fetch (default 28)')
+    parser.add_argument('--refresh-interval', type=float, default=DEFAULT_REFRESH_INTERVAL,
+                        help=f'Seconds between index refreshes, 0 = never (default {DEFAULT_REFRESH_INTERVAL})')
+    parser.add_argument('--source', choices=['supabase', 'snapshot', 'postgres'],
+                        help='Where to read the tables (default: env XREF_SOURCE or supabase)')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='Serve HTTP on PORT instead of reading stdin')
+    parser.add_argument('--bind', default='127.0.0.1', help='Address for --serve (default 127.0.0.1)')
+    args = parser.parse_args()
+
+    if args.source:
+        xref.SOURCE = xref.sources.open_source(args.source)
+    # The matcher's progress output (loading, refreshes) goes to stderr - in
+    # stdin mode stdout carries only match rows
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    started = time.monotonic()
+    service = MatchService.load(args.state_dir, args.max_state_age_days)
+    health = service.health()
+    print(f"[SERVICE] {health['funds']} funds, {health['filings']} filings indexed "
+          f"in {time.monotonic() - started:.1f}s", file=sys.stderr, flush=True)
+
+    if args.refresh_interval > 0:
+        threading.Thread(target=service.refresh_forever, args=(args.refresh_interval,), daemon=True).start()
+    if args.serve is not None:
+        return serve(service, args.bind, args.serve)
+    return match_stream(service, sys.stdin, out)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
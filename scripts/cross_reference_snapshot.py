@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Local snapshot of the cross-reference source tables.
+
+compute_cross_reference.py saves what it fetches from form_d_filings,
+funds_enriched and advisers_enriched (plus the match set it published) into a
+single SQLite file. `--from-snapshot` then rebuilds the matches from that file
+with no Supabase round-trips, e.g. to see what a change to
+normalize_name_for_match does before running it for real:
+
+    python scripts/compute_cross_reference.py --from-snapshot --dry-run
+
+`--source snapshot` goes one step further and serves the snapshot through the
+same client interface as Supabase (SnapshotTable), so the whole job, store
+included, runs locally unchanged.
+
+Why SQLite and not Parquet: it is in the standard library, so the weekly job
+and local runs need no extra dependencies.
+
+Each table is stored with untyped columns (no SQLite type affinity, so values
+come back exactly as stored). A _snapshot_meta row per table records the key
+column, row count, watermark (max key), fetch time, per-column kinds
+(booleans and JSON values need converting back) and a SHA-256 checksum of the
+rows, which is re-checked on load.
+
+Usage:
+    python scripts/cross_reference_snapshot.py [--path FILE]   # show what a snapshot holds
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+DEFAULT_SNAPSHOT_PATH = os.environ.get('XREF_SNAPSHOT_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '.cross_reference_snapshot', 'snapshot.sqlite'
+)
+
+
+class SnapshotError(Exception):
+    """Snapshot missing a table, or its contents don't match the recorded checksum."""
+
+
+def _connect(path, check_same_thread=True):
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+    # WAL: a table can be streamed out while another one is being written
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS _snapshot_meta (
+            table_name TEXT PRIMARY KEY,
+            key_column TEXT,
+            row_count INTEGER,
+            watermark TEXT,
+            checksum TEXT,
+            columns TEXT,
+            fetched_at TEXT
+        )
+    ''')
+    return conn
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _encode(value):
+    """SQLite has no booleans or JSON - store them as 0/1 and JSON text."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+class TableWriter:
+    """
+    Stream rows into one snapshot table, page by page.
+
+    Pages go into a staging table in short transactions (so several writers
+    and readers can interleave on one file); close() swaps the staging table
+    in and writes the meta row in one transaction, so the previous copy stays
+    intact until then. Column kinds, checksum and watermark are accumulated as
+    pages arrive, so the rows never have to be held in memory at once.
+
+        with TableWriter(path, 'funds_enriched', 'reference_id') as writer:
+            for page in pages:
+                writer.add(page)
+            writer.close()
+
+    Leaving the with block without close() - an exception, a generator that
+    is closed early - discards the staging table. Without a with block, the
+    caller has to close(commit=False) on failure itself.
+    """
+
+    def __init__(self, path, table, key_column):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.table = table
+        self.key_column = key_column
+        self.columns = None
+        self.kinds = {}
+        self.row_count = 0
+        self.watermark = None
+        self._digest = hashlib.sha256()
+        self._staging = _quote('_staging_' + table)
+        self._conn = _connect(path)
+        with self._conn:
+            self._conn.execute(f'DROP TABLE IF EXISTS {self._staging}')
+
+    def add(self, rows):
+        if not rows:
+            return
+        if self.columns is None:
+            # Columns come from the first page - PostgREST pages share one shape
+            self.columns = list(rows[0])
+            col_sql = ', '.join(_quote(col) for col in self.columns) or '_empty'
+            # Untyped columns = no affinity, values round-trip unchanged
+            with self._conn:
+                self._conn.execute(f'CREATE TABLE {self._staging} ({col_sql})')
+
+        encoded = []
+        for row in rows:
+            # Every row gets every column - that is also what load_table() returns
+            row = {col: row.get(col) for col in self.columns}
+            for col, value in row.items():
+                if isinstance(value, bool):
+                    self.kinds.setdefault(col, 'bool')
+                elif isinstance(value, (dict, list)):
+                    self.kinds[col] = 'json'
+            self._digest.update(json.dumps(row, sort_keys=True, default=str).encode('utf-8'))
+            self._digest.update(b'\n')
+            key = row.get(self.key_column)
+            if key is not None and (self.watermark is None or key > self.watermark):
+                self.watermark = key
+            encoded.append([_encode(row[col]) for col in self.columns])
+
+        placeholders = ', '.join('?' for _ in self.columns)
+        with self._conn:
+            self._conn.executemany(f'INSERT INTO {self._staging} VALUES ({placeholders})', encoded)
+        self.row_count += len(rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=False)
+
+    def close(self, commit=True):
+        """
+        Swap the table in with its meta row (or discard it with commit=False).
+        Only the first call counts - later ones do nothing.
+        """
+        if self._conn is None:
+            return
+        try:
+            if not commit:
+                with self._conn:
+                    self._conn.execute(f'DROP TABLE IF EXISTS {self._staging}')
+                return
+            kinds = {col: self.kinds.get(col, 'value') for col in self.columns or []}
+            with self._conn:
+                # Explicit BEGIN - sqlite3 would otherwise autocommit each DDL statement
+                self._conn.execute('BEGIN')
+                if self.columns is None:
+                    self._conn.execute(f'CREATE TABLE {self._staging} (_empty)')
+                self._conn.execute(f'DROP TABLE IF EXISTS {_quote(self.table)}')
+                self._conn.execute(f'ALTER TABLE {self._staging} RENAME TO {_quote(self.table)}')
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO _snapshot_meta VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (self.table, self.key_column, self.row_count, json.dumps(self.watermark),
+                     self._digest.hexdigest(), json.dumps(kinds), datetime.utcnow().isoformat())
+                )
+            print(f"  Snapshot: saved {self.row_count} {self.table} rows to {self.path}")
+        finally:
+            self._conn.close()
+            self._conn = None
+
+
+class SnapshotTable:
+    """
+    One snapshot table behind the table interface of cross_reference_fake.py,
+    so a FakeClient can serve it the way PostgREST serves the live table
+    (cross_reference_sources.SnapshotSource). Filters, order and limit become
+    SQL; the key column gets an index on first use, so keyset pages don't sort
+    the whole table.
+
+    The connection may be used from several threads - FakeClient runs one
+    request at a time.
+    """
+
+    _OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=', 'eq': '=', 'ilike': 'LIKE'}
+
+    def __init__(self, path, table):
+        if not os.path.exists(path):
+            raise SnapshotError(f"no snapshot at {path}")
+        self.path = path
+        self.table = table
+        self._conn = _connect(path, check_same_thread=False)
+        meta = self._conn.execute(
+            'SELECT key_column, columns FROM _snapshot_meta WHERE table_name = ?', (table,)
+        ).fetchone()
+        if meta is None:
+            self._conn.close()
+            raise SnapshotError(f"snapshot {path} has no {table} table")
+        self.key_column = meta[0]
+        self.kinds = json.loads(meta[1])
+        if self.key_column in self.kinds:
+            try:
+                with self._conn:
+                    self._conn.execute(f'CREATE INDEX IF NOT EXISTS {_quote("_key_" + table)} '
+                                       f'ON {_quote(table)} ({_quote(self.key_column)})')
+            except sqlite3.OperationalError:
+                pass  # read-only file - pages still come back right, just slower
+
+    def __len__(self):
+        return self._conn.execute(f'SELECT COUNT(*) FROM {_quote(self.table)}').fetchone()[0]
+
+    def _column(self, column):
+        if column not in self.kinds:
+            raise SnapshotError(f"{self.table} has no column {column!r} in {self.path}")
+        return _quote(column)
+
+    def select(self, filters, columns=None, order=None, desc=False, offset=0, limit=None, count=False):
+        if not self.kinds:
+            return [], (0 if count else None)
+        where, params = [], []
+        for op, column, value in filters:
+            if op == 'in_':
+                values = list(value)
+                where.append(f"{self._column(column)} IN ({', '.join('?' for _ in values) or 'NULL'})")
+                params.extend(_encode(v) for v in values)
+            else:
+                where.append(f'{self._column(column)} {self._OPERATORS[op]} ?')
+                params.append(_encode(value))
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ''
+
+        total = None
+        if count:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM {_quote(self.table)}{where_sql}', params).fetchone()[0]
+
+        names = [column for column in columns if column in self.kinds] if columns else list(self.kinds)
+        select_sql = ', '.join(_quote(column) for column in names) or 'NULL'
+        order_sql = f" ORDER BY {self._column(order)}{' DESC' if desc else ''}" if order else ' ORDER BY rowid'
+        rows = self._conn.execute(
+            f'SELECT {select_sql} FROM {_quote(self.table)}{where_sql}{order_sql} LIMIT ? OFFSET ?',
+            params + [-1 if limit is None else limit, offset],
+        ).fetchall()
+
+        decoders = {'json': json.loads, 'bool': bool}
+        data = []
+        for values in rows:
+            row = dict.fromkeys(columns or ())
+            for column, value in zip(names, values):
+                decode = decoders.get(self.kinds[column])
+                row[column] = decode(value) if decode and value is not None else value
+            data.append(row)
+        return data, total
+
+    def close(self):
+        self._conn.close()
+
+
+def save_table(path, table, rows, key_column):
+    """Replace one table in the snapshot (single transaction)."""
+    with TableWriter(path, table, key_column) as writer:
+        writer.add(rows)
+        writer.close()
+
+
+def iter_table(path, table, page_size=1000, verify=True):
+    """
+    Yield one snapshot table as pages of rows, in the order it was fetched.
+
+    The checksum is verified as the pages go by; a mismatch raises
+    SnapshotError after the last page, before the caller can finish up.
+    """
+    if not os.path.exists(path):
+        raise SnapshotError(f"no snapshot at {path}")
+    conn = _connect(path)
+    try:
+        meta = conn.execute(
+            'SELECT row_count, checksum, columns FROM _snapshot_meta WHERE table_name = ?', (table,)
+        ).fetchone()
+        if meta is None:
+            raise SnapshotError(f"snapshot {path} has no {table} table")
+        row_count, checksum, kinds = meta[0], meta[1], json.loads(meta[2])
+        columns = list(kinds)
+        decoders = {
+            'json': json.loads,
+            'bool': bool,
+        }
+        digest = hashlib.sha256()
+        seen = 0
+
+        if columns:
+            cursor = conn.execute(f'SELECT * FROM {_quote(table)} ORDER BY rowid')
+            while True:
+                batch = cursor.fetchmany(page_size)
+                if not batch:
+                    break
+                page = []
+                for values in batch:
+                    row = {}
+                    for col, value in zip(columns, values):
+                        decode = decoders.get(kinds[col])
+                        row[col] = decode(value) if decode and value is not None else value
+                    if verify:
+                        digest.update(json.dumps(row, sort_keys=True, default=str).encode('utf-8'))
+                        digest.update(b'\n')
+                    page.append(row)
+                seen += len(page)
+                yield page
+    finally:
+        conn.close()
+
+    if seen != row_count:
+        raise SnapshotError(f"{table}: {seen} rows in snapshot, meta says {row_count}")
+    if verify and digest.hexdigest() != checksum:
+        raise SnapshotError(f"{table}: checksum mismatch - snapshot is corrupt or was edited")
+    print(f"  Snapshot: loaded {seen} {table} rows from {path}")
+
+
+def load_table(path, table, verify=True):
+    """Load one table from the snapshot, in the order it was fetched."""
+    rows = []
+    for page in iter_table(path, table, verify=verify):
+        rows.extend(page)
+    return rows
+
+
+def snapshot_info(path):
+    """Per-table metadata: {table: {key_column, row_count, watermark, checksum, fetched_at}}."""
+    if not os.path.exists(path):
+        return {}
+    conn = _connect(path)
+    try:
+        info = {}
+        for table, key_column, row_count, watermark, checksum, _, fetched_at in conn.execute(
+                'SELECT * FROM _snapshot_meta ORDER BY table_name'):
+            info[table] = {
+                'key_column': key_column,
+                'row_count': row_count,
+                'watermark': json.loads(watermark),
+                'checksum': checksum,
+                'fetched_at': fetched_at,
+            }
+        return info
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the contents of a cross-reference snapshot')
+    parser.add_argument('--path', default=DEFAULT_SNAPSHOT_PATH, help=f'Snapshot file (default {DEFAULT_SNAPSHOT_PATH})')
+    args = parser.parse_args()
+
+    info = snapshot_info(args.path)
+    if not info:
+        print(f"No snapshot at {args.path}")
+        return 1
+    print(f"Snapshot {args.path}")
+    for table, meta in info.items():
+        print(f"  {table:28} {meta['row_count']:>9} rows  {meta['key_column']} <= {meta['watermark']}  "
+              f"fetched {meta['fetched_at']}  sha256 {meta['checksum'][:12]}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
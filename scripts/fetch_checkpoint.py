@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Page checkpoints for keyset fetches, so a failed run resumes instead of
+starting over.
+
+Every fetched page is appended to a spool file of its query (one JSON line:
+the page's rows, the last key and the running row count) before it is handed
+on. A later run asking for the same query replays the spooled pages and
+continues the keyset walk after the last key:
+
+    store = CheckpointStore(os.path.join(state_dir, 'fetch'))
+    spool = store.spool(['funds_enriched', select, 'reference_id', 0, filters])
+    for page in spool.replay():
+        ...                                   # pages of the failed run
+    ... fetch from spool.last_id, spool.append(page, last_id) per page ...
+
+A plan (the count and key ranges of a parallel fetch) is kept the same way, so
+a resumed fetch walks the same ranges as the run that failed.
+
+Checkpoints only make sense for a retry soon after a failure: files older
+than max_age_hours are dropped when the store is opened, and
+compute_cross_reference.py clears the store after a successful run. A torn
+last line (the process died mid-write) is cut off on replay.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+DEFAULT_MAX_AGE_HOURS = 12
+
+
+def checkpoint_name(key):
+    """File name stem of a query: its table plus a hash of the whole query."""
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+    return f'{key[0]}-{digest}'
+
+
+class Spool:
+    """The spooled pages of one keyset query."""
+
+    def __init__(self, path):
+        self.path = path
+        self.last_id = None
+        self.rows = 0
+        self.pages = 0
+        self.done = False
+        self._file = None
+
+    def replay(self):
+        """Yield the pages saved so far (sets last_id / rows); a torn tail is truncated away."""
+        if not os.path.exists(self.path):
+            return
+        good = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                good += len(line)
+                if entry.get('done'):
+                    self.done = True
+                    continue
+                self.last_id = entry['last_id']
+                self.rows = entry['rows']
+                self.pages += 1
+                yield entry['page']
+        if good != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+
+    def append(self, page, last_id):
+        self.last_id = last_id
+        self.rows += len(page)
+        self.pages += 1
+        self._write({'last_id': last_id, 'rows': self.rows, 'page': page})
+
+    def finish(self):
+        """Mark the walk complete - a replay then needs no further requests."""
+        self.done = True
+        self._write({'done': True, 'rows': self.rows})
+
+    def _write(self, entry):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(entry, default=str) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CheckpointStore:
+    """A directory of spools and plans."""
+
+    def __init__(self, directory, max_age_hours=DEFAULT_MAX_AGE_HOURS):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        cutoff = time.time() - max_age_hours * 3600
+        stale = [name for name in os.listdir(directory)
+                 if os.path.getmtime(os.path.join(directory, name)) < cutoff]
+        for name in stale:
+            os.remove(os.path.join(directory, name))
+        if stale:
+            print(f"  Dropped {len(stale)} fetch checkpoints older than {max_age_hours}h")
+
+    def spool(self, key):
+        return Spool(os.path.join(self.directory, checkpoint_name(key) + '.jsonl'))
+
+    def load_plan(self, key):
+        path = os.path.join(self.directory, checkpoint_name(key) + '.plan.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_plan(self, key, plan):
+        path = os.path.join(self.directory, checkpoint_name(key) + '.plan.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(plan, f, default=str)
+        os.replace(path + '.tmp', path)
+
+    def clear(self):
+        """Remove every checkpoint (the fetches they belong to have been used)."""
+        names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+        for name in names:
+            os.remove(os.path.join(self.directory, name))
+        return len(names)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+In-memory index of Form D filings for the cross-reference matcher.
+
+The matcher used to keep one filing per file number / normalized entity name
+in a plain dict, so every other filing for the same key (amendments, series
+funds sharing a name) was dropped. FormDIndex keeps all of them:
+
+    filings      one pool of compact FormDFiling records
+    by_file_num  FilingIndex: file_num        -> pool positions
+    by_name      FilingIndex: normalized name -> pool positions
+
+Within a key, filings are kept sorted by (filing_date, id) in three parallel
+arrays: day numbers, ids and pool positions. A filing without an id (one not
+stored in form_d_filings yet, e.g. a scraped filing handed to the match
+service) sorts after every stored filing of its day. A key with a single
+filing (the common case) is stored as a bare int position. Queries:
+
+    latest(key)               O(1)      - the filing the matcher uses
+    window(key, start, end)   O(log n)  - filings dated start..end (bisect)
+    count(key)                O(1)      - collisions: filings sharing the key
+"""
+
+import bisect
+from array import array
+from datetime import date
+
+# Form D columns used for matching and for the match rows we write
+FORMD_FIELDS = ('id', 'accessionnumber', 'entityname', 'filing_date', 'totalofferingamount',
+                'totalamountsold', 'sale_date', 'investmentfundtype', 'file_num')
+
+# Sort rank of a filing without an id: after every real id (ids are bigint, so below this)
+NO_ID = (1 << 63) - 1
+
+
+def date_ordinal(value):
+    """Day number of a 'YYYY-MM-DD...' date string; 0 (sorts first) if missing or unparseable."""
+    if not value:
+        return 0
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        return 0
+
+
+def sort_key(filing):
+    """(day number of filing_date, id rank): the order of a key's filings, latest last."""
+    filing_id = filing.get('id')
+    if filing_id is None:
+        filing_id = NO_ID
+    elif not 0 <= filing_id < NO_ID:
+        raise ValueError(f"Form D filing id {filing_id!r} is outside 0..2**63-2")
+    return date_ordinal(filing.get('filing_date')), filing_id
+
+
+class FormDFiling:
+    """One form_d_filings row, slotted. get() keeps it interchangeable with a plain row."""
+
+    __slots__ = FORMD_FIELDS
+
+    def __init__(self, row):
+        for field in FORMD_FIELDS:
+            setattr(self, field, row.get(field))
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def to_list(self):
+        return [getattr(self, field) for field in FORMD_FIELDS]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(dict(zip(FORMD_FIELDS, values)))
+
+
+class FilingIndex:
+    """
+    key -> pool positions of its filings, sorted by sort key.
+
+    order: position -> sort key, used when a single-filing key gets a second one
+    """
+
+    def __init__(self, order):
+        self._order = order
+        # key -> position (one filing) or (array('l') days, array('q') ids, array('l') positions)
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        return self._entries.keys()
+
+    def add(self, key, position, key_order):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = position
+            return
+        if isinstance(entry, int):
+            day, filing_id = self._order(entry)
+            entry = self._entries[key] = (array('l', [day]), array('q', [filing_id]), array('l', [entry]))
+        days, ids, positions = entry
+        day, filing_id = key_order
+        # Same day: order by id within that day's run
+        lo = bisect.bisect_left(days, day)
+        i = bisect.bisect_right(ids, filing_id, lo, bisect.bisect_right(days, day, lo))
+        days.insert(i, day)
+        ids.insert(i, filing_id)
+        positions.insert(i, position)
+
+    def latest(self, key):
+        """Position of the filing with the latest (filing_date, id), or None."""
+        entry = self._entries.get(key)
+        if entry is None or isinstance(entry, int):
+            return entry
+        return entry[2][-1]
+
+    def count(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0
+        return 1 if isinstance(entry, int) else len(entry[2])
+
+    def positions(self, key):
+        """All positions for key, oldest first."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return []
+        return [entry] if isinstance(entry, int) else list(entry[2])
+
+    def window(self, key, start=None, end=None):
+        """Positions of filings dated start..end inclusive (date or 'YYYY-MM-DD', None = open)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return []
+        if isinstance(entry, int):
+            days, positions = [self._order(entry)[0]], [entry]
+        else:
+            days, _, positions = entry
+        lo = 0 if start is None else bisect.bisect_left(days, self._day(start))
+        hi = len(days) if end is None else bisect.bisect_left(days, self._day(end) + 1)
+        return list(positions[lo:hi])
+
+    def collisions(self):
+        """Number of keys shared by more than one filing."""
+        return sum(1 for entry in self._entries.values() if not isinstance(entry, int))
+
+    def to_state(self):
+        return {key: self.positions(key) for key in self._entries}
+
+    @staticmethod
+    def _day(value):
+        return value.toordinal() if isinstance(value, date) else date_ordinal(value)
+
+
+class FormDIndex:
+    """
+    All Form D filings, indexed by file number and by normalized entity name.
+
+        index = FormDIndex()
+        index.add(filing, file_num, normalized_name)
+        index.latest_by_file_num('021-123456')   # -> FormDFiling or None
+    """
+
+    def __init__(self):
+        self.filings = []
+        self.by_file_num = FilingIndex(self._order)
+        self.by_name = FilingIndex(self._order)
+
+    def __len__(self):
+        return len(self.filings)
+
+    def _order(self, position):
+        return sort_key(self.filings[position])
+
+    def add(self, filing, file_num, normalized_name):
+        """
+        Add one filing under its keys (either may be empty).
+
+        Returns (file_num_changed, name_changed): whether the latest filing
+        for that key is now this one - incremental mode rematches on those.
+        """
+        if not isinstance(filing, FormDFiling):
+            filing = FormDFiling(filing)
+        position = len(self.filings)
+        self.filings.append(filing)
+        order = sort_key(filing)
+        changed = []
+        for index, key in ((self.by_file_num, file_num), (self.by_name, normalized_name)):
+            if not key:
+                changed.append(False)
+                continue
+            index.add(key, position, order)
+            changed.append(index.latest(key) == position)
+        return tuple(changed)
+
+    def latest_by_file_num(self, file_num):
+        position = self.by_file_num.latest(file_num)
+        return None if position is None else self.filings[position]
+
+    def latest_by_name(self, normalized_name):
+        position = self.by_name.latest(normalized_name)
+        return None if position is None else self.filings[position]
+
+    def filings_in_window(self, index, key, start=None, end=None):
+        """Filings for key in by_file_num / by_name dated start..end, oldest first."""
+        return [self.filings[position] for position in index.window(key, start, end)]
+
+    def to_state(self):
+        return {
+            'filings': [filing.to_list() for filing in self.filings],
+            'by_file_num': self.by_file_num.to_state(),
+            'by_name': self.by_name.to_state(),
+        }
+
+    def __getstate__(self):
+        # Pickled once per match worker process: plain value lists instead of
+        # slotted objects, and the sorted key entries as they are (no re-sort)
+        return ([filing.to_list() for filing in self.filings],
+                self.by_file_num._entries, self.by_name._entries)
+
+    def __setstate__(self, state):
+        filings, by_file_num, by_name = state
+        self.__init__()
+        self.filings = [FormDFiling.from_list(values) for values in filings]
+        self.by_file_num._entries = by_file_num
+        self.by_name._entries = by_name
+
+    @classmethod
+    def from_state(cls, data):
+        index = cls()
+        index.filings = [FormDFiling.from_list(values) for values in data['filings']]
+        for target, entries in ((index.by_file_num, data['by_file_num']), (index.by_name, data['by_name'])):
+            for key, positions in entries.items():
+                for position in positions:
+                    target.add(key, position, index._order(position))
+        return index
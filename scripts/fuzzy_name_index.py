@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Blocking index for the optional fuzzy match tier of compute_cross_reference.py.
+
+Exact matching (file number, then normalized name) stays the default. With
+--fuzzy, ADV funds that neither tier matched are looked up here: the
+normalized Form D entity names are indexed by character trigram, and a fund
+is only scored against the few names that share its rarest trigrams.
+
+Scoring is the Dice coefficient of the two trigram sets:
+
+    score = 2 * |A & B| / (|A| + |B|)
+
+For a threshold t, any name scoring >= t must share at least ceil(j * |A|)
+trigrams with the query, where j = t / (2 - t) is the matching Jaccard bound.
+So it must contain one of the query's |A| - ceil(j * |A|) + 1 rarest
+trigrams (prefix filtering). Only the posting lists of those rare trigrams
+are read, which keeps a lookup independent of the Form D table size instead
+of ADV x Form D. A length filter drops candidates whose trigram count can't
+reach the threshold before the intersection is computed.
+
+Names that differ only in a series marker ("FUND II" vs "FUND III",
+"FUND 2019" vs "FUND 2020") score high but are different funds, so the
+series tokens (numbers, roman numerals, single letters) must be identical.
+"""
+
+import math
+import re
+
+DEFAULT_THRESHOLD = 0.9
+
+_ROMAN_NUMERAL = re.compile(r'^(X{0,3})(IX|IV|V?I{0,3})$')
+
+
+def trigrams(name):
+    """Character trigrams of a normalized name, padded so word edges count."""
+    padded = f'  {name} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def series_tokens(name):
+    """Tokens that tell numbered funds apart: digits, roman numerals, single letters."""
+    return frozenset(
+        token for token in name.split()
+        if token.isdigit() or len(token) == 1 or _ROMAN_NUMERAL.match(token)
+    )
+
+
+class FuzzyNameIndex:
+    """
+    Trigram inverted index over normalized names.
+
+        index = FuzzyNameIndex(formd_name_map, threshold=0.9)
+        index.lookup('TIGER GLOBAL PARTNERS FUND')   # -> (name, score) or None
+
+    Ties on score go to the alphabetically first name, so results don't
+    depend on insertion order.
+    """
+
+    def __init__(self, names=(), threshold=DEFAULT_THRESHOLD):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"fuzzy threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.jaccard = threshold / (2 - threshold)
+        self.names = []
+        self.grams = []
+        self.series = []
+        self.postings = {}
+        for name in sorted(names):
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        grams = trigrams(name)
+        name_id = len(self.names)
+        self.names.append(name)
+        self.grams.append(grams)
+        self.series.append(series_tokens(name))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(name_id)
+
+    def candidates(self, grams):
+        """Ids of indexed names sharing one of the query's rarest trigrams."""
+        postings = self.postings
+        min_overlap = math.ceil(self.jaccard * len(grams) - 1e-9)
+        prefix = sorted(grams, key=lambda gram: len(postings.get(gram, ())))
+        found = set()
+        for gram in prefix[:len(grams) - min_overlap + 1]:
+            found.update(postings.get(gram, ()))
+        return found
+
+    def lookup(self, name):
+        """Best (indexed_name, score) with score >= threshold, or None."""
+        if not name:
+            return None
+        grams = trigrams(name)
+        size = len(grams)
+        min_size = self.jaccard * size
+        max_size = size / self.jaccard
+        series = series_tokens(name)
+
+        best = None
+        for name_id in self.candidates(grams):
+            other = self.grams[name_id]
+            if not min_size <= len(other) <= max_size:
+                continue
+            score = 2 * len(grams & other) / (size + len(other))
+            if score < self.threshold or self.series[name_id] != series:
+                continue
+            candidate = (-score, self.names[name_id])
+            if best is None or candidate < best:
+                best = candidate
+        if best is None:
+            return None
+        return best[1], round(-best[0], 4)
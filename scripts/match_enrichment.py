@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Post-match enrichment: a batch of (ADV fund, Form D filing) matches in, the
+cross_reference_matches rows out.
+
+Runs column by column over the whole batch (a page of matches) instead of
+row by row:
+
+    fund types      every distinct fund_type / investmentfundtype string is
+                    classified once into a bit set (PE / VC / HEDGE / typed);
+                    the batch is then two uint8 arrays
+    discrepancies   each rule in RULES is one NumPy expression over those
+                    arrays; the rule bits are combined into an issue mask per
+                    row and the issues text is a lookup into a table with a
+                    precomputed string for every mask
+    latest year     gav_mask (bit k = a non-zero GAV in GAV_YEARS[k]) is an
+                    int array; the highest set bit is np.frexp's exponent
+    overdue flag    one comparison on the year array
+    adviser join    adviser names are looked up once per distinct CRD in the
+                    batch and gathered by index
+    computed_at     one value for the run, passed in
+
+A new discrepancy rule is one more line in RULES - a vector operation per
+batch, not another pass of string tests per row.
+"""
+
+import sys
+
+import numpy as np
+
+GAV_YEARS = range(2011, 2026)
+OVERDUE_BEFORE = 2024  # latest ADV year before this = overdue (no filing in 2+ years)
+
+# Fund type classification bits
+TYPED = 1           # non-empty type string
+PE = 2              # contains PRIVATE EQUITY
+VC = 4              # contains VENTURE
+HEDGE = 8           # contains HEDGE
+
+# Discrepancy rules, in the order they appear in the issues text:
+# (issue text, rule over the ADV and Form D type bit arrays -> bool array)
+RULES = (
+    ('Fund type mismatch: PE vs VC',
+     lambda adv, formd: ((adv & PE > 0) & (formd & VC > 0)) | ((adv & VC > 0) & (formd & PE > 0))),
+    ('Hedge fund classification mismatch',
+     lambda adv, formd: (adv & HEDGE > 0) != (formd & HEDGE > 0)),
+)
+
+# Issue mask -> issues text, for every combination of rules
+ISSUE_TEXT = np.array([' | '.join(text for bit, (text, _) in enumerate(RULES) if mask >> bit & 1)
+                       for mask in range(1 << len(RULES))], dtype=object)
+
+_type_bits = {None: 0, '': 0}
+
+
+def type_bits(value):
+    """Classification bits of a fund type string (memoized - there are only a few dozen distinct ones)."""
+    bits = _type_bits.get(value)
+    if bits is None:
+        upper = value.upper()
+        bits = TYPED
+        if 'PRIVATE EQUITY' in upper:
+            bits |= PE
+        if 'VENTURE' in upper:
+            bits |= VC
+        if 'HEDGE' in upper:
+            bits |= HEDGE
+        _type_bits[sys.intern(value)] = bits
+    return bits
+
+
+def gav_year_mask(row):
+    """Pack the gav_2011..gav_2025 columns into a bitmask (bit 0 = 2011) of years with a non-zero GAV."""
+    mask = 0
+    for bit, year in enumerate(GAV_YEARS):
+        if row.get(f'gav_{year}'):
+            mask |= 1 << bit
+    return mask
+
+
+def _mask(fund):
+    mask = fund.get('gav_mask')
+    return gav_year_mask(fund) if mask is None else mask
+
+
+def issue_masks(adv_types, formd_types):
+    """Bit k set where RULES[k] fires. Both sides must have a type for any rule to apply."""
+    adv = np.fromiter((type_bits(t) for t in adv_types), dtype=np.uint8, count=len(adv_types))
+    formd = np.fromiter((type_bits(t) for t in formd_types), dtype=np.uint8, count=len(formd_types))
+    masks = np.zeros(len(adv), dtype=np.int64)
+    for bit, (_, rule) in enumerate(RULES):
+        masks |= rule(adv, formd).astype(np.int64) << bit
+    masks[(adv & formd & TYPED) == 0] = 0
+    return masks
+
+
+def latest_years(gav_masks):
+    """Latest year with a non-zero GAV per mask (None where there is none), and the overdue flags."""
+    masks = np.asarray(gav_masks, dtype=np.int64)
+    has_year = masks > 0
+    # frexp(m) = (f, e) with m = f * 2**e, 0.5 <= f < 1 -> e - 1 is the highest set bit
+    years = np.frexp(masks)[1] - 1 + GAV_YEARS[0]
+    overdue = has_year & (years < OVERDUE_BEFORE)
+    # None (SQL NULL) where there is no GAV history, as the row-by-row version wrote
+    years_out = np.where(has_year, years.astype(object), None)
+    overdue_out = np.where(has_year, overdue.astype(object), None)
+    return years_out.tolist(), overdue_out.tolist()
+
+
+def adviser_names(crds, adviser_map, key=None):
+    """adviser_map[key(crd)]['adviser_name'] for every CRD, looked up once per distinct CRD."""
+    names = {}
+    for crd in crds:
+        if crd not in names:
+            names[crd] = adviser_map.get(key(crd) if key else crd, {}).get('adviser_name')
+    return [names[crd] for crd in crds]
+
+
+def build_match_rows(matches, adviser_map, computed_at, adviser_key=None):
+    """
+    cross_reference_matches rows for a batch of matches.
+
+    matches: [(adv_fund, formd_filing, match_method, match_score)], adv_fund an
+             AdvFund or a dict with the same fields (incremental state)
+    adviser_map: crd -> advisers_enriched row
+    computed_at: the run's timestamp, the same for every row
+    adviser_key: maps a fund's adviser_entity_crd to the adviser_map key
+                 (str for the string-keyed map of the incremental state)
+    """
+    if not matches:
+        return []
+    funds = [m[0] for m in matches]
+    filings = [m[1] for m in matches]
+
+    masks = issue_masks([f.get('fund_type') for f in funds], [f.get('investmentfundtype') for f in filings])
+    issues = ISSUE_TEXT[masks].tolist()
+    years, overdue = latest_years([_mask(f) for f in funds])
+    crds = [f.get('adviser_entity_crd') for f in funds]
+    names = adviser_names(crds, adviser_map, adviser_key)
+
+    return [
+        {
+            'formd_accession': filing.get('accessionnumber'),
+            'formd_entity_name': filing.get('entityname'),
+            'formd_filing_date': filing.get('filing_date'),
+            'formd_offering_amount': filing.get('totalofferingamount'),
+            # Note: related_names, related_roles, formd_amount_sold require adding columns to cross_reference_matches table
+            'adv_fund_id': fund.get('fund_id'),
+            'adv_fund_name': fund.get('fund_name'),
+            'adv_filing_date': fund.get('updated_at'),
+            'adv_gav': fund.get('latest_gross_asset_value'),
+            'adviser_entity_crd': crd,
+            'adviser_entity_legal_name': name,
+            'match_score': score,  # 1.0 for the exact tiers, trigram similarity for fuzzy
+            'match_method': method,
+            'issues': issue,
+            'overdue_adv_flag': late,
+            'latest_adv_year': year,
+            'computed_at': computed_at,
+        }
+        for (fund, filing, method, score), crd, name, issue, late, year
+        in zip(matches, crds, names, issues, overdue, years)
+    ]
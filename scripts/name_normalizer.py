@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Fund / entity name normalization for the cross-reference matcher.
+
+normalize_name() is the single-pass implementation used by
+compute_cross_reference.normalize_name_for_match() (see its docstring for the
+matching rules). It gives exactly the same output as the original regex
+version, which is kept below as normalize_name_reference() to check against:
+
+    1 translate() call   - uppercase text, punctuation -> space
+    1 split()            - tokens; collapses and strips whitespace like \\s+ did
+    suffix trie          - entity suffixes are stripped from the token tail by
+                           walking a trie of reversed suffix tokens, instead of
+                           rescanning the whole suffix list after every strip
+
+NameMemo keeps normalized names on disk between runs (keyed by the raw name),
+so names that did not change since last week are not normalized again.
+
+Usage:
+    python scripts/name_normalizer.py                        # benchmark on synthetic names
+    python scripts/name_normalizer.py --snapshot-path FILE   # benchmark on snapshot names
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+# Bump when normalize_name() changes behaviour in a way the constants below
+# don't capture - it invalidates every on-disk memo.
+NORMALIZER_VERSION = 1
+
+PUNCTUATION = ',.\'"()-/'
+
+SUFFIX_WORDS = ['LLC', 'LP', 'L P', 'L L C', 'INC', 'LTD', 'CO', 'CORP', 'CORPORATION', 'COMPANY', 'LIMITED']
+
+FINGERPRINT = hashlib.sha256(
+    json.dumps([NORMALIZER_VERSION, PUNCTUATION, SUFFIX_WORDS]).encode('utf-8')
+).hexdigest()[:16]
+
+_PUNCTUATION_TABLE = str.maketrans({char: ' ' for char in PUNCTUATION})
+
+
+def _build_suffix_trie(suffixes):
+    """
+    Trie over reversed suffix tokens: 'L L C' is stored as C -> L -> L.
+    A node's '' entry holds the suffix's position in SUFFIX_WORDS (its priority).
+    """
+    trie = {}
+    for priority, suffix in enumerate(suffixes):
+        node = trie
+        for token in reversed(suffix.split()):
+            node = node.setdefault(token, {})
+        node.setdefault('', priority)
+    return trie
+
+
+_SUFFIX_TRIE = _build_suffix_trie(SUFFIX_WORDS)
+
+
+def _suffix_length(tokens, end):
+    """
+    Number of tokens of the entity suffix ending at tokens[end - 1], or 0.
+
+    At least one token must stay in front of the suffix (the original checked
+    endswith(' ' + suffix)). If several suffixes fit, the one listed first in
+    SUFFIX_WORDS wins, like the original loop.
+    """
+    node = _SUFFIX_TRIE
+    best = None
+    for i in range(end - 1, 0, -1):
+        node = node.get(tokens[i])
+        if node is None:
+            break
+        priority = node.get('')
+        if priority is not None and (best is None or priority < best[0]):
+            best = (priority, end - i)
+    return best[1] if best else 0
+
+
+def normalize_name(name):
+    """Normalize a fund/entity name for exact matching (single pass)."""
+    if not name:
+        return ''
+    tokens = str(name).upper().translate(_PUNCTUATION_TABLE).split()
+    # Fast path: most names don't end in a suffix token at all
+    if len(tokens) < 2 or tokens[-1] not in _SUFFIX_TRIE:
+        return ' '.join(tokens)
+    return ' '.join(_strip_suffixes(tokens))
+
+
+def _strip_suffixes(tokens):
+    """Drop entity suffixes (repeatedly) from the end of a token list."""
+    end = len(tokens)
+    while end > 1:
+        length = _suffix_length(tokens, end)
+        if not length:
+            break
+        end -= length
+    return tokens[:end]
+
+
+def normalize_names(names):
+    """
+    Normalize a list of names at once - same output as normalize_name() per
+    name, with the common no-suffix path inlined and lookups bound locally.
+    """
+    table = _PUNCTUATION_TABLE
+    suffix_tails = _SUFFIX_TRIE
+    join = ' '.join
+    result = []
+    append = result.append
+    for name in names:
+        if not name:
+            append('')
+            continue
+        tokens = (name if isinstance(name, str) else str(name)).upper().translate(table).split()
+        if len(tokens) < 2 or tokens[-1] not in suffix_tails:
+            append(join(tokens))
+        else:
+            append(join(_strip_suffixes(tokens)))
+    return result
+
+
+def normalize_name_reference(name):
+    """The original regex implementation - kept to check and benchmark normalize_name() against."""
+    if not name:
+        return ''
+
+    # 1. Uppercase
+    normalized = str(name).upper()
+
+    # 2. Remove ALL punctuation FIRST (before suffix removal)
+    # This handles cases like "FUND,L.P." where there's no space
+    normalized = re.sub(r'[,.\'"()\-/]', ' ', normalized)
+
+    # 3. Collapse whitespace
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+
+    # 4. Remove suffix WORDS at the end (handles "L P" from "L.P.", "L L C" from "L.L.C.")
+    # Process multiple times to handle compound suffixes
+    changed = True
+    while changed:
+        changed = False
+        for suffix in SUFFIX_WORDS:
+            if normalized.endswith(' ' + suffix):
+                normalized = normalized[:-len(suffix)-1].strip()
+                changed = True
+                break
+
+    return normalized
+
+
+class NameMemo:
+    """
+    Raw name -> normalized name, persisted between runs.
+
+    Only names looked up during this run are written back, so the file tracks
+    the current set of names instead of growing forever. A memo written with
+    different normalization rules (FINGERPRINT) is ignored.
+
+        memo = NameMemo.load(path)
+        memo.normalize('Tiger Fund, L.P.')
+        memo.save(path)
+    """
+
+    def __init__(self, previous=None):
+        self.previous = previous or {}
+        self.current = {}
+        self.hits = 0
+        self.misses = 0
+        # When a list: every name added to current is also appended here as
+        # (raw, normalized, was_hit) - lets a worker process report back
+        self.journal = None
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  Could not read name memo {path}: {e}")
+            return cls()
+        if data.get('fingerprint') != FINGERPRINT:
+            print(f"  Name memo {path} was built with other normalization rules - ignoring it")
+            return cls()
+        return cls(data['names'])
+
+    def normalize(self, name):
+        if not name:
+            return ''
+        key = name if isinstance(name, str) else str(name)
+        normalized = self.current.get(key)
+        if normalized is None:
+            normalized = self.previous.get(key)
+            was_hit = normalized is not None
+            if was_hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                normalized = normalize_name(key)
+            self.current[key] = normalized
+            if self.journal is not None:
+                self.journal.append((key, normalized, was_hit))
+        return normalized
+
+    def absorb(self, journal):
+        """Take over the names another process's memo looked up (see journal)."""
+        for key, normalized, was_hit in journal:
+            if key not in self.current:
+                self.current[key] = normalized
+                if was_hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+    def normalize_many(self, names):
+        return [self.normalize(name) for name in names]
+
+    def save(self, path, keep_unused=False):
+        """
+        Write atomically (tmp file + rename).
+
+        keep_unused: also keep names not looked up this run (for runs that only
+        see part of the names, like incremental mode)
+        """
+        names = {**self.previous, **self.current} if keep_unused else self.current
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({'fingerprint': FINGERPRINT, 'names': names}, f)
+        os.replace(tmp_path, path)
+        print(f"  Name memo: {self.hits} reused, {self.misses} normalized, saved {len(names)} to {path}")
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def synthetic_names(count, seed=0):
+    """Fund-like names with punctuation, odd spacing and (compound) suffixes."""
+    rnd = random.Random(seed)
+    words = ['Tiger', 'Global', 'Capital', 'Partners', 'Fund', 'Ventures', 'Opportunity', 'Growth',
+             'Credit', 'Real Estate', 'Master', 'Offshore', "O'Neil", 'A/B', '(Cayman)', 'II', 'IV', 'S.A.']
+    suffixes = ['', '', '', ', L.P.', ' LP', ' L.L.C.', ', LLC', ' Inc.', ' Ltd', ' Co', ' Corp.',
+                ' Limited', ' Company', ' LP LLC', ', Ltd. Co.', ' L P']
+    names = []
+    for i in range(count):
+        name = ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 5)))
+        name += f' {i % 997}' if rnd.random() < 0.5 else ''
+        name += rnd.choice(suffixes)
+        if rnd.random() < 0.1:
+            name = '  ' + name.replace(' ', '   ', 1) + ' \t'
+        names.append(name if rnd.random() < 0.7 else name.lower())
+    return names
+
+
+def snapshot_names(path):
+    """Form D entity names and ADV fund names from a cross-reference snapshot."""
+    import cross_reference_snapshot as snapshot
+    names = [f.get('entityname') for f in snapshot.load_table(path, 'form_d_filings')]
+    names += [f.get('fund_name') for f in snapshot.load_table(path, 'funds_enriched')]
+    return [name for name in names if name]
+
+
+def benchmark(names, repeat=3):
+    """Time each implementation over names; returns {label: names/sec}."""
+    memo = NameMemo()
+    memo.normalize_many(names)
+    warm_memo = NameMemo(memo.current)
+
+    cases = [
+        ('reference (regex + loop)', lambda: [normalize_name_reference(n) for n in names]),
+        ('normalize_name', lambda: [normalize_name(n) for n in names]),
+        ('normalize_names (batch)', lambda: normalize_names(names)),
+        ('NameMemo (warm, from disk)', lambda: NameMemo(warm_memo.previous).normalize_many(names)),
+    ]
+    rates = {}
+    for label, fn in cases:
+        best = min(_timed(fn) for _ in range(repeat))
+        rates[label] = len(names) / best if best else float('inf')
+    return rates
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and benchmark the name normalizer')
+    parser.add_argument('--count', type=int, default=200000, help='Synthetic names to generate (default 200000)')
+    parser.add_argument('--snapshot-path', help='Use the names in this cross-reference snapshot instead')
+    parser.add_argument('--repeat', type=int, default=3, help='Best of N timings (default 3)')
+    args = parser.parse_args()
+
+    names = snapshot_names(args.snapshot_path) if args.snapshot_path else synthetic_names(args.count)
+    print(f"{len(names)} names ({len(set(names))} unique)")
+
+    mismatches = [n for n in names if normalize_name(n) != normalize_name_reference(n)]
+    if mismatches:
+        print(f"MISMATCH on {len(mismatches)} names, e.g. {mismatches[:5]!r}")
+        return 1
+    print("Output identical to the reference implementation")
+
+    rates = benchmark(names, args.repeat)
+    baseline = rates['reference (regex + loop)']
+    for label, rate in rates.items():
+        print(f"  {label:28} {rate:>12,.0f} names/sec  ({rate / baseline:.1f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
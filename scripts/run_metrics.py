@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Per-phase metrics of a compute_cross_reference.py run.
+
+The job is split into phases (fetch_formd, match, publish, ...). Each phase
+records its wall and CPU time, the rows it handled, the HTTP requests,
+retries and (estimated) bytes counted while it ran, and its peak RSS:
+
+    metrics = RunMetrics()
+    with metrics.phase('fetch_formd') as phase:
+        ... metrics.count('http_requests') ...
+        phase.rows = len(filings)
+    metrics.finish()
+    metrics.write('.cross_reference_metrics')
+
+write() leaves two files: run_report.json (everything, for humans and the
+artifact of the weekly job) and cross_reference.prom (gauges in the
+Prometheus text format, for a node_exporter textfile collector).
+
+Counters are process-wide and thread-safe; a phase gets the increase over its
+lifetime, so work done on fetch threads is attributed to the phase that was
+running. Phases are sequential - a phase of a generator pipeline spans
+everything the consumer does in between too.
+
+profile_dir: run every phase under cProfile and tracemalloc and dump
+profile-<phase>.pstats (open with python -m pstats) plus a text summary with
+the top functions and allocation sites next to it. cProfile only sees the
+thread that runs the phase.
+"""
+
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+REPORT_FILE = 'run_report.json'
+PROMETHEUS_FILE = 'cross_reference.prom'
+PROMETHEUS_PREFIX = 'cross_reference'
+
+COUNTERS = ('http_requests', 'http_retries', 'http_bytes', 'rows_fetched', 'rows_written')
+
+
+def reset_peak_rss():
+    """Start a new peak-RSS window (Linux); elsewhere the peak is the process-wide maximum."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def rss_mb(field):
+    """VmRSS / VmHWM of this process in MB, or the ru_maxrss peak where /proc is missing."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def children_peak_rss_mb():
+    """Largest peak RSS of a finished child process (the match workers), in MB."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+class Phase:
+    """Measurements of one phase; code inside the phase sets rows."""
+
+    __slots__ = ('name', 'rows', 'seconds', 'cpu_seconds', 'rss_start_mb', 'peak_rss_mb', 'counters')
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.seconds = None
+        self.cpu_seconds = None
+        self.rss_start_mb = None
+        self.peak_rss_mb = None
+        self.counters = {}
+
+    def to_dict(self):
+        entry = {
+            'phase': self.name,
+            'seconds': round(self.seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'rows': self.rows,
+            'rows_per_second': round(self.rows / self.seconds, 1) if self.seconds else None,
+            'rss_start_mb': round(self.rss_start_mb, 1),
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+        }
+        entry.update((name, self.counters.get(name, 0)) for name in COUNTERS)
+        return entry
+
+
+class RunMetrics:
+    """Phases, counters and results of one run."""
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.started_at = datetime.utcnow()
+        self._start = time.perf_counter()
+        self.finished_at = None
+        self.seconds = None
+        self.status = 'running'
+        self.error = None
+        self.phases = []
+        self.counters = collections.Counter()
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def set(self, key, value):
+        """Attach a result to the report, e.g. set('match_methods', {'file_num': 1200, ...})."""
+        self.results[key] = value
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase = Phase(name)
+        with self._lock:
+            counters_start = dict(self.counters)
+        reset_peak_rss()
+        phase.rss_start_mb = rss_mb('VmRSS')
+        profiler = self._start_profile()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield phase
+        finally:
+            phase.seconds = time.perf_counter() - start
+            phase.cpu_seconds = time.process_time() - cpu_start
+            phase.peak_rss_mb = rss_mb('VmHWM')
+            with self._lock:
+                phase.counters = {key: value - counters_start.get(key, 0) for key, value in self.counters.items()}
+            if profiler is not None:
+                self._dump_profile(name, profiler)
+            self.phases.append(phase)
+
+    def _start_profile(self):
+        if not self.profile_dir:
+            return None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start(10)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _dump_profile(self, name, profiler):
+        profiler.disable()
+        allocations = tracemalloc.take_snapshot()
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, f'profile-{name}')
+        profiler.dump_stats(base + '.pstats')
+        summary = io.StringIO()
+        summary.write(f"Phase {name}\n\n== cProfile: top 40 by cumulative time ==\n")
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(40)
+        summary.write(f"== tracemalloc: peak traced {traced_peak / 2**20:.1f} MB; "
+                      f"largest live allocation sites at the end of the phase ==\n")
+        for stat in allocations.statistics('lineno')[:25]:
+            summary.write(f"{stat}\n")
+        with open(base + '.txt', 'w') as f:
+            f.write(summary.getvalue())
+
+    def finish(self, error=None):
+        self.finished_at = datetime.utcnow()
+        self.seconds = time.perf_counter() - self._start
+        self.status = 'failed' if error is not None else 'success'
+        self.error = None if error is None else f'{type(error).__name__}: {error}'
+
+    def report(self):
+        phases = [phase.to_dict() for phase in self.phases]
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self._start
+        children_peak = children_peak_rss_mb()
+        return {
+            'status': self.status,
+            'error': self.error,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'seconds': round(seconds, 3),
+            # Wall time outside any phase (state load/save, snapshot bookkeeping, ...)
+            'unattributed_seconds': round(seconds - sum(phase.seconds for phase in self.phases), 3),
+            'peak_rss_mb': max([phase['peak_rss_mb'] for phase in phases] + [round(rss_mb('VmHWM'), 1)]),
+            'children_peak_rss_mb': round(children_peak, 1) if children_peak else None,
+            'totals': {name: self.counters.get(name, 0) for name in COUNTERS},
+            'phases': phases,
+            'results': self.results,
+        }
+
+    def prometheus(self):
+        """The report as Prometheus text format gauges."""
+        report = self.report()
+        lines = []
+
+        def gauge(name, help_text, samples):
+            metric = f'{PROMETHEUS_PREFIX}_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} gauge')
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'{metric}{{{label_text}}} {value}' if label_text else f'{metric} {value}')
+
+        gauge('run_success', 'Whether the last run succeeded', [({}, int(report['status'] == 'success'))])
+        gauge('run_timestamp_seconds', 'When the last run finished (Unix time)', [({}, round(time.time()))])
+        gauge('run_duration_seconds', 'Wall time of the last run', [({}, report['seconds'])])
+        gauge('run_peak_rss_bytes', 'Peak RSS of the last run (main process)',
+              [({}, int(report['peak_rss_mb'] * 2**20))])
+        phase_gauges = (
+            ('seconds', 'Wall time'), ('cpu_seconds', 'CPU time'), ('rows', 'Rows handled'),
+            ('rows_per_second', 'Rows handled per second'), ('http_requests', 'HTTP requests'),
+            ('http_retries', 'Retried HTTP requests'), ('http_bytes', 'Estimated HTTP payload bytes'),
+        )
+        for field, help_text in phase_gauges:
+            gauge(f'phase_{field}', f'{help_text} per phase of the last run',
+                  [({'phase': phase['phase']}, phase[field]) for phase in report['phases']])
+        gauge('phase_peak_rss_bytes', 'Peak RSS per phase of the last run',
+              [({'phase': phase['phase']}, int(phase['peak_rss_mb'] * 2**20)) for phase in report['phases']])
+        for key, values in report['results'].items():
+            if isinstance(values, dict):
+                gauge(key, f'{key} of the last run',
+                      [({'kind': kind}, value) for kind, value in values.items() if isinstance(value, (int, float))])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory):
+        """Write the JSON report and the Prometheus textfile (atomically); returns their paths."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, text in ((REPORT_FILE, json.dumps(self.report(), indent=2) + '\n'),
+                           (PROMETHEUS_FILE, self.prometheus())):
+            path = os.path.join(directory, name)
+            # Collectors may read at any moment - never let them see a half-written file
+            with open(path + '.tmp', 'w') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+            paths.append(path)
+        return paths
@@ -0,0 +1,5 @@
+"""pytest setup for the Python pipeline checks: the modules under test live in scripts/."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scripts'))
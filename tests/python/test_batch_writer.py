@@ -0,0 +1,135 @@
+"""
+batch_writer - BatchWriter against a fake send(): bisection down to the bad
+rows, retries, whole-batch failures and exact counts. The reference for what
+gets written is the plain loop the old writer amounted to: every row whose
+own request would succeed.
+
+Run with: python -m pytest tests/python
+"""
+import logging
+import threading
+import time
+
+import pytest
+
+import batch_writer
+
+
+class APIError(Exception):
+    """Stand-in for postgrest.APIError: a message and a code."""
+
+    def __init__(self, code, message=''):
+        super().__init__(message or code)
+        self.code = code
+        self.message = message
+
+
+class FakeTable:
+    """send() for a BatchWriter: rejects any batch holding a bad row, like a constraint violation."""
+
+    def __init__(self, bad=(), code='23502', transient=0):
+        self.bad = set(bad)
+        self.code = code
+        self.transient = transient      # fail this many requests with a 503 first
+        self.rows = []
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def send(self, op, rows):
+        with self._lock:
+            self.requests += 1
+            if self.transient:
+                self.transient -= 1
+                raise APIError('503', 'unavailable')
+        if any(row['i'] in self.bad for row in rows):
+            raise APIError(self.code, 'null value in column "adv_fund_id"')
+        with self._lock:
+            self.rows.extend(row['i'] for row in rows)
+
+
+def write(table, count, **options):
+    options.setdefault('backoff', 0)
+    writer = batch_writer.BatchWriter(table.send, **options)
+    for i in range(count):
+        writer.add('insert', {'i': i, 'name': f'fund {i}'})
+    writer.close()
+    return writer
+
+
+def test_bisects_to_the_one_bad_row():
+    table = FakeTable(bad={137})
+    writer = write(table, 400, max_rows=400)
+    assert writer.batches == 1
+    assert sorted(table.rows) == [i for i in range(400) if i != 137]
+    assert writer.written == {'insert': 399}
+    assert [(op, row['i'], error.code) for op, row, error in writer.rejected] == [('insert', 137, '23502')]
+    assert writer.failed == 0 and writer.errors == []
+    # One failed request per level on the way down (log2 400 ~ 9), plus the halves that went through
+    assert table.requests <= 2 * 9 + 1
+
+
+@pytest.mark.parametrize('code', ['22P02', '23505', '413'])
+def test_row_level_errors_are_isolated(code):
+    bad = {0, 55, 56, 299}
+    table = FakeTable(bad=bad, code=code)
+    writer = write(table, 300, max_rows=64, workers=3)
+    assert sorted(table.rows) == [i for i in range(300) if i not in bad]
+    assert sorted(row['i'] for _, row, _ in writer.rejected) == sorted(bad)
+    assert writer.written['insert'] + len(writer.rejected) == 300
+
+
+def test_transient_errors_are_retried():
+    table = FakeTable(transient=3)
+    writer = write(table, 100, max_rows=50, workers=1, retries=4)
+    assert sorted(table.rows) == list(range(100))
+    assert writer.written == {'insert': 100} and writer.failed == 0
+
+
+def test_exhausted_retries_fail_the_batch():
+    table = FakeTable(transient=10 ** 6)
+    writer = write(table, 30, max_rows=10, workers=2, retries=2)
+    assert writer.written == {} and writer.rejected == []
+    assert writer.failed == 30
+    assert table.requests == 3 * 3     # 3 batches x (1 + 2 retries)
+
+
+def test_other_errors_fail_the_batch_without_bisecting():
+    table = FakeTable(bad={3}, code='PGRST204')
+    writer = write(table, 20, max_rows=10)
+    assert writer.failed == 10 and writer.written == {'insert': 10}
+    assert [error.code for error in writer.errors] == ['PGRST204']
+    assert table.requests == 2
+
+
+def test_batches_are_cut_by_payload_size():
+    sizes = []
+    writer = batch_writer.BatchWriter(lambda op, rows: sizes.append(len(rows)), max_bytes=1000)
+    row = {'i': 0, 'name': 'x' * 80}
+    for _ in range(100):
+        writer.add('insert', row)
+    writer.close()
+    per_batch = -(-1000 // batch_writer.row_bytes(row))
+    assert sum(sizes) == 100 and max(sizes) == per_batch
+
+
+def test_deletes_are_cut_by_id_count():
+    sizes = []
+    writer = batch_writer.BatchWriter(lambda op, rows: sizes.append((op, len(rows))))
+    for i in range(1234):
+        writer.add('delete', i)
+    writer.close()
+    assert sorted(sizes) == [('delete', 234), ('delete', 500), ('delete', 500)]
+
+
+def test_abort_drops_pending_batches_quietly(caplog):
+    def slow(op, rows):
+        time.sleep(0.05)
+    writer = batch_writer.BatchWriter(slow, workers=1, max_rows=1)
+    with caplog.at_level(logging.ERROR):
+        for i in range(2):
+            writer.add('insert', {'i': i})
+        writer.abort()
+    assert writer.written.get('insert', 0) < 2
+    assert writer.errors == []
+    assert not [record for record in caplog.records if 'CancelledError' in record.getMessage()
+                or record.exc_info]
@@ -0,0 +1,146 @@
+"""
+The direct Postgres backend (cross_reference_postgres: iter_copy_pages,
+PostgresClient, MatchLoader) against the FakeClient path, on the benchmark's
+synthetic tables.
+
+Needs a scratch database - the test (re)creates the source tables, the match
+tables and the migrations in its public schema:
+
+    XREF_TEST_DATABASE_URL=postgresql://localhost/xref_test python -m pytest tests/python
+"""
+import os
+
+import pytest
+
+DATABASE_URL = os.environ.get('XREF_TEST_DATABASE_URL')
+if not DATABASE_URL:
+    pytest.skip('set XREF_TEST_DATABASE_URL to a scratch Postgres database', allow_module_level=True)
+psycopg = pytest.importorskip('psycopg')
+
+import benchmark_cross_reference  # noqa: E402
+import compute_cross_reference as xref  # noqa: E402
+import cross_reference_fake as fake  # noqa: E402
+import cross_reference_sources as sources  # noqa: E402
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'migrations')
+
+GAV_COLUMNS = ''.join(f', gav_{year} DOUBLE PRECISION' for year in xref.GAV_YEARS)
+
+TABLES = {
+    'form_d_filings': '''
+        id BIGINT PRIMARY KEY, accessionnumber TEXT, entityname TEXT, filing_date DATE,
+        totalofferingamount BIGINT, totalamountsold BIGINT, sale_date DATE,
+        investmentfundtype TEXT, file_num TEXT''',
+    'funds_enriched': f'''
+        reference_id BIGINT PRIMARY KEY, fund_id TEXT, fund_name TEXT, form_d_file_number TEXT,
+        fund_type TEXT, adviser_entity_crd BIGINT, latest_gross_asset_value DOUBLE PRECISION,
+        updated_at TIMESTAMP{GAV_COLUMNS}''',
+    'advisers_enriched': '''
+        crd BIGINT PRIMARY KEY, adviser_name TEXT, primary_website TEXT, type TEXT,
+        total_aum BIGINT, aum_2025 BIGINT''',
+    # As it was before migrations/create_cross_reference_generations.sql
+    'cross_reference_matches': '''
+        id BIGSERIAL PRIMARY KEY, formd_accession TEXT, formd_entity_name TEXT, formd_filing_date DATE,
+        formd_offering_amount NUMERIC, adv_fund_id TEXT, adv_fund_name TEXT, adv_filing_date TIMESTAMP,
+        adv_gav NUMERIC, adviser_entity_crd BIGINT, adviser_entity_legal_name TEXT, match_score NUMERIC,
+        issues TEXT, overdue_adv_flag BOOLEAN, latest_adv_year INTEGER, computed_at TIMESTAMP''',
+}
+
+MIGRATION_FILES = ('create_cross_reference_generations.sql', 'add_cross_reference_match_method.sql',
+                   'chunk_cross_reference_generation_copy.sql')
+
+
+def reset_database(conn):
+    conn.execute('DROP VIEW IF EXISTS cross_reference_matches CASCADE')
+    for table in ('cross_reference_match_rows', 'cross_reference_generations', 'cross_reference_publish',
+                  *TABLES):
+        conn.execute(f'DROP TABLE IF EXISTS {table} CASCADE')
+    # The roles the migrations grant to (Supabase has them)
+    for role in ('anon', 'authenticated', 'service_role'):
+        conn.execute(f'DO $$ BEGIN CREATE ROLE {role}; EXCEPTION WHEN duplicate_object THEN NULL; END $$')
+
+
+@pytest.fixture(scope='module')
+def data():
+    return benchmark_cross_reference.SyntheticData(3000, seed=5)
+
+
+@pytest.fixture(scope='module')
+def database(data):
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        reset_database(conn)
+        for table, columns in TABLES.items():
+            conn.execute(f'CREATE TABLE {table} ({columns})')
+        for name in MIGRATION_FILES:
+            with open(os.path.join(MIGRATIONS, name)) as f:
+                conn.execute(f.read())
+        source = data.source()
+        for side, table in (('formd', 'form_d_filings'), ('adv', 'funds_enriched'), ('adv', 'advisers_enriched')):
+            rows = source.client(side).tables[table]
+            columns = list(rows.make_row(0))
+            with conn.cursor().copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for i in range(len(rows)):
+                    row = rows.make_row(i)
+                    copy.write_row([row[column] for column in columns])
+    yield DATABASE_URL
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        reset_database(conn)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(xref, 'MATCH_WORKERS', 1)
+    monkeypatch.setattr(xref, 'WRITE_WORKERS', 1)
+    monkeypatch.setattr(xref, 'FUZZY_THRESHOLD', None)
+    monkeypatch.setattr(xref, 'NAME_MEMO', None)
+
+    def use(source):
+        monkeypatch.setattr(xref, 'SOURCE', source)
+    return use
+
+
+def signatures(rows):
+    return sorted(xref.row_signature(row) for row in rows)
+
+
+def compute(source, pipeline):
+    pipeline(source)
+    return [match for _, match in sorted(xref.iter_matches(), key=lambda pair: pair[0])]
+
+
+def later_matches(matches):
+    """The next run's matches: some updated, some gone, some new."""
+    later = [dict(match) for match in matches if match['adv_fund_id'][-1] != '7']
+    for match in later[::25]:
+        match['issues'] = 'Hedge fund classification mismatch'
+    later.append(dict(matches[0], adv_fund_id='805-9999999999'))
+    return later
+
+
+def test_copy_pages_feed_the_same_matches(database, data, pipeline):
+    expected = compute(data.source(), pipeline)
+    found = compute(sources.PostgresSource(database, database), pipeline)
+    assert found
+    assert signatures(found) == signatures(expected)
+
+
+def test_merge_matches_serial_store(database, data, pipeline):
+    first = compute(data.source(), pipeline)
+    second = later_matches(first)
+
+    serial = fake.FakeFormDClient()
+    pipeline(sources.FakeSource(formd=serial))
+    for matches in (first, second, second):
+        xref.store_matches(matches)
+    expected = serial.table(xref.MATCH_VIEW).select('*').execute().data
+
+    pipeline(sources.PostgresSource(database, database))
+    for matches in (first, second, second):
+        xref.store_matches(matches)
+    client = xref.formd_client()
+    found = xref.fetch_all_keyset(client, xref.MATCH_VIEW, ','.join(['id'] + xref.MATCH_COLUMNS))
+    assert signatures(found) == signatures(expected)
+    assert signatures(found) == signatures(second)
+    # Both published two generations; the unchanged third run published none
+    publish = client.table('cross_reference_publish').select('active_generation').execute().data
+    assert publish[0]['active_generation'] == serial.active == 3
@@ -0,0 +1,83 @@
+"""
+cross_reference_service: index refreshes and the HTTP error handling.
+
+Run with: python -m pytest tests/python
+"""
+import http.client
+import json
+import threading
+
+import pytest
+
+import benchmark_cross_reference
+import compute_cross_reference as xref
+import cross_reference_fake as fake
+import cross_reference_service as service_module
+import formd_index
+
+
+@pytest.fixture
+def funds_table(monkeypatch):
+    """funds_enriched as a writable table, so a test can delete funds."""
+    data = benchmark_cross_reference.SyntheticData(3000, seed=11)
+    source = data.source()
+    table = fake.MemoryTable((data.fund(j) for j in range(data.fund_count)), 'reference_id')
+    source.client('adv').tables['funds_enriched'] = table
+    monkeypatch.setattr(xref, 'SOURCE', source)
+    monkeypatch.setattr(xref, 'MATCH_WORKERS', 1)
+    monkeypatch.setattr(xref, 'FUZZY_THRESHOLD', None)
+    monkeypatch.setattr(xref, 'NAME_MEMO', None)
+    return table
+
+
+def file_number_match(service):
+    """(key, fund, filing) of the first fund matched by file number."""
+    for key, fund in sorted(service.adv_funds.items()):
+        for file_num in xref.split_file_numbers(fund.get('form_d_file_number')):
+            filing = service.formd.latest_by_file_num(file_num)
+            if filing is not None:
+                return key, fund, filing
+
+
+def test_refresh_drops_deleted_funds(funds_table, tmp_path):
+    service = service_module.MatchService.load(str(tmp_path), 28)
+    key, fund, filing = file_number_match(service)
+    request = dict(zip(formd_index.FORMD_FIELDS, filing.to_list()))
+    assert fund.fund_id in {row['adv_fund_id'] for row in service.match(request)}
+
+    funds_table.delete([('eq', 'reference_id', int(key))])
+    changed = service.refresh()
+    assert changed['deleted_funds'] == 1
+    assert key not in service.adv_funds
+    assert fund.fund_id not in {row['adv_fund_id'] for row in service.match(request)}
+    assert service.health()['funds'] == len(funds_table)
+
+
+class FailingService:
+    def match_many(self, filings):
+        raise RuntimeError('index is gone')
+
+
+def post(server, body):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+    try:
+        connection.request('POST', '/match', body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_post_match_failure_is_a_500():
+    server = service_module.make_server(FailingService(), '127.0.0.1', 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        status, payload = post(server, json.dumps({'accessionnumber': 'x'}))
+        assert status == 500
+        assert 'index is gone' in payload['error']
+        # The server keeps answering
+        assert post(server, '{not json')[0] == 400
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,105 @@
+"""
+formd_index - FilingIndex ordering against a brute-force reference.
+
+For every key the reference is the plain list of its filings sorted by
+(filing_date, id), a filing without an id last on its day, ties on both in
+insertion order: latest() is its last entry, window() the entries whose day
+falls in the range.
+
+Run with: python -m pytest tests/python
+"""
+import random
+
+import pytest
+
+import formd_index
+
+
+def reference_order(rows):
+    """Positions of rows sorted the way FilingIndex keeps them."""
+    def key(position):
+        row = rows[position]
+        filing_id = row.get('id')
+        return (formd_index.date_ordinal(row.get('filing_date')),
+                formd_index.NO_ID if filing_id is None else filing_id, position)
+    return sorted(range(len(rows)), key=key)
+
+
+def build(rows, key='021-000001'):
+    index = formd_index.FormDIndex()
+    for row in rows:
+        index.add(row, key, None)
+    return index
+
+
+def test_latest_breaks_date_ties_by_id():
+    rows = [
+        {'id': 7, 'filing_date': '2024-05-01', 'accessionnumber': 'a'},
+        {'id': 3, 'filing_date': '2024-05-01', 'accessionnumber': 'b'},
+        {'id': 9, 'filing_date': '2024-04-30', 'accessionnumber': 'c'},
+    ]
+    index = build(rows)
+    assert index.latest_by_file_num('021-000001').accessionnumber == 'a'
+    assert index.by_file_num.positions('021-000001') == [2, 1, 0]
+
+
+def test_ids_beyond_32_bits_keep_date_order():
+    # Packed into one 64-bit key, the larger id spilled into the date bits and won
+    rows = [
+        {'id': 2 ** 40, 'filing_date': '2020-01-01', 'accessionnumber': 'old'},
+        {'id': 1, 'filing_date': '2024-01-01', 'accessionnumber': 'new'},
+    ]
+    assert build(rows).latest_by_file_num('021-000001').accessionnumber == 'new'
+
+
+def test_missing_id_is_latest_on_its_day():
+    rows = [
+        {'id': None, 'filing_date': '2024-01-01', 'accessionnumber': 'scraped'},
+        {'id': 50, 'filing_date': '2024-01-01', 'accessionnumber': 'stored'},
+        {'id': 60, 'filing_date': '2023-12-31', 'accessionnumber': 'earlier'},
+    ]
+    assert build(rows).latest_by_file_num('021-000001').accessionnumber == 'scraped'
+
+
+@pytest.mark.parametrize('filing_id', [-1, 2 ** 63])
+def test_out_of_range_id_raises(filing_id):
+    with pytest.raises(ValueError):
+        formd_index.sort_key({'id': filing_id, 'filing_date': '2024-01-01'})
+
+
+def test_window_is_inclusive_and_keeps_ties():
+    rows = [{'id': i, 'filing_date': date, 'accessionnumber': str(i)} for i, date in enumerate(
+        ['2024-01-01', '2024-01-02', '2024-01-02', '2024-01-03', None, '2024-01-02T10:00:00'])]
+    index = build(rows)
+    window = index.filings_in_window(index.by_file_num, '021-000001', '2024-01-02', '2024-01-02')
+    assert [filing.accessionnumber for filing in window] == ['1', '2', '5']
+    assert index.by_file_num.window('021-000001', end='2024-01-01') == [4, 0]
+    assert index.by_file_num.window('021-000001', start='2024-01-03') == [3]
+
+
+def test_single_filing_key():
+    index = build([{'id': 1, 'filing_date': '2024-01-01'}])
+    assert index.by_file_num.latest('021-000001') == 0
+    assert index.by_file_num.count('021-000001') == 1
+    assert index.by_file_num.window('021-000001', '2024-01-01', '2024-01-01') == [0]
+    assert index.by_file_num.window('021-000001', '2024-01-02') == []
+
+
+def test_random_against_reference():
+    rnd = random.Random(11)
+    dates = [None, 'bad', '2020-01-01', '2020-01-02', '2021-06-30T00:00:00', '2021-07-01']
+    for _ in range(300):
+        rows = [{'id': rnd.choice([None, rnd.randint(0, 4), rnd.randint(2 ** 32, 2 ** 40)]),
+                 'filing_date': rnd.choice(dates), 'accessionnumber': str(i)}
+                for i in range(rnd.randint(1, 25))]
+        index = build(rows)
+        expected = reference_order(rows)
+        assert index.by_file_num.positions('021-000001') == expected
+        assert index.by_file_num.latest('021-000001') == expected[-1]
+        start, end = sorted(rnd.sample(dates[2:], 2))
+        lo, hi = formd_index.date_ordinal(start), formd_index.date_ordinal(end)
+        assert index.by_file_num.window('021-000001', start, end) == \
+            [p for p in expected if lo <= formd_index.date_ordinal(rows[p]['filing_date']) <= hi]
+        # A saved and reloaded index keeps the same order
+        restored = formd_index.FormDIndex.from_state(index.to_state())
+        assert restored.by_file_num.positions('021-000001') == expected
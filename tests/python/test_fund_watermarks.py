@@ -0,0 +1,44 @@
+"""
+fetch_changed_funds() watermarks with TEXT reference_ids (funds_enriched) and
+with integer ones (the synthetic tables).
+
+Run with: python -m pytest tests/python
+"""
+import compute_cross_reference as xref
+
+
+def fund(reference_id, updated_at=None):
+    return {'reference_id': reference_id, 'fund_name': f'Fund {reference_id}', 'updated_at': updated_at}
+
+
+def changed(monkeypatch, watermarks, rows):
+    monkeypatch.setattr(xref, 'fetch_source_table', lambda *args, **kwargs: rows)
+    return xref.fetch_changed_funds(watermarks)
+
+
+def test_text_keys_past_the_initial_watermark(monkeypatch):
+    watermarks = {'funds_enriched': 0, 'funds_enriched_updated_at': None}
+    found = changed(monkeypatch, watermarks, [fund('abc'), fund('b12', '2026-05-01T00:00:00'), fund('ab')])
+    assert set(found) == {'abc', 'b12', 'ab'}
+    assert watermarks == {'funds_enriched': 'b12', 'funds_enriched_updated_at': '2026-05-01T00:00:00'}
+
+
+def test_text_keys_past_a_saved_watermark(monkeypatch):
+    watermarks = {'funds_enriched': 'b12', 'funds_enriched_updated_at': '2026-05-01T00:00:00'}
+    changed(monkeypatch, watermarks, [fund('a9', '2026-06-01T00:00:00'), fund('c1')])
+    assert watermarks['funds_enriched'] == 'c1'
+    assert watermarks['funds_enriched_updated_at'] == '2026-06-01T00:00:00'
+
+
+def test_integer_keys_compare_as_numbers(monkeypatch):
+    watermarks = {'funds_enriched': 0, 'funds_enriched_updated_at': None}
+    changed(monkeypatch, watermarks, [fund(9), fund(10)])
+    assert watermarks['funds_enriched'] == 10
+
+
+def test_advance_watermark():
+    assert xref.advance_watermark(0, []) == 0
+    assert xref.advance_watermark(None, ['x']) == 'x'
+    assert xref.advance_watermark(0, ['x', None]) == 'x'
+    assert xref.advance_watermark('m', ['b', 'z']) == 'z'
+    assert xref.advance_watermark(12, [3]) == 12
@@ -0,0 +1,111 @@
+"""
+match_enrichment - the vectorized build_match_rows() against the original
+per-row match dict of compute_matches(), copied below as it was.
+
+Run with: python -m pytest tests/python
+"""
+import random
+
+import match_enrichment
+
+
+def check_discrepancies(adv_fund, formd_filing):
+    """The pre-vectorization check_discrepancies()."""
+    issues = []
+    adv_type = (adv_fund.get('fund_type') or '').upper()
+    formd_type = (formd_filing.get('investmentfundtype') or '').upper()
+    if adv_type and formd_type:
+        if (('PRIVATE EQUITY' in adv_type and 'VENTURE' in formd_type) or
+                ('VENTURE' in adv_type and 'PRIVATE EQUITY' in formd_type)):
+            issues.append('Fund type mismatch: PE vs VC')
+        if (('HEDGE' in adv_type and 'HEDGE' not in formd_type) or
+                ('HEDGE' not in adv_type and 'HEDGE' in formd_type)):
+            issues.append('Hedge fund classification mismatch')
+    return issues
+
+
+def build_match_row(adv_fund, formd_filing, adviser_map, method, score, computed_at):
+    """The match dict compute_matches() built per matched fund."""
+    issues = check_discrepancies(adv_fund, formd_filing)
+    adviser = adviser_map.get(adv_fund.get('adviser_entity_crd'), {})
+    latest_year = None
+    for year in range(2025, 2010, -1):
+        if adv_fund.get(f'gav_{year}'):
+            latest_year = year
+            break
+    overdue = latest_year and latest_year < 2024
+    return {
+        'formd_accession': formd_filing.get('accessionnumber'),
+        'formd_entity_name': formd_filing.get('entityname'),
+        'formd_filing_date': formd_filing.get('filing_date'),
+        'formd_offering_amount': formd_filing.get('totalofferingamount'),
+        'adv_fund_id': adv_fund.get('fund_id'),
+        'adv_fund_name': adv_fund.get('fund_name'),
+        'adv_filing_date': adv_fund.get('updated_at'),
+        'adv_gav': adv_fund.get('latest_gross_asset_value'),
+        'adviser_entity_crd': adv_fund.get('adviser_entity_crd'),
+        'adviser_entity_legal_name': adviser.get('adviser_name'),
+        'match_score': score,
+        'match_method': method,
+        'issues': ' | '.join(issues) if issues else '',
+        'overdue_adv_flag': overdue,
+        'latest_adv_year': latest_year,
+        'computed_at': computed_at,
+    }
+
+
+FUND_TYPES = [None, '', 'Private Equity Fund', 'Venture Capital Fund', 'Hedge Fund', 'hedge fund',
+              'Other Private Fund', 'Private Equity / Venture', 'Real Estate Fund', 'Securitized Asset Fund']
+
+
+def random_matches(rnd, count, adviser_crds):
+    matches = []
+    for i in range(count):
+        fund = {
+            'fund_id': f'805-{i}', 'fund_name': f'Fund {i}', 'fund_type': rnd.choice(FUND_TYPES),
+            'adviser_entity_crd': rnd.choice(adviser_crds), 'latest_gross_asset_value': rnd.randint(0, 10 ** 9),
+            'updated_at': '2026-01-01T00:00:00',
+        }
+        for year in match_enrichment.GAV_YEARS:
+            if rnd.random() < 0.2:
+                fund[f'gav_{year}'] = rnd.choice([0, None, rnd.randint(1, 10 ** 8)])
+        filing = {
+            'accessionnumber': f'000{i}', 'entityname': f'FUND {i}', 'filing_date': '2024-01-01',
+            'totalofferingamount': rnd.randint(0, 10 ** 7), 'investmentfundtype': rnd.choice(FUND_TYPES),
+        }
+        method, score = rnd.choice([('file_num', 1.0), ('name', 1.0), ('fuzzy', rnd.random())])
+        matches.append((fund, filing, method, score))
+    return matches
+
+
+def test_build_match_rows_matches_per_row_reference():
+    rnd = random.Random(3)
+    adviser_map = {crd: {'adviser_name': f'Adviser {crd}'} for crd in range(1, 40)}
+    matches = random_matches(rnd, 3000, list(range(1, 50)) + [None])
+    computed_at = '2026-10-17T00:00:00'
+    expected = [build_match_row(fund, filing, adviser_map, method, score, computed_at)
+                for fund, filing, method, score in matches]
+    rows = match_enrichment.build_match_rows(matches, adviser_map, computed_at)
+    assert rows == expected
+    # Plain Python values, not NumPy scalars - the rows go to json.dumps
+    assert {type(row['latest_adv_year']) for row in rows} <= {int, type(None)}
+    assert {type(row['overdue_adv_flag']) for row in rows} <= {bool, type(None)}
+    assert {type(row['issues']) for row in rows} == {str}
+
+
+def test_gav_mask_and_string_keyed_advisers():
+    # Incremental state: funds carry a precomputed gav_mask, the adviser map is keyed by str(crd)
+    rnd = random.Random(5)
+    adviser_map = {crd: {'adviser_name': f'Adviser {crd}'} for crd in range(1, 10)}
+    matches = random_matches(rnd, 500, list(range(1, 12)))
+    expected = [build_match_row(fund, filing, adviser_map, method, score, 'now')
+                for fund, filing, method, score in matches]
+    masked = [(dict(fund, gav_mask=match_enrichment.gav_year_mask(fund)), filing, method, score)
+              for fund, filing, method, score in matches]
+    by_str = {str(crd): adviser for crd, adviser in adviser_map.items()}
+    rows = match_enrichment.build_match_rows(masked, by_str, 'now', adviser_key=str)
+    assert rows == expected
+
+
+def test_empty_batch():
+    assert match_enrichment.build_match_rows([], {}, 'now') == []
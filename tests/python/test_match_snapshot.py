@@ -0,0 +1,71 @@
+"""
+iter_matches() with a snapshot_path: a run that stops early - in any phase -
+keeps the previous snapshot and leaves no staging tables behind.
+
+Run with: python -m pytest tests/python
+"""
+import sqlite3
+
+import pytest
+
+import benchmark_cross_reference
+import compute_cross_reference as xref
+import cross_reference_snapshot as snapshot
+
+
+@pytest.fixture
+def saved(monkeypatch, tmp_path):
+    """Path of a snapshot saved by a complete run, and that run's funds_enriched rows."""
+    monkeypatch.setattr(xref, 'SOURCE', benchmark_cross_reference.SyntheticData(2000, seed=3).source())
+    monkeypatch.setattr(xref, 'MATCH_WORKERS', 1)
+    monkeypatch.setattr(xref, 'FUZZY_THRESHOLD', None)
+    monkeypatch.setattr(xref, 'NAME_MEMO', None)
+    path = str(tmp_path / 'snapshot.db')
+    assert list(xref.iter_matches(snapshot_path=path))
+    return path, snapshot.load_table(path, 'funds_enriched')
+
+
+def tables(path):
+    with sqlite3.connect(path) as conn:
+        return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def failing_pages(table):
+    """iter_source_pages() that raises after the first page of table."""
+    iter_source_pages = xref.iter_source_pages
+
+    def pages(side, name, *args, **kwargs):
+        for i, page in enumerate(iter_source_pages(side, name, *args, **kwargs)):
+            if name == table and i == 1:
+                raise xref.FetchError(f'{name} failed mid-stream')
+            yield page
+    return pages
+
+
+def failing_advisers(side, table, *args, **kwargs):
+    raise xref.FetchError(f'{table} failed')
+
+
+@pytest.mark.parametrize('patch', [
+    ('iter_source_pages', failing_pages('form_d_filings')),
+    ('fetch_source_table', failing_advisers),
+    ('iter_source_pages', failing_pages('funds_enriched')),
+], ids=['formd_pages', 'advisers', 'fund_pages'])
+def test_failed_run_keeps_the_snapshot(saved, monkeypatch, patch):
+    path, funds = saved
+    before = tables(path)
+    monkeypatch.setattr(xref, *patch)
+    with pytest.raises(xref.FetchError):
+        list(xref.iter_matches(snapshot_path=path))
+    assert tables(path) == before
+    assert snapshot.load_table(path, 'funds_enriched') == funds
+
+
+def test_abandoned_run_keeps_the_snapshot(saved):
+    path, funds = saved
+    before = tables(path)
+    matches = xref.iter_matches(snapshot_path=path)
+    next(matches)
+    matches.close()
+    assert tables(path) == before
+    assert snapshot.load_table(path, 'funds_enriched') == funds
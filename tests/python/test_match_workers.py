@@ -0,0 +1,37 @@
+"""
+iter_matches() with a process pool (MATCH_WORKERS > 1) against the serial
+run, on the benchmark's synthetic tables served by FakeClient.
+
+Run with: python -m pytest tests/python
+"""
+import pytest
+
+import benchmark_cross_reference
+import compute_cross_reference as xref
+import name_normalizer
+
+
+def run_matches(monkeypatch, workers, fuzzy_threshold=None):
+    data = benchmark_cross_reference.SyntheticData(3000, seed=3)
+    monkeypatch.setattr(xref, 'SOURCE', data.source())
+    monkeypatch.setattr(xref, 'MATCH_WORKERS', workers)
+    monkeypatch.setattr(xref, 'FUZZY_THRESHOLD', fuzzy_threshold)
+    monkeypatch.setattr(xref, 'NAME_MEMO', name_normalizer.NameMemo())
+    state = {}
+    pairs = list(xref.iter_matches(state))
+    # Pages arrive in fetch order, which the parallel fetch does not fix - compare
+    # by reference_id (as compute_matches() does). computed_at is the time of the run.
+    rows = sorted(((ref, {**row, 'computed_at': None}) for ref, row in pairs), key=lambda pair: pair[0])
+    return rows, xref.NAME_MEMO, state
+
+
+@pytest.mark.parametrize('fuzzy_threshold', [None, 0.85])
+def test_workers_match_serial_run(monkeypatch, fuzzy_threshold):
+    serial, serial_memo, serial_state = run_matches(monkeypatch, 1, fuzzy_threshold)
+    parallel, parallel_memo, parallel_state = run_matches(monkeypatch, 2, fuzzy_threshold)
+    assert serial
+    assert parallel == serial
+    assert parallel_state['watermarks'] == serial_state['watermarks']
+    # The names the workers normalized come back to this process's memo
+    assert parallel_memo.current == serial_memo.current
+    assert parallel_memo.misses == serial_memo.misses
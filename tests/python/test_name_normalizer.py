@@ -0,0 +1,78 @@
+"""
+name_normalizer - the single-pass normalizer against the original regex version.
+
+The reference below is the normalize_name_for_match() that shipped before the
+rewrite, copied as it was (including its own suffix list), so a change to
+name_normalizer.SUFFIX_WORDS shows up here too.
+
+Run with: python -m pytest tests/python
+"""
+import re
+
+import pytest
+
+import name_normalizer
+
+CORPUS = [
+    None, '', '   ', 'LP', 'L.P.', 'Fund', 'Tiger Fund', 'TIGER FUND', 'tiger   fund\t',
+    'Tiger Fund, L.P.', 'Tiger Fund,L.P.', 'TIGER FUND L P', 'Tiger Fund L.L.C.', 'Tiger Fund LP LLC',
+    'Tiger Fund, Ltd. Co.', 'Tiger Fund Co', 'Tiger Fund Corp.', 'Tiger Fund Corporation',
+    'Tiger Fund Company', 'Tiger Fund Limited', 'Tiger Fund Inc', 'Tiger Fund, Inc.', 'Tiger Fund INC.',
+    'Tiger Fund (Cayman) Ltd', "O'Neil Capital Partners II, L.P.", 'A/B Credit Opportunity Fund-LP',
+    'Founders Fund LLC', 'Founders Fund', 'FOUNDERS FUND IV, LP', 'Co', 'Co Co', 'LP LP', 'L L C',
+    'Fund L', 'Fund P', 'Fund L P P', 'Fund LLCC', 'Fund XLP', 'Company Fund', 'Limited Partners Fund LP',
+    '"Quoted" Fund, L.P.', 'Fund (A) L.P.', 'Fund - Series 1 - LLC', 'Fund/Offshore Ltd.',
+    'Real Estate Fund S.A.', 'Fund LP', 'fonds d’investissement l.p.', 12345, 'Master Fund L.P. LLC Inc.',
+]
+
+
+def normalize_name_for_match(name):
+    """The pre-rewrite normalize_name_for_match()."""
+    if not name:
+        return ''
+    normalized = str(name).upper()
+    normalized = re.sub(r'[,.\'"()\-/]', ' ', normalized)
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    suffix_words = ['LLC', 'LP', 'L P', 'L L C', 'INC', 'LTD', 'CO', 'CORP', 'CORPORATION', 'COMPANY', 'LIMITED']
+    changed = True
+    while changed:
+        changed = False
+        for suffix in suffix_words:
+            if normalized.endswith(' ' + suffix):
+                normalized = normalized[:-len(suffix)-1].strip()
+                changed = True
+                break
+    return normalized
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return CORPUS + name_normalizer.synthetic_names(5000, seed=7)
+
+
+def test_normalize_name_matches_reference(corpus):
+    assert [name_normalizer.normalize_name(name) for name in corpus] == \
+        [normalize_name_for_match(name) for name in corpus]
+
+
+def test_normalize_names_matches_reference(corpus):
+    assert name_normalizer.normalize_names(corpus) == [normalize_name_for_match(name) for name in corpus]
+
+
+def test_known_outputs():
+    assert name_normalizer.normalize_name('Tiger Fund, L.P.') == 'TIGER FUND'
+    assert name_normalizer.normalize_name('Tiger Fund LP LLC') == 'TIGER FUND'
+    assert name_normalizer.normalize_name('Tiger Fund, Ltd. Co.') == 'TIGER FUND'
+    # The first token is never stripped, suffix or not
+    assert name_normalizer.normalize_name('LP LP') == 'LP'
+    assert name_normalizer.normalize_name('Fund XLP') == 'FUND XLP'
+
+
+def test_memo_matches_reference(tmp_path):
+    names = [name for name in CORPUS if name]
+    memo = name_normalizer.NameMemo()
+    assert memo.normalize_many(names) == [normalize_name_for_match(name) for name in names]
+    path = str(tmp_path / 'memo.json.gz')
+    memo.save(path)
+    loaded = name_normalizer.NameMemo.load(path)
+    assert [loaded.normalize(name) for name in names] == [normalize_name_for_match(name) for name in names]
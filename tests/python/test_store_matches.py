@@ -0,0 +1,76 @@
+"""
+store_matches() against FakeFormDClient: what each run publishes, and that a
+run without changes publishes nothing.
+
+Run with: python -m pytest tests/python
+"""
+import pytest
+
+import compute_cross_reference as xref
+import cross_reference_fake as fake
+import cross_reference_sources as sources
+
+
+def match(fund, accession, score=1.0, issues=''):
+    row = {column: None for column in xref.MATCH_COLUMNS}
+    row.update({
+        'adv_fund_id': f'805-{fund:04d}', 'formd_accession': f'0000-{accession:04d}',
+        'adv_fund_name': f'Fund {fund}', 'match_score': score, 'match_method': 'name',
+        'issues': issues, 'computed_at': '2026-10-01T00:00:00',
+    })
+    return row
+
+
+def published(client):
+    """The rows readers see, without the columns a run may change freely."""
+    rows = client.table(xref.MATCH_VIEW).select('*').execute().data
+    return sorted(xref.row_signature(row) for row in rows)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fake.FakeFormDClient()
+    monkeypatch.setattr(xref, 'SOURCE', sources.FakeSource(formd=client))
+    return client
+
+
+def initial_matches():
+    # Fund 3 has two matches for the same filing (a key with two rows)
+    return [match(fund, fund) for fund in range(1, 200)] + [match(3, 3, score=0.5)]
+
+
+def test_unchanged_run_publishes_nothing(client, capsys):
+    xref.store_matches(initial_matches())
+    assert client.active == 2
+
+    xref.store_matches(initial_matches())
+    # No generation was begun (let alone copied or published)
+    assert client.generations == {1: 'previous', 2: 'active'}
+    assert 'No changes' in capsys.readouterr().out
+
+
+def test_changed_run_publishes_the_new_rows(client):
+    xref.store_matches(initial_matches())
+    matches = initial_matches()
+    matches[3] = match(4, 4, issues='Fund type mismatch: PE vs VC')   # update
+    del matches[10]                                                     # delete
+    matches.append(match(500, 500))                                     # insert
+    matches[-2] = match(3, 3, score=0.25)                               # update one row of a shared key
+
+    xref.store_matches(matches)
+    assert client.active == 3
+    assert published(client) == sorted(xref.row_signature(row) for row in matches)
+    # Generation 2 is untouched and can be rolled back to
+    assert client.previous == 2
+    rows = client.tables[xref.MATCH_ROWS_TABLE].rows.values()
+    assert (sorted(xref.row_signature(row) for row in rows if row['generation'] == 2)
+            == sorted(xref.row_signature(row) for row in initial_matches()))
+
+
+def test_only_deletes_still_publish(client):
+    xref.store_matches(initial_matches())
+    matches = initial_matches()[5:]
+
+    xref.store_matches(matches)
+    assert client.active == 3
+    assert published(client) == sorted(xref.row_signature(row) for row in matches)